@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Batch PR Fetcher - Prepare many PR workspaces from a manifest in parallel.
+
+This script:
+1. Reads a manifest (YAML or JSONL) of repo + PR + output directory entries
+2. Warms one shared bare mirror per repository and fetches all of its PR refs at once
+3. Prepares every workspace in a bounded process pool, cloning from the mirrors
+4. Paces API requests with one token bucket shared by all worker processes
+   (<report>.ratelimit.json) and holds back new items while the quota runs low
+5. Writes a per-item status report
+
+Manifest entries (YAML list or one JSON object per line):
+    {"repo": "apache/airflow", "pr": 58365, "output_dir": "pr_workspace_apache", "sparse": false}
+
+Usage:
+    python3 batch_pr_fetcher.py --manifest prs.yaml --workers 8
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+
+from enhanced_pr_fetcher import DEFAULT_MIRROR_CACHE_DIR, EnhancedGitHubPRFetcher
+from github_api_client import DEFAULT_HTTP_CACHE_DIR, GitHubAPIClient, RateLimitScheduler
+
+# API calls per workspace: PR info, plus diff and files pages when local derivation falls back
+API_CALLS_PER_ITEM = 3
+
+
+def load_manifest(manifest_path, output_root):
+    """Load and normalize manifest entries."""
+    manifest_path = Path(manifest_path)
+    text = manifest_path.read_text()
+
+    if manifest_path.suffix in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise Exception("PyYAML is required for YAML manifests (pip install pyyaml)")
+        data = yaml.safe_load(text) or []
+        if isinstance(data, dict):
+            data = data.get('items', [])
+    elif manifest_path.suffix == '.json':
+        data = json.loads(text)
+    else:
+        data = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    items = []
+    for index, entry in enumerate(data):
+        if 'repo' not in entry or 'pr' not in entry:
+            raise Exception(f"Manifest entry {index} needs 'repo' and 'pr': {entry}")
+        repo = entry['repo'].replace('https://github.com/', '').rstrip('/')
+        owner, repo_name = repo.split('/')
+        items.append({
+            'id': f"{repo}#{entry['pr']}",
+            'repo': repo,
+            'pr': int(entry['pr']),
+            'output_dir': str(entry.get('output_dir') or Path(output_root) / f"pr_workspace_{owner}_{repo_name}_{entry['pr']}"),
+            'sparse': bool(entry.get('sparse', False)),
+            'sparse_include': entry.get('sparse_include', [])
+        })
+    return items
+
+
+def warm_mirrors(items, mirror_cache, api_client, offline=False):
+    """Create/refresh one mirror per repository and fetch all its PR refs in one negotiation."""
+    by_repo = OrderedDict()
+    for item in items:
+        by_repo.setdefault(item['repo'], []).append(item['pr'])
+
+    def warm(repo, pr_numbers):
+        fetcher = EnhancedGitHubPRFetcher(repo, pr_numbers[0], mirror_cache, mirror_cache=mirror_cache,
+                                          api_client=api_client, offline=offline)
+        fetcher.ensure_mirror()
+        if not offline:
+            fetcher.fetch_prs_into_mirror(pr_numbers)
+        return repo
+
+    print(f"🪞 Warming mirrors for {len(by_repo)} repositories...")
+    failed = {}
+    with ThreadPoolExecutor(max_workers=min(len(by_repo), 4) or 1) as pool:
+        futures = {pool.submit(warm, repo, prs): repo for repo, prs in by_repo.items()}
+        for future in futures:
+            repo = futures[future]
+            try:
+                future.result()
+                print(f"✅ Mirror ready: {repo} ({len(by_repo[repo])} PRs)")
+            except Exception as e:
+                print(f"❌ Mirror failed for {repo}: {e}")
+                failed[repo] = str(e)
+    return failed
+
+
+def prepare_item(item, options):
+    """Prepare one workspace (runs in a worker process, logging to <output_dir>/fetch.log)."""
+    output_dir = Path(item['output_dir'])
+    output_dir.mkdir(parents=True, exist_ok=True)
+    log_path = output_dir / "fetch.log"
+    start_time = time.time()
+    result = {'id': item['id'], 'repo': item['repo'], 'pr': item['pr'], 'output_dir': str(output_dir),
+              'log': str(log_path)}
+
+    with open(log_path, 'w') as log, redirect_stdout(log), redirect_stderr(log):
+        # All workers draw from one token bucket kept in the batch's rate-limit state file
+        scheduler = RateLimitScheduler(state_file=options['rate_limit_state'])
+        api_client = GitHubAPIClient(api_root=options['api_base'], cache_dir=options['http_cache'],
+                                     scheduler=scheduler)
+        try:
+            fetcher = EnhancedGitHubPRFetcher(
+                item['repo'], item['pr'], output_dir,
+                mirror_cache=options['mirror_cache'], sparse=item['sparse'], api_client=api_client,
+                offline=options['offline'], refresh_mirror=False
+            )
+            fetcher.prepare_workspace(item['sparse_include'])
+            result['status'] = 'ok'
+            result['git_phase_stats'] = fetcher.git_phase_stats
+        except Exception as e:
+            traceback.print_exc()
+            result['status'] = 'failed'
+            result['error'] = str(e)
+        finally:
+            api_client.close()
+
+    result['duration'] = round(time.time() - start_time, 2)
+    return result
+
+
+class RateLimitBudget:
+    """Keeps dispatch from promising more API calls than the quota has left.
+
+    Pacing requests and waiting for the reset are the job of the workers' shared
+    RateLimitScheduler; the budget only holds back new items while the calls owed
+    to items in flight would cut into the reserve, a fraction of the reported limit.
+    """
+
+    def __init__(self, api_client, state_file, reserve_fraction=0.05):
+        self.api_client = api_client
+        self.state_file = Path(state_file)
+        self.reserve_fraction = reserve_fraction
+        self.remaining = None
+        self.reserve = 0
+        self.refresh()
+
+    def refresh(self):
+        limit = self.api_client.get_rate_limit()
+        if limit and limit['limit']:
+            self.remaining = limit['remaining']
+            self.reserve = math.ceil(limit['limit'] * self.reserve_fraction)
+            print(f"📊 API rate limit: {self.remaining}/{limit['limit']} remaining (reserve {self.reserve})")
+
+    def _observed_remaining(self):
+        """Remaining quota from the workers' latest response headers, if any yet."""
+        try:
+            state = json.loads(self.state_file.read_text() or '{}')
+        except (OSError, ValueError):
+            return self.remaining
+        return self.remaining if state.get('remaining') is None else state['remaining']
+
+    def can_dispatch(self, cost, in_flight):
+        """Whether another item of `cost` calls fits next to `in_flight` running items."""
+        if self.remaining is None or not in_flight:
+            # Unknown limit, or nothing running: the scheduler paces (or pauses) the item itself
+            return True
+        return self._observed_remaining() - cost * (in_flight + 1) >= self.reserve
+
+
+def write_status(status_file, result):
+    """Append one item result to the streaming status file."""
+    with open(status_file, 'a') as f:
+        f.write(json.dumps(result) + '\n')
+
+
+def run_batch(items, options, workers, report_path):
+    """Prepare all items with a bounded process pool and write the status report."""
+    report_path = Path(report_path)
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    status_file = report_path.with_suffix('.jsonl')
+    status_file.write_text('')
+    options = dict(options, rate_limit_state=str(report_path.with_suffix('.ratelimit.json')))
+    Path(options['rate_limit_state']).write_text('')
+
+    # The parent's client only warms mirrors and polls the rate limit; workers have their own
+    api_client = GitHubAPIClient(api_root=options['api_base'])
+    try:
+        return _run_batch(items, options, workers, report_path, status_file, api_client)
+    finally:
+        api_client.close()
+
+
+def _run_batch(items, options, workers, report_path, status_file, api_client):
+    results = []
+    batch_start = time.time()
+
+    failed_repos = {}
+    if options['mirror_cache']:
+        failed_repos = warm_mirrors(items, options['mirror_cache'], api_client, options['offline'])
+    budget = None if options['offline'] else RateLimitBudget(api_client, options['rate_limit_state'])
+
+    pending = []
+    for item in items:
+        if item['repo'] in failed_repos:
+            result = {'id': item['id'], 'repo': item['repo'], 'pr': item['pr'], 'output_dir': item['output_dir'],
+                      'status': 'failed', 'error': f"mirror: {failed_repos[item['repo']]}", 'duration': 0}
+            results.append(result)
+            write_status(status_file, result)
+        else:
+            pending.append(item)
+
+    print(f"🚀 Preparing {len(pending)} workspaces with {workers} workers...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        queue = list(pending)
+        while queue or in_flight:
+            # Keep at most `workers` items in flight, and fewer once the API quota runs low
+            while queue and len(in_flight) < workers:
+                if budget and not budget.can_dispatch(API_CALLS_PER_ITEM, len(in_flight)):
+                    break
+                item = queue.pop(0)
+                in_flight[pool.submit(prepare_item, item, options)] = item
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'id': item['id'], 'repo': item['repo'], 'pr': item['pr'],
+                              'output_dir': item['output_dir'], 'status': 'failed', 'error': str(e), 'duration': 0}
+                results.append(result)
+                write_status(status_file, result)
+                icon = '✅' if result['status'] == 'ok' else '❌'
+                detail = f" - {result['error']}" if result.get('error') else ""
+                print(f"{icon} [{len(results)}/{len(items)}] {result['id']} ({result['duration']:.1f}s){detail}")
+
+    succeeded = sum(1 for r in results if r['status'] == 'ok')
+    order = {item['id']: index for index, item in enumerate(items)}
+    report = {
+        'total': len(items),
+        'succeeded': succeeded,
+        'failed': len(items) - succeeded,
+        'duration': round(time.time() - batch_start, 2),
+        'items': sorted(results, key=lambda r: order[r['id']])
+    }
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    return report
+
+
+def main():
+    """Main function to prepare PR workspaces from a manifest."""
+    parser = argparse.ArgumentParser(description="Prepare many PR workspaces from a manifest in parallel")
+    parser.add_argument("--manifest", required=True,
+                       help="Manifest of PRs (.yaml/.yml list, .json array or .jsonl)")
+    parser.add_argument("--workers", type=int, default=4,
+                       help="Number of workspaces prepared in parallel")
+    parser.add_argument("--output-root", default="pr_batch",
+                       help="Parent directory for workspaces without an explicit output_dir")
+    parser.add_argument("--mirror-cache", default=str(DEFAULT_MIRROR_CACHE_DIR),
+                       help="Directory holding shared bare mirrors (one clone per repo)")
+    parser.add_argument("--report", default=None,
+                       help="Status report path (default: <output-root>/batch_report.json)")
+    parser.add_argument("--api-base",
+                       help="GitHub API root (default: https://api.github.com or $GITHUB_API_URL)")
+    parser.add_argument("--http-cache", default=str(DEFAULT_HTTP_CACHE_DIR),
+                       help="Directory for the conditional-request (ETag) cache of API responses")
+    parser.add_argument("--offline", action="store_true",
+                       help="No network access: prepare everything from the mirrors")
+
+    args = parser.parse_args()
+
+    try:
+        items = load_manifest(args.manifest, args.output_root)
+        print(f"📋 Loaded {len(items)} PRs from {args.manifest}")
+
+        options = {
+            'mirror_cache': args.mirror_cache,
+            'api_base': args.api_base,
+            'http_cache': args.http_cache,
+            'offline': args.offline
+        }
+        report_path = args.report or Path(args.output_root) / "batch_report.json"
+        report = run_batch(items, options, max(args.workers, 1), report_path)
+
+        print(f"\n🎯 BATCH COMPLETED")
+        print("=" * 40)
+        print(f"✅ Succeeded: {report['succeeded']}/{report['total']}")
+        print(f"❌ Failed: {report['failed']}")
+        print(f"⏱️  Total time: {report['duration']:.1f}s")
+        print(f"📄 Report: {report_path}")
+
+        return 0 if report['failed'] == 0 else 1
+
+    except Exception as e:
+        print(f"❌ Error running batch: {e}")
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Blob Index - Incremental on-disk index of a repository with one document per git blob.
+
+The code search (trigram) and related-files (BM25) indexes share this machinery:
+1. index.json - indexed commit, blob table and path -> document map
+2. seg_NNNN.bin - immutable segments written by the subclass
+3. update() indexes only the blobs that are new since the last run, from the
+   checked-out files or straight from a commit's tree (`git cat-file --batch`,
+   parsed in a process pool), and compacts once too many documents are stale
+
+Subclasses define how a blob becomes a document and how segments are stored;
+queries stay in their own modules.
+"""
+
+import json
+import os
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from git_blobs import BlobReader, list_tree_blobs, resolve_commit
+
+SEGMENT_DOCS = 4000
+# Blobs sent to a worker process at a time when indexing from the object store
+BLOB_BATCH = 256
+MAX_FILE_BYTES = 1024 * 1024
+COMPACT_DEAD_RATIO = 0.5
+
+
+def list_repo_blobs(repo_dir):
+    """{path: blob sha} of regular files in the repository's index (what is checked out)."""
+    output = subprocess.run(["git", "ls-files", "-s", "-z"], cwd=repo_dir, capture_output=True,
+                            check=True).stdout
+    blobs = {}
+    for record in output.split(b'\0'):
+        if not record:
+            continue
+        info, path = record.split(b'\t', 1)
+        mode, sha, _stage = info.split(b' ')
+        # Regular files only: no symlinks (120000) or submodules (160000)
+        if mode in (b'100644', b'100755'):
+            blobs[path.decode('utf-8', errors='surrogateescape')] = sha.decode()
+    return blobs
+
+
+def read_file_prefix(path):
+    """Up to MAX_FILE_BYTES + 1 bytes of a checked-out file (None if unreadable)."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(MAX_FILE_BYTES + 1)
+    except OSError:
+        return None
+
+
+class BlobDocumentIndex:
+    """Index over one repository checkout (or one commit's tree), stored under index_dir.
+
+    Subclasses set DIR_NAME, VERSION, NAME, ICON, SCRIPT and segment_class, and provide:
+    file_worker(path) / batch_worker(blobs) - picklable functions turning file or blob
+    contents into a document (None to skip the blob), _add_document() and _write_segment().
+    """
+
+    DIR_NAME = None
+    VERSION = 1
+    NAME = "index"
+    ICON = "🔎"
+    SCRIPT = None
+    segment_class = None
+    file_worker = None
+    batch_worker = None
+
+    def __init__(self, index_dir, repo_dir=None):
+        self.index_dir = Path(index_dir)
+        self.state = self._load_state()
+        self.repo_dir = Path(repo_dir) if repo_dir else self.index_dir.parent / self.state.get('repo_dir', '')
+        self._segments = None
+        self._reader = None
+
+    @classmethod
+    def open_workspace(cls, workspace_dir):
+        """Open the index stored in a PR workspace."""
+        index_dir = Path(workspace_dir) / cls.DIR_NAME
+        if not (index_dir / "index.json").exists():
+            raise Exception(f"No {cls.NAME} in {workspace_dir} (run: {cls.SCRIPT} build {workspace_dir})")
+        return cls(index_dir)
+
+    def _empty_state(self):
+        return {'version': self.VERSION, 'blobs': [], 'paths': {}, 'segments': [], 'next_segment': 0, 'skipped': []}
+
+    def _load_state(self):
+        try:
+            with open(self.index_dir / "index.json") as f:
+                state = json.load(f)
+            if state.get('version') == self.VERSION:
+                return state
+        except (OSError, ValueError):
+            pass
+        return self._empty_state()
+
+    def _save_state(self):
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_dir / "index.json.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, separators=(',', ':'))
+        os.replace(tmp_path, self.index_dir / "index.json")
+
+    def _add_document(self, document):
+        """Record a new document in the state; returns what its segment stores for it."""
+        raise NotImplementedError
+
+    def _write_segment(self, path, documents):
+        raise NotImplementedError
+
+    def update(self, workers=None, commit=None):
+        """Bring the index in line with the current checkout, indexing only new blobs.
+
+        With `commit`, index that commit's tree instead, reading blobs from the
+        repository's object store (repo_dir may be a bare mirror).
+        """
+        start_time = time.time()
+        self.close()
+        sizes = {}
+        if commit:
+            commit = resolve_commit(self.repo_dir, commit)
+            tree = list_tree_blobs(self.repo_dir, commit)
+            current = {path: sha for path, (sha, _size) in tree.items()}
+            sizes = {sha: size for sha, size in tree.values()}
+        else:
+            current = list_repo_blobs(self.repo_dir)
+
+        blob_ids = {sha: doc_id for doc_id, sha in enumerate(self.state['blobs'])}
+        live_docs = set(self.state['paths'].values())
+        dead = len(self.state['blobs']) - len(live_docs)
+        if self.state['blobs'] and dead / len(self.state['blobs']) > COMPACT_DEAD_RATIO:
+            print(f"  🧹 Compacting {self.NAME} ({dead} stale documents)")
+            for name in self.state['segments']:
+                (self.index_dir / name).unlink(missing_ok=True)
+            self.state.update(self._empty_state())
+            blob_ids = {}
+
+        # Paths whose blob is not indexed yet (new or changed files); binary/huge blobs are remembered
+        skipped = set(self.state['skipped'])
+        pending = {}
+        for path, sha in current.items():
+            if sha in blob_ids or sha in skipped:
+                continue
+            if commit:
+                if sizes[sha] > MAX_FILE_BYTES:
+                    skipped.add(sha)
+                    continue
+            elif not (self.repo_dir / path).is_file():
+                continue
+            pending.setdefault(sha, path)
+
+        source = f"in the tree of {commit[:12]}" if commit else "checked out"
+        print(f"  {self.ICON} {self.NAME.capitalize()}: {len(current)} files {source}, "
+              f"{len(pending)} new blobs to index")
+        new_docs = {}
+        if pending:
+            if commit:
+                results = self._tree_documents(list(pending), workers)
+            else:
+                results = self._checkout_documents(pending, workers)
+            for sha, document in results:
+                if document is None:
+                    skipped.add(sha)
+                    continue
+                blob_ids[sha] = len(self.state['blobs'])
+                self.state['blobs'].append(sha)
+                new_docs[blob_ids[sha]] = self._add_document(document)
+                if len(new_docs) >= SEGMENT_DOCS:
+                    self._flush_segment(new_docs)
+                    new_docs = {}
+            if new_docs:
+                self._flush_segment(new_docs)
+
+        self.state['paths'] = {path: blob_ids[sha] for path, sha in current.items() if sha in blob_ids}
+        self.state['skipped'] = sorted(skipped & set(current.values()))
+        self.state['source'] = 'tree' if commit else 'checkout'
+        self.state['commit'] = commit or subprocess.run(["git", "rev-parse", "HEAD"], cwd=self.repo_dir,
+                                                        capture_output=True, text=True).stdout.strip()
+        self.state['repo_dir'] = os.path.relpath(self.repo_dir, self.index_dir.parent)
+        self._save_state()
+        print(f"  ✅ {self.NAME.capitalize()} up to date: {len(self.state['paths'])} files, "
+              f"{len(self.state['segments'])} segments ({time.time() - start_time:.1f}s)")
+        return self
+
+    def _checkout_documents(self, pending, workers):
+        """(sha, document or None) for blobs read from the checked-out files."""
+        shas = list(pending)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            paths = [str(self.repo_dir / pending[sha]) for sha in shas]
+            yield from zip(shas, pool.map(self.file_worker, paths, chunksize=64))
+
+    def _tree_documents(self, shas, workers):
+        """(sha, document or None) for blobs streamed from `git cat-file --batch`.
+
+        Batches go to the worker pool while the next ones are read; the window of
+        batches in flight bounds memory.
+        """
+        workers = workers or os.cpu_count() or 1
+        with BlobReader(self.repo_dir) as reader, ProcessPoolExecutor(max_workers=workers) as pool:
+            window = []
+            batch_shas, batch = [], []
+            for sha, data in reader.iter_blobs(shas):
+                batch_shas.append(sha)
+                batch.append(data)
+                if len(batch) >= BLOB_BATCH:
+                    window.append((batch_shas, pool.submit(self.batch_worker, batch)))
+                    batch_shas, batch = [], []
+                    if len(window) >= workers * 2:
+                        done_shas, future = window.pop(0)
+                        yield from zip(done_shas, future.result())
+            if batch:
+                window.append((batch_shas, pool.submit(self.batch_worker, batch)))
+            for done_shas, future in window:
+                yield from zip(done_shas, future.result())
+
+    def _flush_segment(self, documents):
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        name = f"seg_{self.state['next_segment']:04d}.bin"
+        self.state['next_segment'] += 1
+        self._write_segment(self.index_dir / name, documents)
+        self.state['segments'].append(name)
+
+    def segments(self):
+        if self._segments is None:
+            self._segments = [self.segment_class(self.index_dir / name) for name in self.state['segments']]
+        return self._segments
+
+    def close(self):
+        for segment in self._segments or []:
+            segment.close()
+        self._segments = None
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def _document_data(self, path):
+        """Contents of an indexed file, from the checkout or (tree indexes) the object store."""
+        if self.state.get('source') != 'tree':
+            with open(self.repo_dir / path, 'rb') as f:
+                return f.read()
+        if self._reader is None:
+            self._reader = BlobReader(self.repo_dir)
+        return self._reader.read(self.state['blobs'][self.state['paths'][path]]) or b''
+
+
+def workspace_repo_dir(workspace_dir):
+    """The repository clone inside a workspace (from its manifest, else the only git checkout)."""
+    workspace_dir = Path(workspace_dir)
+    manifest_file = workspace_dir / "workspace_manifest.json"
+    if manifest_file.exists():
+        with open(manifest_file) as f:
+            return workspace_dir / json.load(f)['repo_dir']
+    repos = [p for p in workspace_dir.iterdir() if (p / ".git").exists()]
+    if len(repos) != 1:
+        raise Exception(f"Cannot tell which repository in {workspace_dir} to index")
+    return repos[0]
+
+
+def add_build_parser(subparsers):
+    """The `build` subcommand shared by the index CLIs."""
+    build_parser = subparsers.add_parser("build", help="Create or incrementally update the index")
+    build_parser.add_argument("workspace", help="PR workspace directory")
+    build_parser.add_argument("--workers", type=int, help="Parallel indexing processes (default: CPU count)")
+    build_parser.add_argument("--git-dir", help="Index from this repository's objects (e.g. a bare mirror)")
+    build_parser.add_argument("--commit", help="Index the tree of this commit/ref without a checkout")
+    return build_parser
+
+
+def run_build(index_class, parser, args):
+    """Build or update a workspace's index from the parsed `build` arguments."""
+    if args.git_dir and not args.commit:
+        parser.error("--git-dir requires --commit")
+    repo_dir = args.git_dir or workspace_repo_dir(args.workspace)
+    index = index_class(Path(args.workspace) / index_class.DIR_NAME, repo_dir)
+    index.update(workers=args.workers, commit=args.commit)
+    index.close()
@@ -0,0 +1,694 @@
+#!/usr/bin/env python3
+"""
+Call Graph - Callers and callees (1-2 hops) of the functions a PR touches.
+
+For the Python files at the PR head this module:
+1. Summarizes every file once per git blob: functions/methods/classes with their
+   line ranges, the calls each function makes (name and receiver) and the imports.
+   Summaries are cached per repository in its git directory (the shared mirror
+   when the workspace has one), so later PRs of the same repository only parse
+   the blobs that are new
+2. Resolves calls statically: local definitions, absolute and relative imports,
+   `self`/`cls` methods of the enclosing class, and method names defined in only
+   a few places
+3. Finds the functions the diff touches (plus functions the PR removes) and walks
+   their callers and callees up to `hops` levels
+4. Writes <workspace>/call_graph.json and a compact call_graph.md for prompts
+
+Resolution is name based: dynamic dispatch and heavily overloaded method names
+are left out rather than guessed.
+
+Usage:
+    python3 call_graph.py pr_workspace_apache
+    python3 call_graph.py pr_workspace_apache --hops 1
+    python3 call_graph.py pr_workspace_apache --git-dir ~/.cache/iflow-pr-benchmark/mirrors/apache/airflow.git
+"""
+
+import argparse
+import ast
+import fcntl
+import json
+import os
+import posixpath
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from blob_index import BLOB_BATCH, workspace_repo_dir
+from context_pack import test_subject
+from diff_compactor import HUNK_RE
+from diff_index import DiffIndex
+from git_blobs import BlobReader, is_partial_clone, list_local_blobs, merge_base, resolve_commit
+from symbol_index import IGNORED_SYMBOLS, decode_text
+
+GRAPH_NAME = "call_graph.json"
+GRAPH_MD_NAME = "call_graph.md"
+GRAPH_VERSION = 1
+# Bump when the summary format changes; old caches are simply left behind
+SUMMARY_VERSION = 1
+CACHE_DIR_NAME = f"iflow-call-graph-v{SUMMARY_VERSION}"
+DEFAULT_HOPS = 2
+# Edges listed per function and direction at each hop
+MAX_NEIGHBORS = 12
+# Attribute calls like `obj.refresh()` are followed only if so few methods share the name
+MAX_AMBIGUOUS = 3
+# Methods of builtin types: `value.split()` on an untyped receiver is almost never repository code
+BUILTIN_METHODS = {name for kind in (str, bytes, list, dict, set, tuple, int, float) for name in dir(kind)}
+MAX_FUNCTIONS_IN_MD = 40
+
+
+class _CallVisitor(ast.NodeVisitor):
+    """Collect definitions, the calls made inside each function, and imports."""
+
+    def __init__(self):
+        # [qualname, line, end_line, kind]
+        self.functions = []
+        # [index of the enclosing function or -1, name, receiver, line]
+        self.calls = []
+        # local name -> dotted target ('.'-prefixed for relative imports)
+        self.imports = {}
+        # class qualname -> dotted names of its bases
+        self.bases = {}
+        self._scope = []
+
+    def _define(self, node, kind):
+        qualname = '.'.join([name for name, _, _ in self._scope] + [node.name])
+        index = len(self.functions)
+        self.functions.append([qualname, node.lineno, getattr(node, 'end_lineno', node.lineno), kind])
+        self._scope.append((node.name, kind, index))
+        self.generic_visit(node)
+        self._scope.pop()
+
+    def visit_ClassDef(self, node):
+        bases = [_dotted_name(base) for base in node.bases]
+        self.bases['.'.join([name for name, _, _ in self._scope] + [node.name])] = [b for b in bases if b]
+        self._define(node, 'class')
+
+    def visit_FunctionDef(self, node):
+        in_class = bool(self._scope) and self._scope[-1][1] == 'class'
+        self._define(node, 'method' if in_class else 'function')
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            if alias.asname:
+                self.imports[alias.asname] = alias.name
+            else:
+                top = alias.name.split('.')[0]
+                self.imports[top] = top
+
+    def visit_ImportFrom(self, node):
+        module = '.' * node.level + (node.module or '')
+        prefix = module if module.endswith('.') else module + '.'
+        for alias in node.names:
+            if alias.name != '*':
+                self.imports[alias.asname or alias.name] = prefix + alias.name
+
+    def visit_Call(self, node):
+        name, receiver = _call_target(node.func)
+        if name:
+            caller = next((index for _, kind, index in reversed(self._scope) if kind != 'class'), -1)
+            self.calls.append([caller, name, receiver, node.lineno])
+        self.generic_visit(node)
+
+
+def _dotted_name(node):
+    """'a.b.c' for a Name/Attribute chain, else None."""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    return '.'.join([node.id] + parts[::-1])
+
+
+def _call_target(func):
+    """(name, receiver): receiver is '' for bare calls, the dotted object name, 'super' or '?'."""
+    if isinstance(func, ast.Name):
+        return func.id, ''
+    if not isinstance(func, ast.Attribute):
+        return None, None
+    receiver = _dotted_name(func.value)
+    if receiver:
+        return func.attr, receiver
+    value = func.value
+    if isinstance(value, ast.Call) and isinstance(value.func, ast.Name) and value.func.id == 'super':
+        return func.attr, 'super'
+    return func.attr, '?'
+
+
+def summarize_python(data):
+    """Summary {'f': functions, 'c': calls, 'i': imports, 'b': class bases} of a Python blob, or None if it does not parse."""
+    source = decode_text(data)
+    if source is None:
+        return None
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+    visitor = _CallVisitor()
+    visitor.visit(tree)
+    return {'f': visitor.functions, 'c': visitor.calls, 'i': visitor.imports, 'b': visitor.bases}
+
+
+def _summarize_batch(blobs):
+    """Worker: summaries for a batch of blob contents."""
+    return [summarize_python(data) for data in blobs]
+
+
+def default_cache_dir(git_dir):
+    """Summary cache inside a repository's common git directory (shared by its worktrees)."""
+    common_dir = subprocess.run(["git", "rev-parse", "--git-common-dir"], cwd=git_dir,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    return (Path(git_dir) / common_dir).resolve() / CACHE_DIR_NAME
+
+
+class SummaryCache:
+    """Per-blob file summaries shared by every PR of a repository, sharded by SHA prefix.
+
+    Unparseable blobs are cached as False so they are not retried. Saving merges
+    with what other processes wrote in the meantime, under a file lock.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self._shards = {}
+        self._dirty = {}
+
+    def _shard(self, prefix):
+        shard = self._shards.get(prefix)
+        if shard is None:
+            try:
+                with open(self.cache_dir / f"{prefix}.json") as f:
+                    shard = json.load(f)
+            except (OSError, ValueError):
+                shard = {}
+            self._shards[prefix] = shard
+        return shard
+
+    def get(self, sha):
+        """Summary of a blob, False if it does not parse, None if not cached."""
+        return self._shard(sha[:2]).get(sha)
+
+    def put(self, sha, summary):
+        value = summary if summary is not None else False
+        self._shard(sha[:2])[sha] = value
+        self._dirty.setdefault(sha[:2], {})[sha] = value
+
+    @contextmanager
+    def _lock(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_dir / ".lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self):
+        if not self._dirty:
+            return
+        with self._lock():
+            for prefix, entries in self._dirty.items():
+                path = self.cache_dir / f"{prefix}.json"
+                try:
+                    with open(path) as f:
+                        shard = json.load(f)
+                except (OSError, ValueError):
+                    shard = {}
+                shard.update(entries)
+                tmp_path = path.with_name(f"{prefix}.json.{os.getpid()}.tmp")
+                with open(tmp_path, 'w') as f:
+                    json.dump(shard, f, separators=(',', ':'))
+                os.replace(tmp_path, path)
+        self._dirty = {}
+
+
+def load_summaries(git_dir, shas, cache, workers=None):
+    """{sha: summary or False} for blobs, parsing the uncached ones in a process pool.
+
+    Blobs missing from the object store are left out (and not cached).
+    """
+    summaries = {}
+    missing = []
+    for sha in dict.fromkeys(shas):
+        summary = cache.get(sha)
+        if summary is None:
+            missing.append(sha)
+        else:
+            summaries[sha] = summary
+    if not missing:
+        return summaries, 0
+
+    workers = workers or os.cpu_count() or 1
+    parsed = 0
+    with BlobReader(git_dir) as reader, ProcessPoolExecutor(max_workers=workers) as pool:
+        window = []
+        batch_shas, batch = [], []
+
+        def collect(done_shas, future):
+            for sha, summary in zip(done_shas, future.result()):
+                cache.put(sha, summary)
+                summaries[sha] = cache.get(sha)
+
+        for sha, data in reader.iter_blobs(missing):
+            if data is None:
+                # Not in the object store (or not a blob): nothing to parse, and nothing to cache
+                continue
+            parsed += 1
+            batch_shas.append(sha)
+            batch.append(data)
+            if len(batch) >= BLOB_BATCH:
+                window.append((batch_shas, pool.submit(_summarize_batch, batch)))
+                batch_shas, batch = [], []
+                if len(window) >= workers * 2:
+                    collect(*window.pop(0))
+        if batch:
+            window.append((batch_shas, pool.submit(_summarize_batch, batch)))
+        for done_shas, future in window:
+            collect(done_shas, future)
+    cache.save()
+    return summaries, parsed
+
+
+def _module_names(path):
+    """Dotted module name of a .py path and every shorter suffix (src layouts, tests on sys.path)."""
+    parts = path[:-len('.py')].split('/')
+    if parts[-1] == '__init__':
+        parts = parts[:-1]
+    return ['.'.join(parts[i:]) for i in range(len(parts))]
+
+
+class CallGraph:
+    """Static call graph over the Python files of one commit ({path: summary})."""
+
+    def __init__(self, files):
+        self.files = files
+        self.modules = {}
+        self.definitions = {}
+        self.by_name = {}
+        for path, summary in files.items():
+            for name in _module_names(path):
+                self.modules.setdefault(name, []).append(path)
+            for index, (qualname, line, end_line, kind) in enumerate(summary['f']):
+                node = f"{path}::{qualname}"
+                self.definitions[node] = (path, index)
+                self.by_name.setdefault(qualname.rsplit('.', 1)[-1], []).append(node)
+        self._calls_by_name = None
+
+    def function(self, node):
+        """[qualname, line, end_line, kind] of an internal node."""
+        path, index = self.definitions[node]
+        return self.files[path]['f'][index]
+
+    def _module_path(self, dotted):
+        paths = self.modules.get(dotted)
+        if not paths:
+            return None
+        # Prefer the full-path match, then the shortest path
+        return min(paths, key=lambda path: (_module_names(path)[0] != dotted, path.count('/'), path))
+
+    def _absolute(self, path, dotted):
+        """Resolve a relative import target ('..pkg.name') against the importing file."""
+        level = len(dotted) - len(dotted.lstrip('.'))
+        if not level:
+            return dotted
+        package = posixpath.dirname(path).split('/') if posixpath.dirname(path) else []
+        if level > 1:
+            package = package[:-(level - 1)] if level - 1 <= len(package) else []
+        return '.'.join(package + [dotted[level:]]) if dotted[level:] else '.'.join(package)
+
+    def _resolve_dotted(self, dotted):
+        """Node for 'module.function' / 'module.Class.method', else the dotted name as an external node."""
+        parts = dotted.split('.')
+        for split in range(len(parts) - 1, 0, -1):
+            module_path = self._module_path('.'.join(parts[:split]))
+            if module_path:
+                node = f"{module_path}::{'.'.join(parts[split:])}"
+                return [node] if node in self.definitions else []
+        return [dotted]
+
+    def _by_method_name(self, name):
+        """Methods called `name` anywhere, if there are few enough to be a useful guess."""
+        if name in IGNORED_SYMBOLS or name in BUILTIN_METHODS or name.startswith('__'):
+            return []
+        nodes = [node for node in self.by_name.get(name, []) if self.function(node)[3] == 'method']
+        return nodes if len(nodes) <= MAX_AMBIGUOUS else []
+
+    def _resolve_name(self, path, dotted):
+        """Nodes a (possibly dotted) name used in `path` refers to."""
+        head, _, rest = dotted.partition('.')
+        if f"{path}::{head}" in self.definitions:
+            return [f"{path}::{dotted}"]
+        if head in self.files[path]['i']:
+            target = self._absolute(path, self.files[path]['i'][head])
+            return self._resolve_dotted('.'.join(filter(None, [target, rest])))
+        return []
+
+    def _method_in_bases(self, class_node, name, include_self=True):
+        """The first definition of method `name` in a class and its in-repository bases."""
+        queue = [class_node] if include_self else self._bases(class_node)
+        seen = set()
+        while queue:
+            node = queue.pop(0)
+            if node in seen or node not in self.definitions:
+                continue
+            seen.add(node)
+            method = f"{node}.{name}"
+            if method in self.definitions:
+                return [method]
+            queue += self._bases(node)
+        return []
+
+    def _bases(self, class_node):
+        path, qualname = class_node.split('::', 1)
+        return [node for base in self.files[path].get('b', {}).get(qualname, [])
+                for node in self._resolve_name(path, base)]
+
+    def _enclosing_class(self, path, caller):
+        scope = caller.split('.')
+        for end in range(len(scope) - 1, 0, -1):
+            node = f"{path}::{'.'.join(scope[:end])}"
+            if node in self.definitions and self.function(node)[3] == 'class':
+                return node
+        return None
+
+    def resolve_call(self, path, caller_index, name, receiver):
+        """Nodes a call may reach: '<path>::<qualname>' for repository code, dotted names for externals."""
+        summary = self.files[path]
+        imports = summary['i']
+        caller = summary['f'][caller_index][0] if caller_index >= 0 else ''
+        if receiver == '':
+            node = f"{path}::{name}"
+            if node in self.definitions:
+                return [node]
+            if name in imports:
+                return self._resolve_dotted(self._absolute(path, imports[name]))
+            top_level = [n for n in self.by_name.get(name, []) if n.endswith(f"::{name}")]
+            return top_level if len(top_level) == 1 else []
+        if receiver in ('self', 'cls', 'super'):
+            # Methods of the enclosing class and its bases; names found there only are instance attributes
+            class_node = self._enclosing_class(path, caller)
+            if class_node is None:
+                return []
+            return self._method_in_bases(class_node, name, include_self=receiver != 'super')
+        head = receiver.partition('.')[0]
+        if head in imports or f"{path}::{head}" in self.definitions:
+            targets = self._resolve_name(path, f"{receiver}.{name}")
+            return [node for node in targets if node in self.definitions or '::' not in node]
+        return self._by_method_name(name)
+
+    def callees(self, node):
+        """[(target, call line)] of the calls made in a function (first call site per target)."""
+        path, index = self.definitions[node]
+        edges = {}
+        for caller_index, name, receiver, line in self.files[path]['c']:
+            if caller_index == index:
+                for target in self.resolve_call(path, caller_index, name, receiver):
+                    if target != node:
+                        edges.setdefault(target, line)
+        return sorted(edges.items(), key=lambda edge: edge[1])
+
+    def callers(self, node):
+        """[(caller node, call line)] of the functions calling `node`."""
+        if self._calls_by_name is None:
+            self._calls_by_name = {}
+            for path, summary in self.files.items():
+                for caller_index, name, receiver, line in summary['c']:
+                    self._calls_by_name.setdefault(name, []).append((path, caller_index, receiver, line))
+        name = self.function(node)[0].rsplit('.', 1)[-1]
+        edges = {}
+        for path, caller_index, receiver, line in self._calls_by_name.get(name, []):
+            if caller_index < 0 or node not in self.resolve_call(path, caller_index, name, receiver):
+                continue
+            caller = f"{path}::{self.files[path]['f'][caller_index][0]}"
+            if caller != node:
+                edges.setdefault(caller, line)
+        # Production callers before tests
+        return sorted(edges.items(), key=lambda edge: (bool(test_subject(edge[0].split('::', 1)[0])), edge[0]))
+
+    def neighborhood(self, node, hops, direction):
+        """[{hop, via, node, line}] reached from `node` through callers or callees, breadth first."""
+        result = []
+        seen = {node}
+        frontier = [node]
+        for hop in range(1, hops + 1):
+            next_frontier = []
+            for source in frontier:
+                edges = self.callers(source) if direction == 'callers' else self.callees(source)
+                for target, line in edges[:MAX_NEIGHBORS]:
+                    if target in seen:
+                        continue
+                    seen.add(target)
+                    result.append({'hop': hop, 'via': source, 'node': target, 'line': line})
+                    if target in self.definitions:
+                        next_frontier.append(target)
+            frontier = next_frontier
+        return result
+
+
+def changed_lines(patch):
+    """(head lines, base lines) touched by a patch; deletions also mark their position in the head."""
+    head, base = set(), set()
+    old_no = new_no = 0
+    for line in patch.splitlines():
+        match = HUNK_RE.match(line)
+        if match:
+            old_no, new_no = int(match.group(1)), int(match.group(3))
+            continue
+        kind = line[:1]
+        if not old_no and not new_no or kind == '\\':
+            continue
+        if kind == '+' and not line.startswith('+++ '):
+            head.add(new_no)
+            new_no += 1
+        elif kind == '-' and not line.startswith('--- '):
+            base.add(old_no)
+            head.add(new_no)
+            old_no += 1
+        else:
+            old_no += 1
+            new_no += 1
+    return head, base
+
+
+def _iter_patches(workspace_dir, pr_number, changed_files):
+    """(entry, patch text) per changed Python file, from the hunk index or the files list patches."""
+    workspace_dir = Path(workspace_dir)
+    python_files = [entry for entry in changed_files if entry['filename'].endswith('.py')]
+    diff_file = workspace_dir / f"pr_{pr_number}.diff"
+    try:
+        with DiffIndex.load(diff_file) as index:
+            for entry in python_files:
+                yield entry, index.file_patch(entry['filename']) or entry.get('patch') or ''
+        return
+    except Exception:
+        pass
+    for entry in python_files:
+        yield entry, entry.get('patch') or ''
+
+
+def _innermost(functions, lines):
+    """Indexes of the innermost functions (or classes, for lines outside any function) containing `lines`."""
+    touched = set()
+    for line in lines:
+        containing = [i for i, (_, start, end, _kind) in enumerate(functions) if start <= line <= end]
+        functions_only = [i for i in containing if functions[i][3] != 'class']
+        candidates = functions_only or containing
+        if candidates:
+            touched.add(max(candidates, key=lambda i: functions[i][1]))
+    return touched
+
+
+def touched_functions(graph, base_files, patches):
+    """[(node, status, function row)] of functions the PR adds, modifies or removes."""
+    touched = []
+    for entry, patch in patches:
+        head_lines, base_lines = changed_lines(patch)
+        path = entry['filename']
+        head_summary = graph.files.get(path) if entry['status'] != 'removed' else None
+        base_path = entry.get('previous_filename') or path
+        base_summary = base_files.get(base_path) if entry['status'] != 'added' else None
+        head_names = {row[0] for row in head_summary['f']} if head_summary else set()
+        base_names = {row[0] for row in base_summary['f']} if base_summary else set()
+        if head_summary:
+            for index in sorted(_innermost(head_summary['f'], head_lines)):
+                row = head_summary['f'][index]
+                touched.append((f"{path}::{row[0]}", 'modified' if row[0] in base_names else 'added', row))
+        # A head that does not parse tells nothing about removals
+        if base_summary and (head_summary or entry['status'] == 'removed'):
+            for index in sorted(_innermost(base_summary['f'], base_lines)):
+                row = base_summary['f'][index]
+                if row[0] not in head_names:
+                    touched.append((f"{base_path}::{row[0]}", 'removed', row))
+    return touched
+
+
+def _python_blobs(git_dir, commit):
+    """{path: blob sha} of the Python files of `commit` in the object store (a blobless clone lacks most)."""
+    if not commit:
+        return {}
+    return {path: sha for path, sha in list_local_blobs(git_dir, commit).items() if path.endswith('.py')}
+
+
+def build_call_graph(workspace_dir, git_dir, pr_info, changed_files, hops=DEFAULT_HOPS, workers=None, cache_dir=None):
+    """Compute the call neighborhoods of the PR's changed functions and write call_graph.json/.md."""
+    start_time = time.time()
+    workspace_dir = Path(workspace_dir)
+    head_sha = resolve_commit(git_dir, pr_info['head_sha'])
+    # The patch's old-side line numbers are relative to the merge base, not the base-branch tip.
+    # Shallow or partial clones may lack it; removed functions are then not reported
+    base_sha = pr_info.get('base_sha')
+    base_sha = merge_base(git_dir, base_sha, head_sha) if base_sha else None
+
+    cache = SummaryCache(cache_dir or default_cache_dir(git_dir))
+    # A blobless clone only has the checked-out files: the graph covers those and never fetches the rest
+    partial = is_partial_clone(git_dir)
+    head_blobs = _python_blobs(git_dir, head_sha)
+    changed = {entry.get('previous_filename') or entry['filename'] for entry in changed_files}
+    base_blobs = {path: sha for path, sha in _python_blobs(git_dir, base_sha).items() if path in changed}
+    summaries, parsed = load_summaries(git_dir, list(head_blobs.values()) + list(base_blobs.values()), cache, workers)
+    head_files = {path: summaries[sha] for path, sha in head_blobs.items() if summaries.get(sha)}
+    base_files = {path: summaries[sha] for path, sha in base_blobs.items() if summaries.get(sha)}
+
+    graph = CallGraph(head_files)
+    functions = []
+    for node, status, row in touched_functions(graph, base_files,
+                                               _iter_patches(workspace_dir, pr_info['pr_number'], changed_files)):
+        path, qualname = node.split('::', 1)
+        entry = {'id': node, 'path': path, 'qualname': qualname, 'kind': row[3], 'line': row[1],
+                 'end_line': row[2], 'status': status, 'callers': [], 'callees': []}
+        if status != 'removed':
+            entry['callers'] = graph.neighborhood(node, hops, 'callers')
+            entry['callees'] = graph.neighborhood(node, hops, 'callees')
+            # Callees are listed at their definition, callers at the call site
+            for edge in entry['callees']:
+                if edge['node'] in graph.definitions:
+                    edge['line'] = graph.function(edge['node'])[1]
+        functions.append(entry)
+
+    result = {
+        'version': GRAPH_VERSION,
+        'head_sha': head_sha,
+        'base_sha': base_sha,
+        'hops': hops,
+        'functions': functions,
+        'partial_clone': partial,
+        'stats': {'python_files': len(head_files), 'parsed_blobs': parsed,
+                  'seconds': round(time.time() - start_time, 2)}
+    }
+    graph_path = workspace_dir / GRAPH_NAME
+    tmp_path = graph_path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(result, f, indent=1)
+    os.replace(tmp_path, graph_path)
+    (workspace_dir / GRAPH_MD_NAME).write_text(render_markdown(result))
+
+    edges = sum(len(f['callers']) + len(f['callees']) for f in functions)
+    print(f"  ✅ Call graph: {len(functions)} changed functions, {edges} neighbors within {hops} hops "
+          f"({len(head_files)} Python files, {parsed} parsed, the rest cached; {time.time() - start_time:.1f}s)")
+    if partial:
+        print("  💡 Partial clone: only locally present files were read (widen the sparse cone for more callers)")
+    return result
+
+
+def _label(node, line):
+    if '::' not in node:
+        return f"`{node}` (external)"
+    path, qualname = node.split('::', 1)
+    return f"`{qualname}` {path}:{line}"
+
+
+def render_function_section(function):
+    """Markdown for one changed function: callers and callees indented by hop."""
+    text = (f"## `{function['qualname']}` ({function['kind']}, {function['status']}) - "
+            f"{function['path']}:{function['line']}-{function['end_line']}\n")
+    if function['status'] == 'removed':
+        return text + "Removed by the PR (not in the head commit).\n"
+    for title, key in (("Called by", 'callers'), ("Calls", 'callees')):
+        edges = function[key]
+        if not edges:
+            text += f"{title}: nothing found\n"
+            continue
+        text += f"{title}:\n"
+        children = {}
+        for edge in edges:
+            children.setdefault(edge['via'], []).append(edge)
+
+        def walk(node, depth):
+            lines = ""
+            for edge in children.get(node, []):
+                lines += f"{'  ' * depth}- {_label(edge['node'], edge['line'])}\n"
+                lines += walk(edge['node'], depth + 1)
+            return lines
+
+        text += walk(function['id'], 0)
+    return text
+
+
+def render_markdown(result):
+    """The compact call_graph.md for prompts."""
+    functions = result['functions']
+    text = (f"# Call Graph of Changed Functions\n\nCallers (at the call site) and callees (at their definition) "
+            f"up to {result['hops']} hops, resolved statically from the PR head; dynamic calls may be missing. "
+            f"Full data: `{GRAPH_NAME}`\n")
+    if result.get('partial_clone'):
+        text += "\nSparse workspace: only files in the checkout were read, so callers elsewhere are missing.\n"
+    if not functions:
+        return text + "\nNo changed Python functions.\n"
+    for function in functions[:MAX_FUNCTIONS_IN_MD]:
+        text += "\n" + render_function_section(function)
+    if len(functions) > MAX_FUNCTIONS_IN_MD:
+        text += f"\n... {len(functions) - MAX_FUNCTIONS_IN_MD} more changed functions in `{GRAPH_NAME}`\n"
+    return text
+
+
+def load_call_graph(workspace_dir):
+    """The workspace's call_graph.json, or None."""
+    try:
+        with open(Path(workspace_dir) / GRAPH_NAME) as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return result if result.get('version') == GRAPH_VERSION else None
+
+
+def main():
+    """Build the call graph neighborhoods of a prepared PR workspace."""
+    parser = argparse.ArgumentParser(description="Callers and callees of the functions a PR changes")
+    parser.add_argument("workspace", help="PR workspace directory")
+    parser.add_argument("--git-dir", help="Read the PR head from this repository (e.g. the shared bare mirror)")
+    parser.add_argument("--hops", type=int, default=DEFAULT_HOPS, help=f"Call depth (default: {DEFAULT_HOPS})")
+    parser.add_argument("--workers", type=int, help="Parsing processes (default: CPU count)")
+    parser.add_argument("--cache-dir", help="Summary cache (default: inside the repository's git directory)")
+
+    args = parser.parse_args()
+
+    try:
+        workspace_dir = Path(args.workspace)
+        pr_info_files = list(workspace_dir.glob("pr_*_info.json"))
+        if not pr_info_files:
+            raise Exception(f"No PR info file in {workspace_dir}")
+        with open(pr_info_files[0]) as f:
+            pr_info = json.load(f)
+        files_list = workspace_dir / f"pr_{pr_info['pr_number']}_files.json"
+        if not files_list.exists():
+            raise Exception(f"No changed-files list in {workspace_dir}")
+        changed_files = json.loads(files_list.read_text())
+        git_dir = Path(args.git_dir) if args.git_dir else workspace_repo_dir(workspace_dir)
+        build_call_graph(workspace_dir, git_dir, pr_info, changed_files, hops=args.hops, workers=args.workers,
+                         cache_dir=args.cache_dir)
+        print(f"📄 {workspace_dir / GRAPH_MD_NAME}")
+        return 0
+    except Exception as e:
+        print(f"❌ Error building call graph: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Code Search - Persistent trigram index over a checked-out repository.
+
+The index lives in <workspace>/code_index/:
+1. index.json - indexed commit, blob table (one document per git blob) and path -> document map
+2. seg_NNNN.bin - immutable segments of trigram posting lists (sorted keys, offsets, document ids)
+
+Documents are git blobs, so checking out another PR into the same clone only
+indexes the blobs that are new; unchanged files keep their postings. Segments
+are compacted once too many of their documents are no longer checked out.
+
+The index can also be built from the tree of a commit without a checkout (e.g.
+from a bare mirror): blobs are streamed through one `git cat-file --batch`
+process and searches read matches from the object store.
+
+Queries extract the trigrams a match must contain, intersect posting lists to
+get candidate files and only read those to confirm matches line by line.
+
+Usage:
+    python3 code_search.py build pr_workspace_apache
+    python3 code_search.py build pr_workspace_apache --git-dir airflow.git --commit refs/pull/58365/head
+    python3 code_search.py search pr_workspace_apache "def get_task_instance"
+    python3 code_search.py search pr_workspace_apache "class \\w+Operator\\(" --regex
+"""
+
+import argparse
+import fnmatch
+import mmap
+import os
+import re
+import sys
+import time
+from array import array
+from bisect import bisect_left
+
+from blob_index import MAX_FILE_BYTES, BlobDocumentIndex, add_build_parser, read_file_prefix, run_build
+
+INDEX_DIR_NAME = "code_index"
+INDEX_VERSION = 1
+SEGMENT_MAGIC = b'TRG1'
+REGEX_META = set('.^$*+?{}[]\\|()')
+QUANTIFIER_RE = re.compile(r'\{\d*(?:,\d*)?\}')
+
+
+def file_trigrams(data):
+    """Sorted trigram codes (lowercased bytes) of a file's contents, or None for binary files."""
+    if b'\0' in data[:8192]:
+        return None
+    data = data.lower()
+    grams = set(zip(data, data[1:], data[2:]))
+    return array('I', sorted((a << 16) | (b << 8) | c for a, b, c in grams))
+
+
+def string_trigrams(text, ascii_only=False):
+    """Trigram codes of a query string, lowercased like file_trigrams (ASCII letters only).
+
+    With ascii_only, trigrams containing non-ASCII bytes are left out: the index keeps
+    those bytes as they are, so they cannot be required for case-insensitive searches.
+    """
+    data = text.encode('utf-8').lower()
+    grams = set()
+    for i in range(len(data) - 2):
+        if ascii_only and max(data[i:i + 3]) >= 0x80:
+            continue
+        grams.add((data[i] << 16) | (data[i + 1] << 8) | data[i + 2])
+    return grams
+
+
+def _data_trigrams(data):
+    if data is None or len(data) > MAX_FILE_BYTES:
+        return None
+    grams = file_trigrams(data)
+    return None if grams is None else grams.tobytes()
+
+
+def _read_file_trigrams(path):
+    """Worker: trigram codes of one file as bytes (cheap to pass between processes)."""
+    return _data_trigrams(read_file_prefix(path))
+
+
+def _blob_batch_trigrams(blobs):
+    """Worker: trigram codes (bytes or None) for a batch of blob contents."""
+    return [_data_trigrams(data) for data in blobs]
+
+
+def required_literals(pattern):
+    """Literal runs every match of `pattern` must contain (conservative: top level only).
+
+    Returns [] when nothing is guaranteed (alternation, or no literal of 3+ characters).
+    """
+    literals = []
+    current = ''
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\' and i + 1 < len(pattern):
+            escaped = pattern[i + 1]
+            if depth == 0 and not escaped.isalnum():
+                current += escaped
+            else:
+                literals.append(current)
+                current = ''
+            i += 2
+            continue
+        if char == '|' and depth == 0:
+            return []
+        if char == '(':
+            depth += 1
+            literals.append(current)
+            current = ''
+        elif char == ')':
+            depth = max(depth - 1, 0)
+        elif char == '[':
+            literals.append(current)
+            current = ''
+            # Skip the character class
+            i += 1
+            if i < len(pattern) and pattern[i] == ']':
+                i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+        elif char in '?*' and depth == 0:
+            # The previous character is optional
+            literals.append(current[:-1])
+            current = ''
+        elif char == '{' and depth == 0:
+            quantifier = QUANTIFIER_RE.match(pattern, i)
+            # {m,n} makes the previous character optional (m may be 0); its body is not text
+            literals.append(current[:-1] if quantifier else current)
+            current = ''
+            if quantifier:
+                i = quantifier.end() - 1
+        elif char in REGEX_META or depth > 0:
+            literals.append(current)
+            current = ''
+        else:
+            current += char
+        i += 1
+    literals.append(current)
+    return [literal for literal in literals if len(literal) >= 3]
+
+
+class Segment:
+    """Memory-mapped immutable segment: sorted trigram keys, offsets and document ids."""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = view = memoryview(self._mmap)
+        if bytes(view[:4]) != SEGMENT_MAGIC:
+            raise Exception(f"{path} is not a code index segment")
+        key_count, posting_count = array('I', bytes(view[4:12]))
+        start = 12
+        self.keys = view[start:start + 4 * key_count].cast('I')
+        start += 4 * key_count
+        self.offsets = view[start:start + 4 * (key_count + 1)].cast('I')
+        start += 4 * (key_count + 1)
+        self.postings = view[start:start + 4 * posting_count].cast('I')
+
+    def lookup(self, trigram):
+        index = bisect_left(self.keys, trigram)
+        if index == len(self.keys) or self.keys[index] != trigram:
+            return ()
+        return self.postings[self.offsets[index]:self.offsets[index + 1]]
+
+    def candidates(self, trigrams):
+        """Document ids containing every trigram (smallest posting list first)."""
+        lists = sorted((self.lookup(trigram) for trigram in trigrams), key=len)
+        if not lists or not len(lists[0]):
+            return set()
+        result = set(lists[0])
+        for postings in lists[1:]:
+            result.intersection_update(postings)
+            if not result:
+                break
+        return result
+
+    def close(self):
+        for view in (self.keys, self.offsets, self.postings, self._view):
+            view.release()
+        self._mmap.close()
+        self._file.close()
+
+
+def write_segment(path, doc_trigrams):
+    """Write a segment from {doc_id: array of trigram codes}."""
+    postings = {}
+    for doc_id in sorted(doc_trigrams):
+        for trigram in doc_trigrams[doc_id]:
+            postings.setdefault(trigram, []).append(doc_id)
+
+    keys = array('I', sorted(postings))
+    offsets = array('I', [0])
+    flat = array('I')
+    for key in keys:
+        flat.extend(postings[key])
+        offsets.append(len(flat))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(SEGMENT_MAGIC)
+        array('I', [len(keys), len(flat)]).tofile(f)
+        keys.tofile(f)
+        offsets.tofile(f)
+        flat.tofile(f)
+    os.replace(tmp_path, path)
+
+
+class CodeSearchIndex(BlobDocumentIndex):
+    """Trigram index over one repository checkout (or one commit's tree), stored under index_dir."""
+
+    DIR_NAME = INDEX_DIR_NAME
+    VERSION = INDEX_VERSION
+    NAME = "code index"
+    ICON = "🔎"
+    SCRIPT = "code_search.py"
+    segment_class = Segment
+    file_worker = staticmethod(_read_file_trigrams)
+    batch_worker = staticmethod(_blob_batch_trigrams)
+
+    def _add_document(self, grams):
+        return array('I', grams)
+
+    def _write_segment(self, path, doc_trigrams):
+        write_segment(path, doc_trigrams)
+
+    def _document_lines(self, path):
+        """Lines of an indexed file, from the checkout or (tree indexes) the object store."""
+        return self._document_data(path).decode('utf-8', errors='replace').splitlines()
+
+    def candidate_paths(self, trigrams, path_glob=None):
+        """Checked-out paths that contain every trigram (all paths when there are none)."""
+        paths = self.state['paths']
+        if path_glob:
+            paths = {p: d for p, d in paths.items() if fnmatch.fnmatch(p, path_glob)}
+        if not trigrams:
+            return sorted(paths)
+        docs = set()
+        for segment in self.segments():
+            docs |= segment.candidates(trigrams)
+        return sorted(path for path, doc_id in paths.items() if doc_id in docs)
+
+    def search(self, pattern, regex=False, ignore_case=False, max_results=200, path_glob=None):
+        """Return [(path, line number, line)] for lines matching a substring or regex."""
+        literals = required_literals(pattern) if regex else [pattern]
+        trigrams = set()
+        for literal in literals:
+            trigrams |= string_trigrams(literal, ascii_only=ignore_case)
+
+        flags = re.IGNORECASE if ignore_case else 0
+        matcher = re.compile(pattern if regex else re.escape(pattern), flags)
+        hits = []
+        for path in self.candidate_paths(trigrams, path_glob):
+            try:
+                lines = self._document_lines(path)
+            except OSError:
+                continue
+            for line_number, line in enumerate(lines, 1):
+                if matcher.search(line):
+                    hits.append((path, line_number, line))
+                    if len(hits) >= max_results:
+                        return hits
+        return hits
+
+
+def open_index(workspace_dir):
+    """Open the code index stored in a PR workspace."""
+    return CodeSearchIndex.open_workspace(workspace_dir)
+
+
+def main():
+    """Build or query the code search index of a PR workspace."""
+    parser = argparse.ArgumentParser(description="Trigram code search over a PR workspace")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_build_parser(subparsers)
+
+    search_parser = subparsers.add_parser("search", help="Search the indexed repository")
+    search_parser.add_argument("workspace", help="PR workspace directory")
+    search_parser.add_argument("pattern", help="Substring (default) or regular expression")
+    search_parser.add_argument("--regex", action="store_true", help="Treat the pattern as a regular expression")
+    search_parser.add_argument("-i", "--ignore-case", action="store_true", help="Case-insensitive match")
+    search_parser.add_argument("--glob", help="Only search paths matching this glob (e.g. '*.py')")
+    search_parser.add_argument("--max", type=int, default=200, help="Maximum number of hits")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "build":
+            run_build(CodeSearchIndex, parser, args)
+            return 0
+
+        start_time = time.perf_counter()
+        index = open_index(args.workspace)
+        hits = index.search(args.pattern, regex=args.regex, ignore_case=args.ignore_case,
+                            max_results=args.max, path_glob=args.glob)
+        for path, line_number, line in hits:
+            print(f"{index.repo_dir.name}/{path}:{line_number}:{line}")
+        index.close()
+        print(f"🔎 {len(hits)} hits in {(time.perf_counter() - start_time) * 1000:.1f} ms", file=sys.stderr)
+        return 0 if hits else 1
+    except Exception as e:
+        print(f"❌ Code search failed: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Context Pack - Small pre-extracted files covering everything a PR changed.
+
+The fetcher writes <workspace>/context_pack/ so the agent can read a handful of
+small files instead of searching the repository:
+1. base/<path> and head/<path> - full before/after versions of every changed file
+2. functions/<path>.md - the functions enclosing each changed line range (with line numbers)
+3. tests/<path> - test files matching the changed files by name, or importing their symbols
+4. TOC.md - table of contents linking all of the above
+5. pack.json - the same table for tools (file rows with code section ranges, tests)
+
+File versions are read from git objects (base and head SHAs), so the pack is the
+same whatever is checked out. Lockfiles, generated and vendored files are listed
+but not copied.
+
+Usage:
+    python3 context_pack.py pr_workspace_apache
+"""
+
+import argparse
+import difflib
+import json
+import os
+import posixpath
+import re
+import shutil
+import sys
+import time
+from pathlib import Path
+
+from blob_index import workspace_repo_dir
+from diff_compactor import path_reason
+from git_blobs import BlobReader, list_local_blobs, merge_base
+from symbol_index import SymbolIndex, language_for, parse_source
+
+PACK_DIR_NAME = "context_pack"
+TOC_NAME = "TOC.md"
+PACK_INDEX_NAME = "pack.json"
+MAX_PACK_FILE_BYTES = 256 * 1024
+MAX_FUNCTION_LINES = 150
+EXCERPT_CONTEXT_LINES = 15
+MAX_TESTS_PER_FILE = 3
+MAX_TEST_FILES = 20
+# Test file stems and the module name they test: test_dag, dag_test, dag.test, dag.spec, DagTest(s)
+TEST_STEM_PATTERNS = [re.compile(p) for p in
+                      (r'^test_(.+)$', r'^(.+)_test$', r'^(.+)[.-](?:test|spec)$', r'^([A-Z]\w*?)Tests?$')]
+# Stems too common to match tests by name
+GENERIC_STEMS = {'__init__', 'index', 'main', 'utils', 'util', 'helpers', 'common', 'conftest'}
+
+
+def test_subject(path):
+    """Lowercased name of the module a test file covers ('tests/test_dag.py' -> 'dag'), or None."""
+    if language_for(path) is None:
+        return None
+    stem = posixpath.splitext(posixpath.basename(path))[0]
+    for pattern in TEST_STEM_PATTERNS:
+        match = pattern.match(stem)
+        if match:
+            return match.group(1).lower()
+    return None
+
+
+def _shared_prefix(path, other):
+    """Number of leading directory components two paths share."""
+    count = 0
+    for a, b in zip(posixpath.dirname(path).split('/'), posixpath.dirname(other).split('/')):
+        if a != b:
+            break
+        count += 1
+    return count
+
+
+def find_related_tests(changed_paths, tree_paths, symbol_index=None):
+    """{test path: reason} for tests of the changed files (name match, then symbol users)."""
+    tests_by_subject = {}
+    for path in tree_paths:
+        subject = test_subject(path)
+        if subject:
+            tests_by_subject.setdefault(subject, []).append(path)
+
+    related = {}
+    changed = set(changed_paths)
+    for path in changed_paths:
+        if language_for(path) is None or test_subject(path):
+            continue
+        stem = posixpath.splitext(posixpath.basename(path))[0].lower()
+        if stem in GENERIC_STEMS:
+            continue
+        candidates = [test for test in tests_by_subject.get(stem, []) if test not in changed]
+        candidates.sort(key=lambda test: (-_shared_prefix(path, test), test))
+        for test in candidates[:MAX_TESTS_PER_FILE]:
+            related.setdefault(test, f"tests `{path}` (name match)")
+
+    if symbol_index is not None:
+        for path, names in sorted(symbol_index.dependents().items()):
+            if test_subject(path) and path not in changed:
+                related.setdefault(path, f"uses {', '.join(f'`{name}`' for name in names[:5])}")
+
+    return dict(list(related.items())[:MAX_TEST_FILES])
+
+
+def changed_line_ranges(base_text, head_text):
+    """[(first, last)] head line ranges (1-based) that differ from base; deletions map to one line."""
+    base_lines = base_text.splitlines()
+    head_lines = head_text.splitlines()
+    ranges = []
+    matcher = difflib.SequenceMatcher(None, base_lines, head_lines)
+    for tag, _i1, _i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        # Pure deletions have no head lines; point at the line after them
+        first = min(j1 + 1, max(len(head_lines), 1))
+        ranges.append((first, max(j2, first)))
+    return ranges
+
+
+def enclosing_definitions(definitions, first, last):
+    """Innermost functions/methods (else classes) spanning lines first..last."""
+    overlapping = [d for d in definitions if d['line'] <= last and d['end_line'] >= first]
+    functions = [d for d in overlapping if d['kind'] in ('function', 'method')] or overlapping
+    return [d for d in functions
+            if not any(o is not d and d['line'] <= o['line'] and o['end_line'] <= d['end_line'] for o in functions)]
+
+
+def _numbered(lines, first):
+    return '\n'.join(f"{number:>5}  {line}" for number, line in enumerate(lines, first))
+
+
+def changed_code_sections(path, base_text, head_text):
+    """[(title, first line, last line)] of head code around every changed range.
+
+    Python files get whole enclosing functions; other languages get line excerpts
+    labeled with the nearest preceding definition.
+    """
+    ranges = changed_line_ranges(base_text, head_text)
+    if not ranges:
+        return []
+    definitions = parse_source(head_text, path)['definitions']
+    # Only the Python parser knows where definitions end
+    has_extents = language_for(path) == 'python'
+    line_count = len(head_text.splitlines())
+
+    sections = {}
+    for first, last in ranges:
+        enclosing = enclosing_definitions(definitions, first, last) if has_extents else []
+        if enclosing:
+            for d in enclosing:
+                end_line = min(d['end_line'], d['line'] + MAX_FUNCTION_LINES - 1)
+                sections[(d['line'], end_line)] = f"`{d['qualname']}` ({d['kind']})"
+            continue
+        start = max(first - EXCERPT_CONTEXT_LINES, 1)
+        end = min(last + EXCERPT_CONTEXT_LINES, line_count)
+        preceding = [d for d in definitions if d['line'] <= first]
+        sections[(start, end)] = f"near `{preceding[-1]['qualname']}`" if preceding else "module level"
+
+    # Merge overlapping excerpts (functions never partially overlap)
+    merged = []
+    for (start, end), title in sorted(sections.items()):
+        if merged and start <= merged[-1][2]:
+            if end > merged[-1][2]:
+                merged[-1] = (merged[-1][0], merged[-1][1], end)
+            continue
+        merged.append((title, start, end))
+    return merged
+
+
+def _link(relative, label):
+    return f"[{label}]({relative})" if relative else "-"
+
+
+def _decode(data):
+    if data is None:
+        return None, "not available"
+    if len(data) > MAX_PACK_FILE_BYTES:
+        return None, f"too large ({len(data) // 1024} KB)"
+    if b'\0' in data[:8192]:
+        return None, "binary"
+    return data.decode('utf-8', errors='replace'), None
+
+
+def build_context_pack(workspace_dir, repo_dir, pr_info, changed_files):
+    """Write <workspace>/context_pack/ for a PR. Returns a summary dict."""
+    start_time = time.time()
+    workspace_dir = Path(workspace_dir)
+    repo_dir = Path(repo_dir)
+    pack_dir = workspace_dir / PACK_DIR_NAME
+    tmp_dir = workspace_dir / f"{PACK_DIR_NAME}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    # Base files pair with the three-dot diff, so read them at the merge base, not the base-branch tip.
+    # The base may be unknown (no base SHA, or the merge base is not in a shallow clone); head files are still packed
+    base_sha, head_sha = pr_info.get('base_sha'), pr_info['head_sha']
+    if base_sha:
+        base_sha = merge_base(repo_dir, base_sha, head_sha)
+    try:
+        symbol_index = SymbolIndex.load(workspace_dir)
+    except Exception:
+        symbol_index = None
+
+    def write(relative, text):
+        path = tmp_dir / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+        return relative
+
+    rows = []
+    function_count = 0
+    with BlobReader(repo_dir) as reader:
+        for entry in changed_files:
+            path = entry['filename']
+            status = entry.get('status', 'modified')
+            base_path = entry.get('previous_filename') or path
+            row = {'path': path, 'status': status, 'additions': entry.get('additions', 0),
+                   'deletions': entry.get('deletions', 0), 'base': None, 'head': None, 'functions': None, 'notes': []}
+
+            base_text = head_text = None
+            reason = path_reason(path)
+            if reason:
+                # Noise for the reader: no copies and no "changed code" sections
+                row['notes'].append(f"{reason}, not copied")
+                rows.append(row)
+                continue
+            if status != 'added' and not base_sha:
+                row['notes'].append("base commit unknown")
+            elif status != 'added':
+                base_text, problem = _decode(reader.read(f"{base_sha}:{base_path}"))
+                if base_text is not None:
+                    row['base'] = write(f"base/{base_path}", base_text)
+                else:
+                    row['notes'].append(f"base {problem}")
+            if status != 'removed':
+                data = reader.read(f"{head_sha}:{path}")
+                if data is None and (repo_dir / path).is_file():
+                    # Blobless clones may only have the checked-out copy
+                    data = (repo_dir / path).read_bytes()
+                head_text, problem = _decode(data)
+                if head_text is not None:
+                    row['head'] = write(f"head/{path}", head_text)
+                else:
+                    row['notes'].append(f"head {problem}")
+
+            if base_text is not None and head_text is not None:
+                sections = changed_code_sections(path, base_text, head_text)
+                if sections:
+                    head_lines = head_text.splitlines()
+                    fence = language_for(path) or ''
+                    content = f"# Changed code in {path}\n\nHead version; line numbers match `head/{path}`.\n"
+                    for title, first, last in sections:
+                        content += (f"\n## {title}, lines {first}-{last}\n```{fence}\n"
+                                    f"{_numbered(head_lines[first - 1:last], first)}\n```\n")
+                    row['functions'] = write(f"functions/{path}.md", content)
+                    row['function_count'] = len(sections)
+                    row['sections'] = [list(section) for section in sections]
+                    function_count += len(sections)
+            rows.append(row)
+
+        # Only tests present locally: listing a blobless clone with sizes would fetch every blob
+        tree_paths = list(list_local_blobs(repo_dir, head_sha))
+        tests = find_related_tests([row['path'] for row in rows
+                                    if row['status'] != 'removed' and not path_reason(row['path'])],
+                                   tree_paths, symbol_index)
+        test_rows = []
+        for test_path, reason in tests.items():
+            text, problem = _decode(reader.read(f"{head_sha}:{test_path}"))
+            if text is not None:
+                test_rows.append((write(f"tests/{test_path}", text), test_path, reason))
+
+    toc = f"# Context Pack: {pr_info.get('owner')}/{pr_info.get('repo')} #{pr_info['pr_number']}\n\n"
+    toc += f"**{pr_info.get('title', '')}**\n\n"
+    toc += (f"Merge base `{base_sha[:12] if base_sha else 'unknown'}` -> head `{head_sha[:12]}`. Every file below is small and local: read these "
+            f"instead of searching the repository.\n\n")
+    toc += "## Changed Files\n\n| File | Status | +/- | Base | Head | Changed code |\n|---|---|---|---|---|---|\n"
+    for row in rows:
+        count = row.get('function_count', 0)
+        functions = _link(row['functions'], f"{count} section{'' if count == 1 else 's'}")
+        notes = f" ({'; '.join(row['notes'])})" if row['notes'] else ""
+        toc += (f"| `{row['path']}`{notes} | {row['status']} | +{row['additions']}/-{row['deletions']} | "
+                f"{_link(row['base'], 'base')} | {_link(row['head'], 'head')} | {functions} |\n")
+    if test_rows:
+        toc += "\n## Related Tests\n\n"
+        for relative, test_path, reason in test_rows:
+            toc += f"- [{test_path}]({relative}) - {reason}\n"
+    write(TOC_NAME, toc)
+    write(PACK_INDEX_NAME, json.dumps({
+        'base_sha': base_sha, 'head_sha': head_sha, 'files': rows,
+        'tests': [{'path': test_path, 'file': relative, 'reason': reason} for relative, test_path, reason in test_rows]
+    }, indent=1))
+
+    shutil.rmtree(pack_dir, ignore_errors=True)
+    os.replace(tmp_dir, pack_dir)
+    pack_bytes = sum(p.stat().st_size for p in pack_dir.rglob('*') if p.is_file())
+    summary = {'files': len(rows), 'functions': function_count, 'tests': len(test_rows), 'bytes': pack_bytes}
+    print(f"  ✅ Context pack: {summary['files']} changed files, {summary['functions']} code sections, "
+          f"{summary['tests']} related tests, {pack_bytes / 1024:.0f} KB ({time.time() - start_time:.1f}s)")
+    return summary
+
+
+def load_pack_index(workspace_dir):
+    """The context pack's pack.json, or None when the workspace has no pack."""
+    try:
+        with open(Path(workspace_dir) / PACK_DIR_NAME / PACK_INDEX_NAME) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    """Rebuild the context pack of a prepared PR workspace."""
+    parser = argparse.ArgumentParser(description="Build the context pack of a PR workspace")
+    parser.add_argument("workspace", help="PR workspace directory")
+
+    args = parser.parse_args()
+
+    try:
+        workspace_dir = Path(args.workspace)
+        pr_info_files = list(workspace_dir.glob("pr_*_info.json"))
+        if not pr_info_files:
+            raise Exception(f"No PR info file in {workspace_dir}")
+        with open(pr_info_files[0]) as f:
+            pr_info = json.load(f)
+        pr_number = pr_info['pr_number']
+        with open(workspace_dir / f"pr_{pr_number}_files.json") as f:
+            changed_files = json.load(f)
+        build_context_pack(workspace_dir, workspace_repo_dir(workspace_dir), pr_info, changed_files)
+        return 0
+    except Exception as e:
+        print(f"❌ Error building context pack: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+Diff Compactor - Shrink a PR diff before it is read by iFlow or inlined into a prompt.
+
+The compact diff (pr_N_compact.diff) keeps every added and removed line of real
+code and drops what only costs tokens:
+1. Hunk context is trimmed to a line or so around each change; hunks are split
+   where longer unchanged stretches were cut, with exact @@ line numbers
+2. Whitespace-only hunks are left out (leading indentation counts for
+   indentation-sensitive files such as Python and YAML)
+3. Lockfiles, generated, vendored and binary files get a one-line summary
+4. Pure renames, including a delete/add pair with identical contents, get a
+   one-line summary
+
+A mapping (pr_N_compact.map.json) records where every file and every compact
+line came from in the original diff, so answers can cite the full diff.
+Hunk headers keep the real file line numbers.
+
+Usage:
+    python3 diff_compactor.py pr_workspace_apache/pr_58365.diff
+    python3 diff_compactor.py pr_workspace_apache/pr_58365.diff --context-lines 0
+    python3 diff_compactor.py pr_workspace_apache/pr_58365.diff --original 120
+"""
+
+import argparse
+import bisect
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+from pathlib import Path, PurePosixPath
+
+from diff_parser import iter_file_diffs
+
+COMPACTION_VERSION = 1
+DEFAULT_CONTEXT_LINES = 1
+HUNK_RE = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)$')
+# Header blocks are short except for binary patches, which are never written out
+MAX_HEADER_LINES = 64
+# Generated-file markers are looked for in the first lines of a file
+MARKER_SCAN_LINES = 10
+GENERATED_MARKERS = ('@generated', 'do not edit', 'code generated', 'autogenerated', 'auto-generated')
+LOCKFILE_NAMES = {
+    'package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock', 'pnpm-lock.yaml', 'bun.lockb', 'poetry.lock',
+    'Pipfile.lock', 'uv.lock', 'pdm.lock', 'Cargo.lock', 'Gemfile.lock', 'composer.lock', 'go.sum', 'mix.lock',
+    'flake.lock', 'Podfile.lock', 'pubspec.lock', 'packages.lock.json', '.terraform.lock.hcl'
+}
+VENDORED_DIRS = {'vendor', 'vendored', '_vendor', 'third_party', 'third-party', 'thirdparty', 'node_modules',
+                 'bower_components'}
+GENERATED_SUFFIXES = ('_pb2.py', '_pb2.pyi', '_pb2_grpc.py', '.pb.go', '.pb.cc', '.pb.h', '.pb.ts',
+                      '.min.js', '.min.css', '.js.map', '.css.map', '.g.dart', '.designer.cs')
+GENERATED_INFIXES = ('.generated.', '_generated.')
+# Leading whitespace changes meaning in these files
+INDENT_SENSITIVE_SUFFIXES = ('.py', '.pyi', '.pyx', '.yaml', '.yml', '.mk', '.coffee', '.haml', '.pug', '.nim')
+INDENT_SENSITIVE_NAMES = {'Makefile', 'GNUmakefile', 'Snakefile'}
+SUMMARY_TEXTS = {
+    'binary': "binary file, contents not shown",
+    'lockfile': "lockfile churn",
+    'generated': "generated file",
+    'vendored': "vendored code",
+    'renamed': "pure rename from {previous}, contents unchanged",
+    'moved_from': "pure rename from {previous} (deleted/added with identical contents)",
+    'moved_to': "deleted; contents moved unchanged to {target}",
+    'whitespace': "whitespace-only changes",
+}
+
+
+def compact_paths(diff_path):
+    """(compact diff, mapping) paths for a pr_N.diff or pr_N.diff.gz."""
+    diff_path = Path(diff_path)
+    stem = diff_path.name.split('.diff')[0]
+    return diff_path.with_name(f"{stem}_compact.diff"), diff_path.with_name(f"{stem}_compact.map.json")
+
+
+def path_reason(path):
+    """'lockfile', 'vendored' or 'generated' when a path alone says the diff is noise."""
+    if not path:
+        return None
+    parts = PurePosixPath(path).parts
+    name = parts[-1]
+    if name in LOCKFILE_NAMES:
+        return 'lockfile'
+    if VENDORED_DIRS.intersection(parts[:-1]):
+        return 'vendored'
+    if name.endswith(GENERATED_SUFFIXES) or any(infix in name for infix in GENERATED_INFIXES):
+        return 'generated'
+    return None
+
+
+def _whitespace_key(path):
+    """Function normalizing a line for whitespace-only comparison in `path`."""
+    name = PurePosixPath(path or '').name
+    if name in INDENT_SENSITIVE_NAMES or name.endswith(INDENT_SENSITIVE_SUFFIXES):
+        return lambda text: text.rstrip()
+    return lambda text: ''.join(text.split())
+
+
+def is_whitespace_only(hunk_lines, key):
+    """True if the old and new side of a hunk only differ in whitespace (blank lines ignored).
+
+    Whole sides are compared, so a line moved within the hunk is a real change.
+    """
+    old, new = [], []
+    for line in hunk_lines[1:]:
+        kind = line[:1]
+        normalized = key(line[1:])
+        if not normalized or kind == '\\':
+            continue
+        if kind != '+':
+            old.append(normalized)
+        if kind != '-':
+            new.append(normalized)
+    return old == new
+
+
+def trim_hunk(hunk_lines, context_lines):
+    """Split a hunk into sub-hunks keeping `context_lines` of context around changes.
+
+    Returns [(header or None, [line index, ...]), ...]; a None header means the
+    original header line is still exact.
+    """
+    match = HUNK_RE.match(hunk_lines[0].rstrip('\r\n'))
+    if not match:
+        # Not a plain unified hunk (e.g. combined diff): keep it whole
+        return [(None, list(range(len(hunk_lines))))]
+
+    body = range(1, len(hunk_lines))
+    changed = [i for i in body if hunk_lines[i][:1] in ('+', '-')]
+    keep = set()
+    for i in changed:
+        keep.update(range(max(1, i - context_lines), min(len(hunk_lines), i + context_lines + 1)))
+    # "\ No newline at end of file" belongs to the line before it
+    for i in body:
+        if hunk_lines[i].startswith('\\') and i - 1 in keep:
+            keep.add(i)
+    if len(keep) == len(hunk_lines) - 1:
+        return [(None, list(range(len(hunk_lines))))]
+
+    old_no, new_no = int(match.group(1)), int(match.group(3))
+    function_context = f" {match.group(5)}" if match.group(5) else ""
+    sub_hunks = []
+    current = None
+    for i in body:
+        kind = hunk_lines[i][:1]
+        if i in keep:
+            if current is None:
+                current = {'old_start': old_no, 'new_start': new_no, 'old': 0, 'new': 0, 'lines': []}
+                sub_hunks.append(current)
+            current['lines'].append(i)
+            current['old'] += kind != '+' and kind != '\\'
+            current['new'] += kind != '-' and kind != '\\'
+        else:
+            current = None
+        if kind != '\\':
+            old_no += kind != '+'
+            new_no += kind != '-'
+
+    result = []
+    for sub in sub_hunks:
+        # An empty side names the line after which the change happens
+        old_start = sub['old_start'] - (sub['old'] == 0)
+        new_start = sub['new_start'] - (sub['new'] == 0)
+        header = f"@@ -{old_start},{sub['old']} +{new_start},{sub['new']} @@{function_context}\n"
+        result.append((header, sub['lines']))
+    return result
+
+
+def _open_text(diff_path):
+    if str(diff_path).endswith('.gz'):
+        return gzip.open(diff_path, 'rt', errors='replace', newline='')
+    return open(diff_path, errors='replace', newline='')
+
+
+def _iter_blocks(diff_path):
+    """Yield (kind, first line number, lines, line count) for the preamble, each file header and hunk.
+
+    Only one hunk is held in memory at a time; header blocks keep their first
+    MAX_HEADER_LINES lines (the rest, e.g. a binary patch, is only counted).
+    """
+    kind, start, lines, count = 'preamble', 1, [], 0
+    with _open_text(diff_path) as f:
+        for number, line in enumerate(f, 1):
+            if line.startswith('diff --git '):
+                new_kind = 'header'
+            elif line.startswith('@@') and kind != 'preamble':
+                new_kind = 'hunk'
+            else:
+                new_kind = None
+            if new_kind:
+                if count:
+                    yield kind, start, lines, count
+                kind, start, lines, count = new_kind, number, [], 0
+            if kind != 'header' or len(lines) < MAX_HEADER_LINES:
+                lines.append(line)
+            count += 1
+    if count:
+        yield kind, start, lines, count
+
+
+def _plan_sections(diff_path):
+    """First pass: per-file status, counts, whitespace-only hunks and content digests."""
+    plans = []
+    hunk_index = 0
+    for kind, start, lines, count in _iter_blocks(diff_path):
+        if kind == 'header':
+            entry = next(iter_file_diffs(lines, keep_patch=False))
+            plans.append({
+                'filename': entry['filename'] or 'unknown', 'previous_filename': entry.get('previous_filename'),
+                'status': entry['status'], 'binary': entry['binary'], 'start': start,
+                'end': start + count - 1, 'additions': 0, 'deletions': 0, 'hunks': 0,
+                'whitespace_hunks': [], 'generated': False,
+                'added_digest': hashlib.sha1(), 'removed_digest': hashlib.sha1()
+            })
+            key = _whitespace_key(plans[-1]['filename'])
+            hunk_index = 0
+        elif kind == 'hunk':
+            plan = plans[-1]
+            plan['end'] = start + count - 1
+            plan['hunks'] += 1
+            for line in lines[1:]:
+                if line[:1] == '+':
+                    plan['additions'] += 1
+                    plan['added_digest'].update(line[1:].encode('utf-8', errors='replace'))
+                elif line[:1] == '-':
+                    plan['deletions'] += 1
+                    plan['removed_digest'].update(line[1:].encode('utf-8', errors='replace'))
+            if is_whitespace_only(lines, key):
+                plan['whitespace_hunks'].append(hunk_index)
+            match = HUNK_RE.match(lines[0].rstrip('\r\n'))
+            if hunk_index == 0 and match and (match.group(1) in ('0', '1') or match.group(3) in ('0', '1')):
+                head = ''.join(line[1:] for line in lines[1:MARKER_SCAN_LINES + 1]).lower()
+                plan['generated'] = any(marker in head for marker in GENERATED_MARKERS)
+            hunk_index += 1
+    return plans
+
+
+def _decide(plans):
+    """Set plan['reason'] for files that are summarized instead of shown."""
+    for plan in plans:
+        reason = None
+        if plan['binary']:
+            reason = 'binary'
+        elif path_reason(plan['filename']) or plan['generated']:
+            reason = path_reason(plan['filename']) or 'generated'
+        elif plan['status'] in ('renamed', 'copied') and not plan['hunks']:
+            reason = 'renamed'
+        elif plan['hunks'] and len(plan['whitespace_hunks']) == plan['hunks']:
+            reason = 'whitespace'
+        plan['reason'] = reason
+        plan['detail'] = {'previous': plan.get('previous_filename')}
+
+    # A file deleted and re-added elsewhere with identical contents is a rename the diff did not detect
+    removed = {}
+    for plan in plans:
+        if plan['reason'] is None and plan['status'] == 'removed' and plan['deletions']:
+            removed.setdefault(plan['removed_digest'].hexdigest(), []).append(plan)
+    for plan in plans:
+        if plan['reason'] is None and plan['status'] == 'added' and plan['additions']:
+            matches = removed.get(plan['added_digest'].hexdigest())
+            if matches:
+                source = matches.pop()
+                source['reason'], source['detail'] = 'moved_to', {'target': plan['filename']}
+                plan['reason'], plan['detail'] = 'moved_from', {'previous': source['filename']}
+    return plans
+
+
+class _CompactWriter:
+    """Writes compact lines and records which original line each one stands for."""
+
+    def __init__(self, out):
+        self.out = out
+        self.line = 0
+        self.bytes = 0
+        self.runs = []
+
+    def write(self, text, original=None):
+        if not text.endswith('\n'):
+            text += '\n'
+        self.out.write(text)
+        self.line += 1
+        self.bytes += len(text.encode('utf-8', errors='replace'))
+        if original is None:
+            return
+        last = self.runs[-1] if self.runs else None
+        if last and last[0] + last[2] == self.line and last[1] + last[2] == original:
+            last[2] += 1
+        else:
+            self.runs.append([self.line, original, 1])
+
+
+def compact_diff(diff_path, context_lines=DEFAULT_CONTEXT_LINES):
+    """Write the compact diff and its mapping next to `diff_path`. Returns the mapping."""
+    diff_path = Path(diff_path)
+    compact_path, map_path = compact_paths(diff_path)
+    stat = os.stat(diff_path)
+    plans = _decide(_plan_sections(diff_path))
+
+    files = []
+    original_lines = 0
+    tmp_path = compact_path.with_name(compact_path.name + '.tmp')
+    with open(tmp_path, 'w', newline='') as out:
+        writer = _CompactWriter(out)
+        writer.write(f"# Compact diff of {diff_path.name}: context trimmed to {context_lines} line(s); lockfiles, "
+                     f"generated, vendored and binary files, whitespace-only hunks and pure renames summarized.")
+        writer.write(f"# Original line numbers: {map_path.name}")
+        section_index = -1
+        plan = None
+        for kind, start, lines, count in _iter_blocks(diff_path):
+            original_lines = start + count - 1
+            if kind == 'preamble':
+                for offset, line in enumerate(lines):
+                    writer.write(line, start + offset)
+                continue
+            if kind == 'header':
+                section_index += 1
+                hunk_index = 0
+                plan = plans[section_index]
+                row = {'filename': plan['filename'], 'status': plan['status'],
+                       'additions': plan['additions'], 'deletions': plan['deletions'],
+                       'original': [plan['start'], plan['end']], 'compact': [writer.line + 1, None]}
+                if plan.get('previous_filename') not in (None, plan['filename']):
+                    row['previous_filename'] = plan['previous_filename']
+                files.append(row)
+                writer.write(lines[0], start)
+                if plan['reason']:
+                    row['summarized'] = plan['reason']
+                    summary = SUMMARY_TEXTS[plan['reason']].format(**plan['detail'])
+                    if plan['additions'] or plan['deletions']:
+                        summary += f", +{plan['additions']}/-{plan['deletions']} lines"
+                    writer.write(f"# compacted: {summary}; see {diff_path.name} lines {plan['start']}-{plan['end']}",
+                                 start)
+                else:
+                    for offset, line in enumerate(lines[1:], 1):
+                        if not line.startswith('index '):
+                            writer.write(line, start + offset)
+                    if plan['whitespace_hunks']:
+                        row['whitespace_hunks'] = len(plan['whitespace_hunks'])
+                        writer.write(f"# compacted: {len(plan['whitespace_hunks'])} whitespace-only hunk(s) omitted",
+                                     start)
+            elif kind == 'hunk' and not plan['reason']:
+                if hunk_index not in plan['whitespace_hunks']:
+                    for header, indexes in trim_hunk(lines, context_lines):
+                        if header is not None:
+                            writer.write(header, start)
+                        for i in indexes:
+                            writer.write(lines[i], start + i)
+                hunk_index += 1
+            files[-1]['compact'][1] = writer.line
+
+    mapping = {
+        'version': COMPACTION_VERSION,
+        'source': diff_path.name,
+        'source_size': stat.st_size,
+        'source_mtime_ns': stat.st_mtime_ns,
+        'context_lines': context_lines,
+        'original_lines': original_lines,
+        'original_bytes': stat.st_size if not diff_path.name.endswith('.gz') else None,
+        'compact_lines': writer.line,
+        'compact_bytes': writer.bytes,
+        'summarized': sum(1 for row in files if row.get('summarized')),
+        'files': files,
+        # [compact line, original line, count]: runs of compact lines and the original lines they stand for
+        'lines': writer.runs
+    }
+    map_tmp = map_path.with_name(map_path.name + '.tmp')
+    with open(map_tmp, 'w') as f:
+        json.dump(mapping, f, separators=(',', ':'))
+    os.replace(tmp_path, compact_path)
+    os.replace(map_tmp, map_path)
+    return mapping
+
+
+def load_compaction(diff_path, context_lines=None):
+    """Mapping of the compact diff if it is current for `diff_path`, else None."""
+    compact_path, map_path = compact_paths(diff_path)
+    try:
+        with open(map_path) as f:
+            mapping = json.load(f)
+        stat = os.stat(diff_path)
+        if not compact_path.exists():
+            return None
+    except (OSError, ValueError):
+        return None
+    if (mapping.get('version') != COMPACTION_VERSION or mapping.get('source_size') != stat.st_size
+            or mapping.get('source_mtime_ns') != stat.st_mtime_ns):
+        return None
+    if context_lines is not None and mapping.get('context_lines') != context_lines:
+        return None
+    return mapping
+
+
+def original_line(mapping, compact_line):
+    """Line of the original diff a compact line stands for, or None (compaction notes)."""
+    runs = mapping['lines']
+    position = bisect.bisect_right([run[0] for run in runs], compact_line) - 1
+    if position < 0:
+        return None
+    compact_start, original_start, count = runs[position]
+    if compact_line >= compact_start + count:
+        return None
+    return original_start + compact_line - compact_start
+
+
+def main():
+    """Compact a PR diff and report the savings."""
+    parser = argparse.ArgumentParser(description="Write a compact version of a PR diff for prompts")
+    parser.add_argument("diff", help="Path to pr_N.diff (or pr_N.diff.gz)")
+    parser.add_argument("--context-lines", type=int, default=DEFAULT_CONTEXT_LINES,
+                        help=f"Context lines kept around changes (default: {DEFAULT_CONTEXT_LINES})")
+    parser.add_argument("--original", type=int, metavar="LINE",
+                        help="Print the original diff line a compact diff line came from")
+
+    args = parser.parse_args()
+
+    try:
+        mapping = load_compaction(args.diff, args.context_lines)
+        if mapping is None:
+            mapping = compact_diff(args.diff, args.context_lines)
+        compact_path, map_path = compact_paths(args.diff)
+        if args.original is not None:
+            line = original_line(mapping, args.original)
+            if line is None:
+                print(f"❌ Line {args.original} of {compact_path.name} does not come from the original diff")
+                return 1
+            print(line)
+            return 0
+        saved = 100 - 100 * mapping['compact_lines'] / max(mapping['original_lines'], 1)
+        print(f"✅ {compact_path}: {mapping['original_lines']} -> {mapping['compact_lines']} lines ({saved:.0f}% fewer), "
+              f"{mapping['summarized']} of {len(mapping['files'])} files summarized")
+        for row in mapping['files']:
+            if row.get('summarized'):
+                print(f"  🗜️  {row['filename']}: {row['summarized']}")
+        return 0
+    except Exception as e:
+        print(f"❌ Error compacting diff: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Diff Index - Sidecar index over a saved PR diff for lookups without re-parsing.
+
+The index (pr_N.diff.idx.json) records, for every file section of the diff:
+1. Byte offsets of the file header and of each hunk
+2. Hunk line ranges (old/new start and length) and add/delete counts
+3. The function context git prints after each hunk header (`@@ ... @@ def foo():`)
+
+Lookups (files, hunks, functions touched) are dictionary accesses on the loaded
+index; patch text is sliced out of an mmap of the diff, so nothing is rescanned.
+
+Usage:
+    python3 diff_index.py pr_workspace/pr_58365.diff --summary
+    python3 diff_index.py pr_workspace/pr_58365.diff --functions
+    python3 diff_index.py pr_workspace/pr_58365.diff --file airflow/models/dag.py
+"""
+
+import argparse
+import json
+import mmap
+import os
+import re
+import sys
+
+from diff_parser import apply_extended_header, finish_section_paths, new_file_section
+
+INDEX_VERSION = 1
+HUNK_HEADER_RE = re.compile(rb'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)$')
+# Symbol names in git's function context for the languages we usually benchmark
+SYMBOL_RE = re.compile(
+    r'^\s*(?:(?:export|default|public|private|protected|internal|static|async|abstract|final|override|pub|unsafe)\s+)*'
+    r'(?:def|class|func|function|fn|interface|struct|enum|trait|impl|type|module|resource)\s+'
+    r'(?:\([^)]*\)\s*)?"?([A-Za-z_][\w.$-]*)'
+)
+# C/Java style signatures: return type tokens, then name(
+SIGNATURE_RE = re.compile(r'^\s*(?:[\w:<>\[\],*&]+\s+)+\**([A-Za-z_]\w*)\s*\([^;=]*$')
+
+
+def index_path_for(diff_path):
+    """Path of the sidecar index for a diff file."""
+    return f"{diff_path}.idx.json"
+
+
+def symbol_from_context(context):
+    """Extract the enclosing symbol name from a hunk header's function context."""
+    if not context:
+        return None
+    match = SYMBOL_RE.match(context) or SIGNATURE_RE.match(context)
+    return match.group(1) if match else None
+
+
+def build_diff_index(diff_path):
+    """Scan a diff once and write its sidecar index. Returns the index dict."""
+    files = []
+    section = None
+    hunk = None
+    offset = 0
+
+    def close_hunk():
+        if hunk is not None:
+            hunk['end'] = offset
+            section['hunks'].append(hunk)
+
+    def close_section():
+        close_hunk()
+        section['end'] = offset
+        files.append(finish_section_paths(section))
+
+    with open(diff_path, 'rb') as f:
+        for line in f:
+            if line.startswith(b'diff --git '):
+                if section:
+                    close_section()
+                section = new_file_section(line.decode('utf-8', errors='replace'))
+                section.update(start=offset, hunks=[])
+                hunk = None
+            elif section is None:
+                pass
+            elif line.startswith(b'@@'):
+                close_hunk()
+                hunk = None
+                match = HUNK_HEADER_RE.match(line.rstrip(b'\r\n'))
+                if match:
+                    old_start, old_lines, new_start, new_lines, context = match.groups()
+                    context = context.decode('utf-8', errors='replace').strip()
+                    hunk = {
+                        'start': offset,
+                        'old_start': int(old_start), 'old_lines': int(old_lines if old_lines is not None else 1),
+                        'new_start': int(new_start), 'new_lines': int(new_lines if new_lines is not None else 1),
+                        'context': context, 'symbol': symbol_from_context(context),
+                        'additions': 0, 'deletions': 0
+                    }
+            elif hunk is not None:
+                if line.startswith(b'+'):
+                    hunk['additions'] += 1
+                    section['additions'] += 1
+                elif line.startswith(b'-'):
+                    hunk['deletions'] += 1
+                    section['deletions'] += 1
+            else:
+                # Extended header lines (shared with diff_parser so both read headers alike)
+                apply_extended_header(section, line.decode('utf-8', errors='replace'))
+            offset += len(line)
+        if section:
+            close_section()
+
+    # Symbol -> [[file index, hunk index], ...] so "which function changed" is one lookup
+    functions = {}
+    for file_index, entry in enumerate(files):
+        for hunk_index, hunk_entry in enumerate(entry['hunks']):
+            if hunk_entry['symbol']:
+                functions.setdefault(hunk_entry['symbol'], []).append([file_index, hunk_index])
+
+    stat = os.stat(diff_path)
+    index = {
+        'version': INDEX_VERSION,
+        'diff_size': stat.st_size,
+        'diff_mtime_ns': stat.st_mtime_ns,
+        'file_count': len(files),
+        'hunk_count': sum(len(entry['hunks']) for entry in files),
+        'additions': sum(entry['additions'] for entry in files),
+        'deletions': sum(entry['deletions'] for entry in files),
+        'files': files,
+        'functions': functions
+    }
+
+    index_path = index_path_for(diff_path)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, separators=(',', ':'))
+    os.replace(tmp_path, index_path)
+    return index
+
+
+class DiffIndex:
+    """Read-only view of a diff through its sidecar index and an mmap of the diff."""
+
+    def __init__(self, diff_path, index):
+        self.diff_path = str(diff_path)
+        self.index = index
+        self._by_file = {}
+        for file_index, entry in enumerate(index['files']):
+            self._by_file[entry['filename']] = file_index
+            if entry.get('previous_filename'):
+                self._by_file.setdefault(entry['previous_filename'], file_index)
+        self._file = None
+        self._mmap = None
+
+    @classmethod
+    def load(cls, diff_path, rebuild=True):
+        """Load the index for a diff, (re)building it when missing or stale."""
+        diff_path = str(diff_path)
+        index = None
+        try:
+            with open(index_path_for(diff_path)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        stat = os.stat(diff_path)
+        stale = (index is None or index.get('version') != INDEX_VERSION
+                 or index.get('diff_size') != stat.st_size or index.get('diff_mtime_ns') != stat.st_mtime_ns)
+        if stale:
+            if not rebuild:
+                raise Exception(f"Diff index for {diff_path} is missing or out of date")
+            index = build_diff_index(diff_path)
+        return cls(diff_path, index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = self._file = None
+
+    def _view(self):
+        # mmap rejects empty files
+        if self.index['diff_size'] == 0:
+            return b''
+        if self._mmap is None:
+            self._file = open(self.diff_path, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    @property
+    def file_count(self):
+        return self.index['file_count']
+
+    def filenames(self):
+        return [entry['filename'] for entry in self.index['files']]
+
+    def file_entry(self, filename):
+        """Index entry (status, counts, offsets, hunks) for a file, or None."""
+        file_index = self._by_file.get(filename)
+        return None if file_index is None else self.index['files'][file_index]
+
+    def file_patch(self, filename):
+        """Full diff section (header and hunks) for one file."""
+        entry = self.file_entry(filename)
+        if entry is None:
+            return None
+        return self._view()[entry['start']:entry['end']].decode('utf-8', errors='replace')
+
+    def hunk_text(self, filename, hunk_index):
+        entry = self.file_entry(filename)
+        hunk = entry['hunks'][hunk_index]
+        return self._view()[hunk['start']:hunk['end']].decode('utf-8', errors='replace')
+
+    def functions(self):
+        """Names of the functions/classes whose bodies were touched, per git's hunk context."""
+        return list(self.index['functions'])
+
+    def function_hunks(self, symbol):
+        """[(filename, hunk entry), ...] for every hunk inside `symbol`."""
+        files = self.index['files']
+        return [(files[f]['filename'], files[f]['hunks'][h]) for f, h in self.index['functions'].get(symbol, [])]
+
+    def files_for_function(self, symbol):
+        return sorted({filename for filename, _ in self.function_hunks(symbol)})
+
+
+def main():
+    """Build or query the sidecar index of a PR diff."""
+    parser = argparse.ArgumentParser(description="Build and query the hunk index of a PR diff")
+    parser.add_argument("diff", help="Path to pr_N.diff")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index even if it is current")
+    parser.add_argument("--summary", action="store_true", help="Print file/hunk/line counts")
+    parser.add_argument("--functions", action="store_true", help="List functions touched by the diff")
+    parser.add_argument("--function", help="Show the files and hunks touching one function")
+    parser.add_argument("--file", help="Print the diff section of one file")
+
+    args = parser.parse_args()
+
+    try:
+        if args.rebuild:
+            build_diff_index(args.diff)
+        with DiffIndex.load(args.diff) as index:
+            if args.functions:
+                for symbol in index.functions():
+                    print(f"{symbol}\t{', '.join(index.files_for_function(symbol))}")
+            if args.function:
+                for filename, hunk in index.function_hunks(args.function):
+                    print(f"{filename}:{hunk['new_start']}-{hunk['new_start'] + max(hunk['new_lines'] - 1, 0)} "
+                          f"(+{hunk['additions']} -{hunk['deletions']}) {hunk['context']}")
+            if args.file:
+                patch = index.file_patch(args.file)
+                if patch is None:
+                    print(f"❌ {args.file} is not part of the diff")
+                    return 1
+                sys.stdout.write(patch)
+            if args.summary or not (args.functions or args.function or args.file):
+                print(f"📊 {index.file_count} files, {index.index['hunk_count']} hunks, "
+                      f"+{index.index['additions']} -{index.index['deletions']}, "
+                      f"{len(index.index['functions'])} functions touched")
+        return 0
+    except Exception as e:
+        print(f"❌ Error indexing diff: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
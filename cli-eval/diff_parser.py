@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Unified Diff Parser - Split git/GitHub unified diffs into per-file sections.
+
+The parser works line by line so multi-hundred-MB diffs can be processed with
+memory bounded by the largest single file section. Each section is reported in
+the same shape as GitHub's `/pulls/N/files` entries (filename, status,
+additions, deletions, patch) so locally derived data is interchangeable with
+API data.
+"""
+
+import re
+
+DIFF_HEADER_RE = re.compile(r'^diff --git (?:"?a/)(.*?)"? (?:"?b/)(.*?)"?$')
+# First line of the per-file summary the fetcher writes instead of a diff above its size cap
+DIFF_SUMMARY_HEADER = "# PR #{pr_number} diff is {size}, above the {cap} cap; full patch omitted.\n"
+DIFF_SUMMARY_RE = re.compile(r'^# PR #\d+ diff is .*, above the .* cap; full patch omitted\.$')
+
+
+def is_diff_summary(first_line):
+    """Whether a diff file starting with `first_line` (str or bytes) is a summary, not a patch."""
+    if isinstance(first_line, bytes):
+        first_line = first_line.decode('utf-8', errors='replace')
+    return bool(DIFF_SUMMARY_RE.match(first_line.rstrip('\n')))
+
+
+def split_header_paths(line):
+    """Best-effort extraction of (old, new) paths from a `diff --git` header."""
+    match = DIFF_HEADER_RE.match(line.rstrip('\n'))
+    if not match:
+        return None, None
+    old_path, new_path = match.group(1), match.group(2)
+    # Unquoted paths containing spaces are ambiguous; unchanged paths split evenly
+    body = line.rstrip('\n')[len('diff --git '):]
+    half = (len(body) - 1) // 2
+    if body[:half].startswith('a/') and body[half + 1:].startswith('b/') and body[2:half] == body[half + 3:]:
+        old_path = new_path = body[2:half]
+    return old_path, new_path
+
+
+def new_file_section(header_line):
+    """Initial state of a file section from its `diff --git` header line."""
+    old_path, new_path = split_header_paths(header_line)
+    return {
+        'filename': new_path,
+        'previous_filename': old_path,
+        'status': 'modified',
+        'additions': 0,
+        'deletions': 0,
+        'binary': False
+    }
+
+
+def apply_extended_header(section, line):
+    """Update a section from an extended header line (before its first hunk)."""
+    if line.startswith('new file mode'):
+        section['status'] = 'added'
+    elif line.startswith('deleted file mode'):
+        section['status'] = 'removed'
+    elif line.startswith('rename from '):
+        section['status'] = 'renamed'
+        section['previous_filename'] = line[len('rename from '):].rstrip('\n')
+    elif line.startswith('rename to '):
+        section['filename'] = line[len('rename to '):].rstrip('\n')
+    elif line.startswith('copy from '):
+        section['status'] = 'copied'
+        section['previous_filename'] = line[len('copy from '):].rstrip('\n')
+    elif line.startswith('copy to '):
+        section['filename'] = line[len('copy to '):].rstrip('\n')
+    elif line.startswith('Binary files ') or line.startswith('GIT binary patch'):
+        section['binary'] = True
+    elif line.startswith('+++ ') and line[4:].startswith('b/'):
+        section['filename'] = line[6:].rstrip('\n')
+    elif line.startswith('--- ') and line[4:].startswith('a/'):
+        section['previous_filename'] = line[6:].rstrip('\n')
+
+
+def finish_section_paths(section):
+    """Drop previous_filename unless the file was renamed or copied."""
+    if section['previous_filename'] in (None, section['filename']):
+        section.pop('previous_filename')
+    return section
+
+
+def _finish_section(section):
+    """Turn accumulated section state into a files-list entry."""
+    patch_lines = section.pop('patch_lines')
+    section['patch'] = ''.join(patch_lines).rstrip('\n')
+    return finish_section_paths(section)
+
+
+def iter_lines_from_chunks(chunks, encoding='utf-8'):
+    """Turn a stream of byte chunks into text lines (newlines kept)."""
+    pending = b''
+    for chunk in chunks:
+        pending += chunk
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode(encoding, errors='replace') + '\n'
+    if pending:
+        yield pending.decode(encoding, errors='replace')
+
+
+def iter_file_diffs(lines, keep_patch=True):
+    """Yield one entry per file in a unified diff.
+
+    Entries have filename, status (added/removed/modified/renamed/copied),
+    additions, deletions, binary, patch and, for renames and copies,
+    previous_filename. With keep_patch=False the patch text is not collected,
+    so memory stays flat even for enormous single-file sections.
+    """
+    section = None
+    in_hunks = False
+
+    for line in lines:
+        if line.startswith('diff --git '):
+            if section:
+                yield _finish_section(section)
+            section = new_file_section(line)
+            section['patch_lines'] = []
+            in_hunks = False
+            continue
+
+        if section is None:
+            continue
+
+        if line.startswith('@@'):
+            in_hunks = True
+            if keep_patch:
+                section['patch_lines'].append(line)
+            continue
+
+        if in_hunks:
+            if line.startswith('+'):
+                section['additions'] += 1
+            elif line.startswith('-'):
+                section['deletions'] += 1
+            if keep_patch:
+                section['patch_lines'].append(line)
+            continue
+
+        # Extended header lines before the first hunk
+        apply_extended_header(section, line)
+
+    if section:
+        yield _finish_section(section)
@@ -4,24 +4,71 @@ Dynamic Prompt Generator for iFlow CLI
 
 Automatically generates the initial context prompt based on PR workspace data.
 The prompt is dynamically adapted for any PR being evaluated.
+
+With a token budget, the highest-value context (description, diff hunks, changed
+functions, related tests) is packed into the prompt itself, with summaries for
+what does not fit, so fewer exploratory turns are needed.
+
+Files outside the PR that share the most identifiers with the diff (BM25
+over related_index/) are listed with a matching line, so iFlow knows about
+likely callers, tests and configuration without grepping.
+
+When call_graph.md exists, the prompt points iFlow at the callers and callees
+of the changed functions (call_graph.py) instead of grepping for usages.
+
+The diff is compacted first (trimmed context, noise files summarized) and the
+prompt points iFlow at the compact diff; the full diff stays in the workspace.
+
+The prompt is deterministic and ordered from stable to volatile: fixed
+instructions, then the repository, then the PR, with the packed context last.
+Every resumed benchmark turn re-sends the conversation, so this keeps the
+longest possible prefix cacheable by the model provider.
 """
 
 import json
 from pathlib import Path
 
+from call_graph import GRAPH_MD_NAME
+from diff_compactor import compact_diff, compact_paths, load_compaction
+from prompt_packer import estimate_tokens, pack_context
+from related_files import DEFAULT_TOP_K as DEFAULT_RELATED_FILES, INDEX_DIR_NAME as RELATED_INDEX_DIR_NAME
+from related_files import find_related_files
+
+# Fixed opening of every prompt; keep it free of PR data so it stays a cacheable prefix
+STABLE_INSTRUCTIONS = """You are helping me evaluate a GitHub pull request. The repository and the PR's context files \
+are in the current directory; the pull request is described at the end of this message.
+
+**Instructions:**
+- Explore the complete repository when needed for thorough answers
+- Look at related files, tests, documentation, and examples
+- Provide specific details: file paths, function names, code snippets
+- Connect changes to broader codebase context
+- Use ONLY the local files in this repository
+- Only say "I don't know" after thorough exploration
+
+**When ready to answer questions, reply with exactly:**
+READY_FOR_QUESTIONS
+"""
+
+
 class DynamicPromptGenerator:
     """Generates dynamic initial prompts based on PR workspace data."""
     
-    def __init__(self, pr_workspace_dir):
+    def __init__(self, pr_workspace_dir, token_budget=None, compact_diff=True, related_files=DEFAULT_RELATED_FILES):
         self.pr_workspace_dir = Path(pr_workspace_dir)
         self.pr_info = None
         self.repo_name = None
         self.pr_number = None
+        self.token_budget = token_budget
+        self.pack_report = None
+        self.prefix_tokens = 0
+        self.compact_diff = compact_diff
+        self.related_files = related_files
         
     def load_pr_metadata(self):
         """Load PR metadata from workspace."""
         # Find PR info file
-        pr_info_files = list(self.pr_workspace_dir.glob("pr_*_info.json"))
+        pr_info_files = sorted(self.pr_workspace_dir.glob("pr_*_info.json"))
         if not pr_info_files:
             raise FileNotFoundError("No PR info file found in workspace")
         
@@ -38,26 +85,42 @@ class DynamicPromptGenerator:
         files = {
             'pr_desc': None,
             'pr_diff': None,
+            'compact_diff': None,
             'pr_context': None,
             'pr_files': None,
+            'context_pack': None,
+            'call_graph': None,
             'repo_dir': None
         }
         
         # Find PR description/context file
-        context_files = list(self.pr_workspace_dir.glob("pr_*_context.md"))
+        context_files = sorted(self.pr_workspace_dir.glob("pr_*_context.md"))
         if context_files:
             files['pr_context'] = context_files[0].name
         
         # Find PR diff file
-        diff_files = list(self.pr_workspace_dir.glob("pr_*.diff"))
+        diff_files = ([p for p in sorted(self.pr_workspace_dir.glob("pr_*.diff"))
+                       if not p.name.endswith("_compact.diff")]
+                      or sorted(self.pr_workspace_dir.glob("pr_*.diff.gz")))
         if diff_files:
             files['pr_diff'] = diff_files[0].name
+            compact_file, _ = compact_paths(diff_files[0])
+            if self.compact_diff and load_compaction(diff_files[0]) is not None:
+                files['compact_diff'] = compact_file.name
         
         # Find PR files list
-        files_list = list(self.pr_workspace_dir.glob("pr_*_files.json"))
+        files_list = sorted(self.pr_workspace_dir.glob("pr_*_files.json"))
         if files_list:
             files['pr_files'] = files_list[0].name
         
+        # Find the context pack's table of contents
+        if (self.pr_workspace_dir / "context_pack" / "TOC.md").exists():
+            files['context_pack'] = "context_pack/TOC.md"
+        
+        # Find the call graph of the changed functions
+        if (self.pr_workspace_dir / GRAPH_MD_NAME).exists():
+            files['call_graph'] = GRAPH_MD_NAME
+        
         # Find repository directory
         repo_dir = self.pr_workspace_dir / self.repo_name
         if repo_dir.exists():
@@ -65,15 +128,25 @@ class DynamicPromptGenerator:
         
         return files
     
-    def get_changed_files_list(self):
-        """Get list of changed files from PR files JSON."""
-        files_list = list(self.pr_workspace_dir.glob("pr_*_files.json"))
-        if not files_list:
-            return []
+    def iter_changed_files_data(self):
+        """Iterate over changed file entries, streaming the JSONL list when available."""
+        jsonl_files = sorted(self.pr_workspace_dir.glob("pr_*_files.jsonl"))
+        if jsonl_files:
+            with open(jsonl_files[0]) as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            return
         
-        try:
+        files_list = sorted(self.pr_workspace_dir.glob("pr_*_files.json"))
+        if files_list:
             with open(files_list[0]) as f:
-                files_data = json.load(f)
+                yield from json.load(f)
+    
+    def get_changed_files_list(self):
+        """Get list of changed files from PR files JSONL/JSON."""
+        try:
+            files_data = self.iter_changed_files_data()
             
             changed_files = []
             for file_info in files_data:
@@ -82,14 +155,43 @@ class DynamicPromptGenerator:
                 elif isinstance(file_info, str):
                     changed_files.append(file_info)
             
-            return changed_files[:10]  # Limit to first 10 files for prompt brevity
+            # Sorted so the prompt does not depend on the API's page order; first 10 for brevity
+            return sorted(changed_files)[:10]
         except:
             return []
     
+    def get_related_files(self):
+        """Files outside the PR most related to its diff, from the workspace's BM25 index."""
+        if not self.related_files or not (self.pr_workspace_dir / RELATED_INDEX_DIR_NAME / "index.json").exists():
+            return []
+        try:
+            return find_related_files(self.pr_workspace_dir, self.related_files)
+        except Exception as e:
+            print(f"⚠️  Related-files lookup failed: {e}")
+            return []
+    
+    def compact_workspace_diff(self):
+        """Write the compact diff next to the PR diff unless it is already current."""
+        diff_files = ([p for p in self.pr_workspace_dir.glob("pr_*.diff") if not p.name.endswith("_compact.diff")]
+                      or list(self.pr_workspace_dir.glob("pr_*.diff.gz")))
+        if not diff_files or load_compaction(diff_files[0]) is not None:
+            return
+        mapping = compact_diff(diff_files[0])
+        print(f"🗜️  Compacted {diff_files[0].name}: {mapping['original_lines']} -> {mapping['compact_lines']} lines, "
+              f"{mapping['summarized']} files summarized")
+    
     def generate_dynamic_prompt(self):
-        """Generate the dynamic initial context prompt."""
+        """Generate the dynamic initial context prompt.
+        
+        Parts shared across PRs come first so the provider's prefix cache can reuse them:
+        the fixed instructions, then the repository, then this PR, and the packed context
+        (which depends on the token budget) last. Lists are sorted so regenerating the
+        prompt gives byte-identical output.
+        """
         # Load metadata
         self.load_pr_metadata()
+        if self.compact_diff:
+            self.compact_workspace_diff()
         files = self.find_workspace_files()
         changed_files = self.get_changed_files_list()
         
@@ -98,15 +200,47 @@ class DynamicPromptGenerator:
         repo = self.pr_info.get('repo', 'unknown')
         pr_title = self.pr_info.get('title', 'Unknown PR')
         
-        # Build the dynamic prompt with local file paths (files will be copied to repo directory)
-        prompt = f"""You are helping me evaluate GitHub pull request {owner}/{repo} #{self.pr_number}.
+        extra_steps = []
+        if files['context_pack']:
+            extra_steps.append(f"Use `{files['context_pack']}`: it links small files with the before/after version of "
+                               f"each changed file, the changed functions and related tests - read those before "
+                               f"searching the repository")
+        if files['call_graph']:
+            extra_steps.append(f"Use `{files['call_graph']}` for the callers and callees of each changed function "
+                               f"before searching for usages")
+        pack_step = ''.join(f"{i}. {step}\n" for i, step in enumerate(extra_steps, 4))
+        
+        diff_file = files['compact_diff'] or files['pr_diff']
+        diff_location = f"- PR diff: `{files['pr_diff']}` (in current directory)"
+        if files['compact_diff']:
+            diff_location = (f"- PR diff: `{files['compact_diff']}` (compact: trimmed context, lockfile/generated/"
+                             f"vendored/binary/whitespace-only changes and pure renames summarized; "
+                             f"full diff: `{files['pr_diff']}`)")
+        
+        # Stable prefix: identical for every PR of the repository
+        prompt = STABLE_INSTRUCTIONS + f"""
+**Repository:** {owner}/{repo}
+- Repository: `{files['repo_dir']}/` (complete repository codebase)
+- Changed files: Look in `{files['repo_dir']}/` using paths from diff
+"""
+        self.prefix_tokens = estimate_tokens(prompt)
+        
+        # Build the PR part with local file paths (files will be copied to repo directory)
+        prompt += f"""
+## Pull Request #{self.pr_number}
 
 **PR Title:** {pr_title}
 
 **Your Task:**
 1. First, read the file `{files['pr_context']}` to understand the PR context
-2. Then, read the file `{files['pr_diff']}` to see what changed  
+2. Then, read the file `{diff_file}` to see what changed  
 3. Based on the diff, examine the actual changed files in the current directory
+{pack_step}
+**File locations:**
+- PR context: `{files['pr_context']}` (in current directory)
+{diff_location}
+- Context pack: `{files['context_pack'] or 'not generated'}` (base/head files, changed functions, tests)
+- Call graph: `{files['call_graph'] or 'not generated'}` (callers/callees of the changed functions)
 
 **Key files that were changed in this PR:**"""
 
@@ -117,25 +251,34 @@ class DynamicPromptGenerator:
         else:
             prompt += f"\n(Use the diff file to identify changed files)"
 
-        prompt += f"""
-
-**File locations:**
-- PR context: `{files['pr_context']}` (in current directory)
-- PR diff: `{files['pr_diff']}` (in current directory)
-- Repository: `{files['repo_dir']}/` (complete repository codebase)
-- Changed files: Look in `{files['repo_dir']}/` using paths from diff
+        related_files = self.get_related_files()
+        if related_files:
+            prompt += ("\n\n**Related files outside the PR** (share the most identifiers with the diff - "
+                       "likely callers, tests or configuration):")
+            for i, related in enumerate(related_files, 1):
+                prompt += f"\n{i}. {related['path']}"
+                if related['snippets']:
+                    line_number, text = related['snippets'][0]
+                    prompt += f" - line {line_number}: `{text.replace('`', chr(39))}`"
 
-**Instructions:**
-- Explore the complete repository when needed for thorough answers
-- Look at related files, tests, documentation, and examples
-- Provide specific details: file paths, function names, code snippets
-- Connect changes to broader codebase context
-- Use ONLY the local files in this repository
-- Only say "I don't know" after thorough exploration
-
-**When ready to answer questions, reply with exactly:**
-READY_FOR_QUESTIONS"""
+        prompt += "\n\n"
+        tail = "Reply with exactly READY_FOR_QUESTIONS once you have read the PR context."
 
+        return self.pack_prompt(prompt, tail)
+    
+    def pack_prompt(self, frame, tail):
+        """Join the prompt frame, the context units that fit the token budget and the closing tail."""
+        if not self.token_budget:
+            self.pack_report = None
+            return frame + tail
+        
+        header = "**Pre-loaded context** (already read for you - no need to open these files again):\n"
+        remaining = self.token_budget - estimate_tokens(frame + tail) - estimate_tokens(header + "\n")
+        changed_files = [f for f in self.iter_changed_files_data() if isinstance(f, dict)]
+        packed, self.pack_report = pack_context(self.pr_workspace_dir, self.pr_info, changed_files, remaining)
+        self.pack_report['budget'] = self.token_budget
+        prompt = frame + (f"{header}{packed}\n" if packed else "") + tail
+        self.pack_report['used'] = estimate_tokens(prompt)
         return prompt
     
     def save_generated_prompt(self, output_file):
@@ -180,11 +323,18 @@ def main():
                        help="Output file for generated prompt")
     parser.add_argument("--summary", action="store_true",
                        help="Show prompt summary only")
+    parser.add_argument("--token-budget", type=int,
+                       help="Pack the most useful PR context into the prompt, up to this many tokens (estimated)")
+    parser.add_argument("--related-files", type=int, default=DEFAULT_RELATED_FILES,
+                       help=f"Related files outside the PR to list (default: {DEFAULT_RELATED_FILES}, 0 disables)")
+    parser.add_argument("--full-diff", action="store_true",
+                       help="Point iFlow at the full diff instead of the compact one")
     
     args = parser.parse_args()
     
     try:
-        generator = DynamicPromptGenerator(args.workspace)
+        generator = DynamicPromptGenerator(args.workspace, token_budget=args.token_budget,
+                                           compact_diff=not args.full_diff, related_files=args.related_files)
         
         if args.summary:
             summary = generator.get_prompt_summary()
@@ -206,6 +356,11 @@ def main():
                 print("=" * 60)
                 print(prompt)
                 print("\n🚀 Next step: Run iflow_pr_benchmark.py")
+            print(f"🧊 Stable prefix: ~{generator.prefix_tokens} tokens shared by every PR of the repository")
+            report = generator.pack_report
+            if report:
+                print(f"📏 Prompt uses ~{report['used']}/{report['budget']} tokens: {report['full']} context units "
+                      f"in full, {report['summarized']} summarized, {report['dropped']} dropped")
                 
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -11,20 +11,43 @@ This script:
 """
 
 import argparse
+import fcntl
+import gzip
 import json
 import os
+import posixpath
+import shlex
 import subprocess
 import sys
 import tempfile
+import time
 from pathlib import Path
 from urllib.parse import urlparse
-import requests
 import shutil
+from contextlib import contextmanager
+
+from call_graph import GRAPH_MD_NAME, build_call_graph, default_cache_dir as call_graph_cache_dir, load_call_graph
+from code_search import INDEX_DIR_NAME as CODE_INDEX_DIR_NAME, CodeSearchIndex
+from diff_index import DiffIndex, build_diff_index
+from diff_parser import DIFF_SUMMARY_HEADER, iter_file_diffs, iter_lines_from_chunks
+from git_progress import format_bytes, run_git_with_progress
+from context_pack import PACK_DIR_NAME, TOC_NAME, build_context_pack
+from related_files import INDEX_DIR_NAME as RELATED_INDEX_DIR_NAME, RelatedFilesIndex
+from symbol_index import SymbolIndex, build_symbol_index
+from github_api_client import DEFAULT_HTTP_CACHE_DIR, PRIORITY_BULK, GitHubAPIClient
+from workspace_manifest import check_workspace, write_manifest
+from workspace_snapshot import export_snapshot, import_snapshot, read_snapshot_metadata
+
+DEFAULT_MIRROR_CACHE_DIR = Path.home() / ".cache" / "iflow-pr-benchmark" / "mirrors"
+DEFAULT_MAX_DIFF_MB = 100
+DIFF_PROGRESS_INTERVAL = 0.5
 
 class EnhancedGitHubPRFetcher:
     """Enhanced fetcher that clones the full repository."""
     
-    def __init__(self, repo_url, pr_number, output_dir):
+    def __init__(self, repo_url, pr_number, output_dir, mirror_cache=None, sparse=False, api_client=None,
+                 local_diff=True, offline=False, refresh_mirror=True, max_diff_mb=DEFAULT_MAX_DIFF_MB,
+                 compress_diff=False, reuse_workspace=True, code_index=True, call_graph=True):
         self.repo_url = repo_url
         self.pr_number = pr_number
         self.output_dir = Path(output_dir)
@@ -37,10 +60,43 @@ class EnhancedGitHubPRFetcher:
             repo_path = repo_url
         
         self.owner, self.repo_name = repo_path.split('/')
-        self.api_base = f"https://api.github.com/repos/{self.owner}/{self.repo_name}"
+        # Pooled API client (shared between fetchers in batch modes)
+        self.api = api_client or GitHubAPIClient()
+        self.api_base = self.api.repo_url(self.owner, self.repo_name)
         self.clone_url = f"https://github.com/{self.owner}/{self.repo_name}.git"
         self.repo_dir = self.output_dir / self.repo_name
         
+        # Per-phase timings/throughput of every progress-reporting git command
+        self.git_phase_stats = []
+        
+        # Optional shared bare mirror (one per owner/repo) that workspaces borrow objects from
+        self.mirror_dir = None
+        if mirror_cache:
+            self.mirror_dir = Path(mirror_cache).expanduser().resolve() / self.owner / f"{self.repo_name}.git"
+        
+        self.refresh_mirror = refresh_mirror
+        
+        # Blobless partial clone with a sparse checkout limited to the PR's changed areas
+        self.sparse = sparse
+        
+        # Derive diff/files from local git objects when possible; offline never touches the network
+        self.local_diff = local_diff or offline
+        self.offline = offline
+        
+        # Diffs above the cap are replaced by a per-file summary; 0/None disables the cap
+        self.max_diff_bytes = int(max_diff_mb * 1024 * 1024) if max_diff_mb else None
+        self.compress_diff = compress_diff
+        self.diff_summarized = False
+        
+        # Skip stages that workspace_manifest.json shows are still valid
+        self.reuse_workspace = reuse_workspace
+        
+        # Trigram code-search index over the checkout, stored in the workspace
+        self.code_index = code_index
+        
+        # Callers/callees of the changed functions (parses every Python file of the head once)
+        self.call_graph = call_graph
+        
         print(f"📋 Enhanced PR fetching for #{pr_number} from {self.owner}/{self.repo_name}")
     
     def run_git_command(self, cmd, cwd=None, show_progress=False):
@@ -53,74 +109,17 @@ class EnhancedGitHubPRFetcher:
         if show_progress:
             # For long-running commands, show clean progress like normal terminal
             try:
-                import sys
-                import time
-                
-                # Run command and capture output line by line
-                process = subprocess.Popen(
-                    cmd, shell=True, cwd=cwd,
-                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                    universal_newlines=True, bufsize=1
+                display = {'progress_line': "", 'last_update': 0.0}
+                result = run_git_with_progress(
+                    cmd, cwd=cwd, on_event=lambda event: self._render_git_event(event, display)
                 )
+                if display['progress_line']:
+                    print()  # Final newline after progress
                 
-                last_progress_line = ""
+                self.git_phase_stats.extend(result['phase_stats'])
                 
-                last_update_time = time.time()
-                
-                while True:
-                    line = process.stdout.readline()
-                    
-                    if line:
-                        line = line.strip()
-                        
-                        # Skip empty lines
-                        if not line:
-                            continue
-                        
-                        current_time = time.time()
-                        
-                        # Handle git progress lines (show clean updates with throttling)
-                        if any(keyword in line.lower() for keyword in [
-                            'receiving objects:', 'resolving deltas:', 
-                            'counting objects:', 'compressing objects:'
-                        ]):
-                            # Only update progress every 2 seconds to avoid spam
-                            if current_time - last_update_time >= 2.0:
-                                # Clear previous progress line and show new one
-                                if last_progress_line:
-                                    print(f"\r{' ' * 100}", end='')  # Clear line
-                                print(f"\r  📦 {line}", end='', flush=True)
-                                last_progress_line = line
-                                last_update_time = current_time
-                        elif 'cloning into' in line.lower():
-                            if last_progress_line:
-                                print()  # New line after progress
-                                last_progress_line = ""
-                            print(f"  📥 {line}")
-                        elif 'done.' in line.lower():
-                            if last_progress_line:
-                                print()  # New line after progress
-                            print(f"  ✅ {line}")
-                            last_progress_line = ""
-                        elif line and not any(skip in line.lower() for skip in ['warning:', 'note:', 'remote:']):
-                            # Other important output (skip remote messages)
-                            if last_progress_line:
-                                print()  # New line after progress
-                                last_progress_line = ""
-                            print(f"  📝 {line}")
-                    
-                    # Check if process is done
-                    if process.poll() is not None:
-                        if last_progress_line:
-                            print()  # Final newline after progress
-                        break
-                    
-                    time.sleep(0.05)  # Faster polling
-                
-                return_code = process.returncode
-                
-                if return_code != 0:
-                    raise subprocess.CalledProcessError(return_code, cmd)
+                if result['returncode'] != 0:
+                    raise subprocess.CalledProcessError(result['returncode'], cmd)
                 
                 return "Command completed successfully"
                 
@@ -140,15 +139,160 @@ class EnhancedGitHubPRFetcher:
                 print(f"  Error output: {e.stderr}")
                 raise
     
+    def _render_git_event(self, event, display):
+        """Render a parsed git progress/message event as a clean terminal update."""
+        line = event['line']
+        
+        if event['type'] == 'progress':
+            summary = event.get('summary')
+            if summary:
+                # Phase finished: replace the in-place progress line with its throughput summary
+                if display['progress_line']:
+                    print(f"\r{' ' * 100}\r", end='')
+                rate = f", {format_bytes(summary['throughput'])}/s avg" if summary['throughput'] else ""
+                print(f"  ✅ {line} ({summary['seconds']:.1f}s{rate})")
+                display['progress_line'] = ""
+                return
+            # Throttle in-place updates; \r-terminated records arrive many times per second
+            now = time.monotonic()
+            if now - display['last_update'] >= 0.5:
+                clear = f"\r{' ' * 100}\r" if display['progress_line'] else ""
+                print(f"{clear}  📦 {line}", end='', flush=True)
+                display['progress_line'] = line
+                display['last_update'] = now
+            return
+        
+        if display['progress_line']:
+            print()  # New line after progress
+            display['progress_line'] = ""
+        
+        lowered = line.lower()
+        if 'cloning into' in lowered:
+            print(f"  📥 {line}")
+        elif 'done.' in lowered:
+            print(f"  ✅ {line}")
+        elif not any(skip in lowered for skip in ['warning:', 'note:', 'remote:']):
+            # Other important output (skip remote messages)
+            print(f"  📝 {line}")
+    
+    def resolve_ref(self, ref, cwd=None):
+        """Resolve a ref to a SHA quietly, returning None when it does not exist."""
+        result = subprocess.run(
+            ["git", "rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}"],
+            cwd=cwd or self.repo_dir, capture_output=True, text=True
+        )
+        return result.stdout.strip() if result.returncode == 0 else None
+    
+    @contextmanager
+    def _mirror_lock(self):
+        """Serialize mirror updates between concurrent fetcher processes."""
+        self.mirror_dir.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self.mirror_dir.parent / f"{self.repo_name}.lock"
+        with open(lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def ensure_mirror(self):
+        """Create or refresh the shared bare mirror for this repository."""
+        with self._mirror_lock():
+            if self.mirror_dir.exists() and (self.offline or not self.refresh_mirror):
+                print(f"🪞 Using mirror cache at {self.mirror_dir} (not refreshed)")
+                return
+            if self.offline:
+                raise Exception(f"Mirror {self.mirror_dir} does not exist and --offline is set")
+            if self.mirror_dir.exists():
+                print(f"🪞 Refreshing mirror cache at {self.mirror_dir}...")
+                self.run_git_command(
+                    "git -c http.sslVerify=false fetch --progress --prune origin",
+                    cwd=self.mirror_dir, show_progress=True
+                )
+                return
+            
+            print(f"🪞 Creating mirror cache at {self.mirror_dir}...")
+            print(f"⚠️  Note: The first mirror of a large repository may take several minutes...")
+            self.run_git_command(
+                f"git -c http.sslVerify=false clone --progress --bare {self.clone_url} {self.mirror_dir}",
+                cwd=self.mirror_dir.parent, show_progress=True
+            )
+            # Bare clones have no fetch refspec; keep branches in sync on later refreshes
+            self.run_git_command(
+                "git config remote.origin.fetch '+refs/heads/*:refs/heads/*'",
+                cwd=self.mirror_dir
+            )
+            print(f"✅ Mirror cache ready")
+    
+    def fetch_pr_into_mirror(self, head_sha=None):
+        """Fetch the PR head ref into the mirror unless it is already there."""
+        mirror_ref = f"refs/pull/{self.pr_number}/head"
+        with self._mirror_lock():
+            if head_sha:
+                if self.resolve_ref(mirror_ref, cwd=self.mirror_dir) == head_sha:
+                    print(f"✅ PR ref already cached in mirror: {mirror_ref}")
+                    return mirror_ref
+            if self.offline:
+                if self.resolve_ref(mirror_ref, cwd=self.mirror_dir):
+                    return mirror_ref
+                raise Exception(f"{mirror_ref} is not in the mirror and --offline is set")
+            
+            print(f"📥 Fetching PR reference into mirror: {mirror_ref}")
+            self.run_git_command(
+                f"git -c http.sslVerify=false fetch --progress origin +{mirror_ref}:{mirror_ref}",
+                cwd=self.mirror_dir, show_progress=True
+            )
+        return mirror_ref
+    
+    def fetch_prs_into_mirror(self, pr_numbers):
+        """Fetch several PR head refs into the mirror in a single negotiation."""
+        mirror_refspecs = " ".join(f"+refs/pull/{n}/head:refs/pull/{n}/head" for n in pr_numbers)
+        with self._mirror_lock():
+            self.run_git_command(
+                f"git -c http.sslVerify=false fetch --progress origin {mirror_refspecs}",
+                cwd=self.mirror_dir, show_progress=True
+            )
+    
+    def clone_from_mirror(self):
+        """Clone the workspace repository borrowing objects from the mirror via alternates."""
+        self.ensure_mirror()
+        
+        if self.repo_dir.exists():
+            print(f"📁 Repository already exists at {self.repo_dir}")
+            print(f"🔄 Updating existing repository from mirror...")
+            self.run_git_command("git fetch mirror")
+            return
+        
+        print(f"📥 Cloning repository from mirror to {self.repo_dir}...")
+        sparse_flag = "--sparse " if self.sparse else ""
+        self.run_git_command(
+            f"git clone --progress --shared {sparse_flag}{self.mirror_dir} {self.repo_name}",
+            cwd=self.output_dir, show_progress=True
+        )
+        # Keep origin pointing at GitHub and expose the mirror as its own remote
+        self.run_git_command(f"git remote rename origin mirror")
+        self.run_git_command(f"git remote add origin {self.clone_url}")
+        print(f"✅ Repository cloned from mirror (objects shared via alternates)")
+    
     def clone_repository(self):
         """Clone the repository if it doesn't exist."""
+        if self.mirror_dir:
+            self.clone_from_mirror()
+            return
+        
         if self.repo_dir.exists():
             print(f"📁 Repository already exists at {self.repo_dir}")
+            if self.offline:
+                print(f"📴 Offline: using existing repository as is")
+                return
             print(f"🔄 Updating existing repository...")
             # Update existing repo
             self.run_git_command("git -c http.sslVerify=false fetch origin", show_progress=True)
             return
         
+        if self.offline:
+            raise Exception(f"No repository at {self.repo_dir} and --offline is set (use --mirror-cache)")
+        
         print(f"📥 Cloning repository to {self.repo_dir}...")
         print(f"🌐 Clone URL: {self.clone_url}")
         print(f"⚠️  Note: Large repositories may take several minutes to clone...")
@@ -156,6 +300,9 @@ class EnhancedGitHubPRFetcher:
         try:
             # Use optimized cloning with better performance and SSL bypass for sandbox
             clone_cmd = f"git -c http.sslVerify=false clone --progress --depth 1 --single-branch {self.clone_url} {self.repo_name}"
+            if self.sparse:
+                # Blobless partial clone: only top-level files are checked out until the cone is set
+                clone_cmd = f"git -c http.sslVerify=false clone --progress --depth 1 --single-branch --filter=blob:none --sparse {self.clone_url} {self.repo_name}"
             self.run_git_command(
                 clone_cmd, 
                 cwd=self.output_dir,
@@ -178,7 +325,7 @@ class EnhancedGitHubPRFetcher:
         
         pr_url = f"{self.api_base}/pulls/{self.pr_number}"
         print("⏳ Making API request...")
-        response = requests.get(pr_url)
+        response = self.api.get(pr_url)
         
         if response.status_code != 200:
             raise Exception(f"Failed to fetch PR: {response.status_code} - {response.text}")
@@ -208,12 +355,70 @@ class EnhancedGitHubPRFetcher:
         }
         
         # Save to file
+        pr_info_file = self.save_pr_info(pr_info)
+        
+        print(f"✅ PR info saved to {pr_info_file}")
+        return pr_info
+    
+    def save_pr_info(self, pr_info):
+        """Write PR info to pr_N_info.json."""
         pr_info_file = self.output_dir / f"pr_{self.pr_number}_info.json"
         with open(pr_info_file, 'w') as f:
             json.dump(pr_info, f, indent=2)
+        return pr_info_file
+    
+    def has_merge_base(self, base_sha, head_sha):
+        """Check whether the merge base of two commits is reachable locally."""
+        result = subprocess.run(
+            ["git", "merge-base", base_sha, head_sha],
+            cwd=self.repo_dir, capture_output=True, text=True
+        )
+        return result.returncode == 0
+    
+    def is_shallow(self):
+        """Check whether the workspace repository is a shallow clone."""
+        return self.run_git_command("git rev-parse --is-shallow-repository") == "true"
+    
+    def ensure_merge_base(self, pr_info, max_depth=4096):
+        """Deepen the shallow history until the merge base with base_sha is reachable.
         
-        print(f"✅ PR info saved to {pr_info_file}")
-        return pr_info
+        Starts from the PR's commit count and doubles the depth on each round, so
+        one-commit PRs transfer almost nothing and long-lived PRs still get a
+        correct base. The final depth is recorded in pr_N_info.json.
+        """
+        base_sha, head_sha = pr_info['base_sha'], pr_info['head_sha']
+        pr_ref = f"+pull/{self.pr_number}/head:pr-{self.pr_number}"
+        fetch = "git -c http.sslVerify=false fetch --progress --update-head-ok origin"
+        
+        if not self.is_shallow():
+            # Full history: the merge base is reachable once both tips are present
+            refs = pr_ref if self.has_local_commits(base_sha) else f"{pr_ref} {base_sha}"
+            print(f"📥 Fetching PR reference{'' if refs == pr_ref else ' and base commit'}...")
+            self.run_git_command(f"{fetch} {refs}", show_progress=True)
+            pr_info['fetch_depth'] = 'full'
+            self.save_pr_info(pr_info)
+            return True
+        
+        # PR commits plus the base itself is the minimum that can contain the merge base
+        depth = max(int(pr_info.get('commits') or 1) + 1, 2)
+        print(f"📥 Fetching PR and base at depth {depth}...")
+        self.run_git_command(f"{fetch} --depth={depth} {pr_ref} {base_sha}", show_progress=True)
+        
+        while not self.has_merge_base(base_sha, head_sha):
+            if depth >= max_depth:
+                print(f"📥 Merge base not within {depth} commits, fetching full history...")
+                self.run_git_command(f"{fetch} --unshallow {pr_ref} {base_sha}", show_progress=True)
+                depth = 'full'
+                break
+            print(f"🔍 Merge base not reachable at depth {depth}, deepening by {depth}...")
+            self.run_git_command(f"{fetch} --deepen={depth} {pr_ref} {base_sha}", show_progress=True)
+            depth *= 2
+        
+        found = self.has_merge_base(base_sha, head_sha)
+        print(f"{'✅' if found else '⚠️ '} Merge base {'reachable' if found else 'still not reachable'} (fetch depth: {depth})")
+        pr_info['fetch_depth'] = depth
+        self.save_pr_info(pr_info)
+        return found
     
     def checkout_pr_branch(self, pr_info):
         """Checkout the PR branch in the cloned repository."""
@@ -225,10 +430,17 @@ class EnhancedGitHubPRFetcher:
             # For shallow repos, we need to fetch the specific PR branch
             print(f"📥 Fetching PR branch for #{self.pr_number}...")
             
-            # First try to fetch just the PR branch
-            pr_ref = f"pull/{self.pr_number}/head:pr-{self.pr_number}"
-            print(f"🎯 Fetching PR reference: {pr_ref}")
-            self.run_git_command(f"git -c http.sslVerify=false fetch --depth=50 origin {pr_ref}", show_progress=True)
+            if self.mirror_dir:
+                # Fetch the PR once into the shared mirror, then pull it locally without network
+                mirror_ref = self.fetch_pr_into_mirror(pr_info['head_sha'])
+                self.run_git_command(f"git fetch --force mirror {mirror_ref}:pr-{self.pr_number}")
+            elif self.offline:
+                if not self.resolve_ref(f"pr-{self.pr_number}"):
+                    raise Exception(f"Branch pr-{self.pr_number} not present and --offline is set")
+            else:
+                # Fetch just the PR branch, deep enough to reach the merge base with base_sha
+                print(f"🎯 Fetching PR reference: pull/{self.pr_number}/head")
+                self.ensure_merge_base(pr_info)
             
             # Checkout the PR branch
             print(f"🔄 Switching to PR branch...")
@@ -256,57 +468,378 @@ class EnhancedGitHubPRFetcher:
                 print(f"❌ Fallback also failed: {e2}")
                 return False
     
+    def fetch_pr_refs(self, pr_numbers):
+        """Fetch the head refs of several PRs in a single fetch negotiation."""
+        print(f"📥 Fetching {len(pr_numbers)} PR references in one batch...")
+        
+        if self.mirror_dir:
+            self.fetch_prs_into_mirror(pr_numbers)
+            local_refspecs = " ".join(f"+refs/pull/{n}/head:pr-{n}" for n in pr_numbers)
+            self.run_git_command(f"git fetch mirror {local_refspecs}")
+        else:
+            # Just the tips: add_pr_worktree deepens each PR until its merge base is reachable
+            refspecs = " ".join(f"+pull/{n}/head:pr-{n}" for n in pr_numbers)
+            depth = " --depth=1" if self.is_shallow() else ""
+            self.run_git_command(
+                f"git -c http.sslVerify=false fetch --progress{depth} origin {refspecs}",
+                show_progress=True
+            )
+        
+        print(f"✅ Fetched PR references: {', '.join(f'pr-{n}' for n in pr_numbers)}")
+    
+    def add_pr_worktree(self, shared_repo_dir, pr_info):
+        """Materialize the PR as a git worktree of a shared clone at self.repo_dir."""
+        branch = f"pr-{self.pr_number}"
+        
+        if self.repo_dir.exists():
+            print(f"📁 Worktree already exists at {self.repo_dir}, moving it to {branch}")
+            self.run_git_command(f"git checkout --detach {branch}")
+        else:
+            print(f"🌳 Adding worktree for {branch} at {self.repo_dir}")
+            # Detached so the shared clone can keep force-updating pr-N branches
+            self.run_git_command(
+                f"git worktree add --detach {self.repo_dir.resolve()} {branch}",
+                cwd=shared_repo_dir
+            )
+        
+        if not self.offline:
+            self.ensure_merge_base(pr_info)
+        
+        current_sha = self.run_git_command("git rev-parse HEAD")
+        if current_sha != pr_info['head_sha']:
+            print(f"⚠️  Warning: Expected SHA {pr_info['head_sha']}, got {current_sha}")
+        else:
+            print(f"✅ SHA verification passed")
+        return True
+    
+    def diff_path(self):
+        """Path of the saved PR diff (gzip-compressed when compress_diff is set)."""
+        suffix = ".diff.gz" if self.compress_diff else ".diff"
+        return self.output_dir / f"pr_{self.pr_number}{suffix}"
+    
+    def _open_diff(self, path, mode):
+        return gzip.open(path, mode) if self.compress_diff else open(path, mode)
+    
     def fetch_pr_diff(self):
-        """Fetch PR diff."""
+        """Stream the PR diff to disk in chunks, returning the path it was saved to."""
         print("📝 Fetching PR diff...")
         
         diff_url = f"{self.api_base}/pulls/{self.pr_number}"
         headers = {'Accept': 'application/vnd.github.v3.diff'}
-        response = requests.get(diff_url, headers=headers)
+        # Diffs can be large; let queued metadata calls go first
+        chunks = self.api.iter_download(diff_url, headers=headers, priority=PRIORITY_BULK)
+        return self.write_diff_stream(chunks)
+    
+    def write_diff_stream(self, chunks):
+        """Write diff chunks to pr_N.diff with flat memory, summarizing past the size cap."""
+        diff_file = self.diff_path()
+        part_file = diff_file.with_name(diff_file.name + '.part')
+        # Drop leftovers of an earlier run saved in the other format (and its index)
+        for stale in (f"pr_{self.pr_number}.diff", f"pr_{self.pr_number}.diff.gz", f"pr_{self.pr_number}.diff.idx.json"):
+            stale_file = self.output_dir / stale
+            if stale_file != diff_file and stale_file.exists():
+                stale_file.unlink()
+        start_time = time.time()
+        last_report = start_time
+        total = 0
+        overflow = None
         
-        if response.status_code != 200:
-            raise Exception(f"Failed to fetch diff: {response.status_code}")
+        try:
+            with self._open_diff(part_file, 'wb') as out:
+                for chunk in chunks:
+                    if self.max_diff_bytes and total + len(chunk) > self.max_diff_bytes:
+                        overflow = chunk
+                        break
+                    out.write(chunk)
+                    total += len(chunk)
+                    now = time.time()
+                    if now - last_report >= DIFF_PROGRESS_INTERVAL:
+                        last_report = now
+                        rate = total / max(now - start_time, 1e-6)
+                        print(f"\r  📦 Downloaded {format_bytes(total)} ({format_bytes(int(rate))}/s)",
+                              end='', flush=True)
+            if last_report != start_time:
+                print()
+            
+            if overflow is None:
+                os.replace(part_file, diff_file)
+                print(f"✅ Diff saved to {diff_file} ({format_bytes(total)})")
+                return diff_file
+            
+            return self._summarize_oversized_diff(diff_file, part_file, overflow, chunks)
+        finally:
+            if part_file.exists():
+                part_file.unlink()
+    
+    def _summarize_oversized_diff(self, diff_file, part_file, overflow, chunks):
+        """Replace a diff above the cap by a per-file summary, parsing the rest of the stream."""
+        print(f"⚠️  Diff exceeds {format_bytes(self.max_diff_bytes)}, writing a per-file summary instead")
         
-        diff_content = response.text
+        counted = {'bytes': 0}
         
-        # Save diff
-        diff_file = self.output_dir / f"pr_{self.pr_number}.diff"
-        with open(diff_file, 'w') as f:
-            f.write(diff_content)
+        def remaining_chunks():
+            # What was already written, then the chunk that crossed the cap, then the rest
+            with self._open_diff(part_file, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    counted['bytes'] += len(chunk)
+                    yield chunk
+            counted['bytes'] += len(overflow)
+            yield overflow
+            for chunk in chunks:
+                counted['bytes'] += len(chunk)
+                yield chunk
+        
+        summary_tmp = diff_file.with_name(diff_file.name + '.summary')
+        file_count = additions = deletions = 0
+        with open(summary_tmp, 'w') as body:
+            for entry in iter_file_diffs(iter_lines_from_chunks(remaining_chunks()), keep_patch=False):
+                file_count += 1
+                additions += entry['additions']
+                deletions += entry['deletions']
+                line = f"{entry['status']}\t+{entry['additions']}\t-{entry['deletions']}\t{entry['filename']}"
+                if entry.get('previous_filename'):
+                    line += f"\t(from {entry['previous_filename']})"
+                body.write(line + '\n')
+        
+        with self._open_diff(diff_file, 'wb') as out:
+            header = (
+                DIFF_SUMMARY_HEADER.format(pr_number=self.pr_number, size=format_bytes(counted['bytes']),
+                                           cap=format_bytes(self.max_diff_bytes)) +
+                f"# {file_count} files, +{additions} -{deletions}. Columns: status, additions, deletions, filename\n"
+            )
+            out.write(header.encode())
+            with open(summary_tmp, 'rb') as body:
+                shutil.copyfileobj(body, out)
+        summary_tmp.unlink()
         
-        print(f"✅ Diff saved to {diff_file}")
-        return diff_content
+        self.diff_summarized = True
+        print(f"✅ Diff summary saved to {diff_file} ({file_count} files, {format_bytes(counted['bytes'])} diff)")
+        return diff_file
     
     def fetch_changed_files_list(self):
-        """Fetch list of changed files from GitHub API."""
+        """Fetch every page of changed files from GitHub API, streaming them to disk."""
         print("📁 Fetching changed files list...")
-        
+        return self.write_changed_files(self._iter_api_changed_files())
+    
+    def _iter_api_changed_files(self):
+        """Yield changed file entries page by page from the files endpoint."""
         files_url = f"{self.api_base}/pulls/{self.pr_number}/files"
-        response = requests.get(files_url)
+        params = {'per_page': 100}
+        page = 0
+        count = 0
         
-        if response.status_code != 200:
-            raise Exception(f"Failed to fetch files: {response.status_code}")
+        while files_url:
+            page += 1
+            response = self.api.get(files_url, params=params)
+            
+            if response.status_code != 200:
+                raise Exception(f"Failed to fetch files: {response.status_code}")
+            
+            for file_info in response.json():
+                count += 1
+                entry = {
+                    'filename': file_info['filename'],
+                    'status': file_info['status'],  # added, modified, removed, renamed
+                    'additions': file_info.get('additions', 0),
+                    'deletions': file_info.get('deletions', 0),
+                    'patch': file_info.get('patch', '')
+                }
+                if file_info.get('previous_filename'):
+                    entry['previous_filename'] = file_info['previous_filename']
+                yield entry
+            
+            print(f"  📄 Page {page}: {count} files so far")
+            
+            # The next page URL already carries the query parameters
+            files_url = response.links.get('next', {}).get('url')
+            params = None
+    
+    def write_changed_files(self, entries):
+        """Stream changed file entries to pr_N_files.jsonl and pr_N_files.json, returning summaries."""
+        # JSONL is flushed regularly so downstream stages can read while we fetch;
+        # the JSON array is written alongside and only renamed into place once complete.
+        files_jsonl_file = self.output_dir / f"pr_{self.pr_number}_files.jsonl"
+        files_list_file = self.output_dir / f"pr_{self.pr_number}_files.json"
+        files_list_tmp = files_list_file.with_suffix('.json.tmp')
         
-        files_data = response.json()
         changed_files = []
+        with open(files_jsonl_file, 'w') as jsonl_out, open(files_list_tmp, 'w') as json_out:
+            json_out.write('[')
+            for entry in entries:
+                jsonl_out.write(json.dumps(entry) + '\n')
+                json_out.write(('\n' if not changed_files else ',\n') + json.dumps(entry, indent=2))
+                
+                # Keep only the summary in memory; patches live on disk
+                summary = {k: v for k, v in entry.items() if k != 'patch'}
+                changed_files.append(summary)
+                if len(changed_files) % 100 == 0:
+                    jsonl_out.flush()
+            json_out.write('\n]\n')
+        os.replace(files_list_tmp, files_list_file)
+        
+        print(f"✅ Changed files list saved to {files_list_file} ({len(changed_files)} files)")
+        print(f"✅ Streaming files list saved to {files_jsonl_file}")
+        return changed_files
+    
+    def has_local_commits(self, *shas):
+        """Check that every commit is present in the local object store."""
+        for sha in shas:
+            result = subprocess.run(
+                ["git", "cat-file", "-e", f"{sha}^{{commit}}"],
+                cwd=self.repo_dir, capture_output=True
+            )
+            if result.returncode != 0:
+                return False
+        return True
+    
+    def derive_diff_and_files_locally(self, pr_info):
+        """Compute pr_N.diff and the changed files list from local git objects.
         
-        for file_info in files_data:
-            changed_files.append({
-                'filename': file_info['filename'],
-                'status': file_info['status'],  # added, modified, deleted
-                'additions': file_info.get('additions', 0),
-                'deletions': file_info.get('deletions', 0),
-                'patch': file_info.get('patch', '')
-            })
+        Returns the changed files summaries, or None when the base/head commits or
+        their merge base are not available locally.
+        """
+        base_sha, head_sha = pr_info['base_sha'], pr_info['head_sha']
+        if not self.repo_dir.exists() or not self.has_local_commits(base_sha, head_sha):
+            print("⚠️  Base/head commits not available locally")
+            return None
         
-        # Save changed files list
-        files_list_file = self.output_dir / f"pr_{self.pr_number}_files.json"
-        with open(files_list_file, 'w') as f:
-            json.dump(changed_files, f, indent=2)
+        if not self.has_merge_base(base_sha, head_sha):
+            print("⚠️  Merge base not reachable locally (history too shallow)")
+            return None
         
-        print(f"✅ Changed files list saved to {files_list_file}")
+        print(f"📝 Deriving PR diff locally ({base_sha[:10]}...{head_sha[:10]})...")
+        
+        diff_file = self.write_diff_stream(self._iter_local_diff(base_sha, head_sha))
+        
+        print("📁 Deriving changed files list from the diff...")
+        if self.diff_summarized or self.compress_diff:
+            # The saved file no longer holds the plain patch text; stream it from git again
+            lines = iter_lines_from_chunks(self._iter_local_diff(base_sha, head_sha))
+            entries = ({k: v for k, v in entry.items() if k != 'binary'} for entry in iter_file_diffs(lines))
+            return self.write_changed_files(entries)
+        with open(diff_file, errors='replace') as f:
+            entries = ({k: v for k, v in entry.items() if k != 'binary'} for entry in iter_file_diffs(f))
+            return self.write_changed_files(entries)
+    
+    def _iter_local_diff(self, base_sha, head_sha, chunk_size=1024 * 1024):
+        """Stream the PR's diff from local git objects in chunks."""
+        # Three-dot diff (merge base -> head) matches what GitHub shows for a PR
+        process = subprocess.Popen(
+            ["git", "-c", "core.quotePath=false", "diff", "--find-renames", "--no-color", "--no-ext-diff",
+             f"{base_sha}...{head_sha}"],
+            cwd=self.repo_dir, stdout=subprocess.PIPE
+        )
+        try:
+            for chunk in iter(lambda: process.stdout.read(chunk_size), b''):
+                yield chunk
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, "git diff")
+    
+    def fetch_diff_and_files(self, pr_info):
+        """Produce pr_N.diff and the changed files list, locally when possible, else via the API."""
+        changed_files = None
+        if self.local_diff:
+            changed_files = self.derive_diff_and_files_locally(pr_info)
+            if changed_files is None and self.offline:
+                raise Exception("Cannot derive the PR diff locally and --offline is set")
+        
+        if changed_files is None:
+            if self.local_diff:
+                print("🌐 Falling back to the GitHub API for diff and files")
+            diff_future = self.api.submit(self.fetch_pr_diff)
+            changed_files = self.fetch_changed_files_list()
+            diff_future.result()
+        
+        self.build_diff_index()
         return changed_files
     
+    def build_diff_index(self):
+        """Write the hunk index sidecar (pr_N.diff.idx.json) next to a plain-text diff."""
+        diff_file = self.diff_path()
+        if self.compress_diff or self.diff_summarized or not diff_file.exists():
+            return None
+        print("🗂️  Indexing diff hunks...")
+        index = build_diff_index(diff_file)
+        print(f"✅ Diff index saved ({index['file_count']} files, {index['hunk_count']} hunks, "
+              f"{len(index['functions'])} functions touched)")
+        return index
+    
+    def _touched_functions_section(self, limit=50):
+        """List the functions touched by the diff, read from the hunk index."""
+        diff_file = self.diff_path()
+        if self.compress_diff or self.diff_summarized or not diff_file.exists():
+            return ""
+        with DiffIndex.load(diff_file) as index:
+            symbols = index.functions()
+            if not symbols:
+                return ""
+            section = "\n## Functions Touched by the Diff\n"
+            for symbol in symbols[:limit]:
+                section += f"- `{symbol}` in {', '.join(index.files_for_function(symbol))}\n"
+            if len(symbols) > limit:
+                section += f"- ... and {len(symbols) - limit} more\n"
+        return section
+    
+    def load_local_pr_info(self):
+        """Build PR info without the API: reuse pr_N_info.json or derive it from local refs."""
+        pr_info_file = self.output_dir / f"pr_{self.pr_number}_info.json"
+        if pr_info_file.exists():
+            print(f"📋 Using existing PR info: {pr_info_file}")
+            with open(pr_info_file) as f:
+                return json.load(f)
+        
+        print("📋 Deriving PR info from local refs...")
+        if self.mirror_dir:
+            git_dir = self.mirror_dir
+            head_sha = self.resolve_ref(f"refs/pull/{self.pr_number}/head", cwd=git_dir)
+            base_ref = self.run_git_command("git symbolic-ref --short HEAD", cwd=git_dir)
+        else:
+            git_dir = self.repo_dir
+            head_sha = self.resolve_ref(f"pr-{self.pr_number}", cwd=git_dir)
+            base_ref = self.run_git_command("git rev-parse --abbrev-ref origin/HEAD", cwd=git_dir)
+        if not head_sha:
+            raise Exception(f"PR #{self.pr_number} head is not available locally")
+        base_sha = self.run_git_command(f"git merge-base {base_ref} {head_sha}", cwd=git_dir)
+        subject, author, created_at = self.run_git_command(
+            f"git log -1 --format=%s%x00%an%x00%aI {head_sha}", cwd=git_dir
+        ).split('\0')
+        
+        pr_info = {
+            'pr_number': self.pr_number,
+            'title': subject,
+            'body': '',
+            'state': 'unknown',
+            'created_at': created_at,
+            'updated_at': created_at,
+            'user': author,
+            'base_branch': base_ref.split('/')[-1],
+            'head_branch': f"pr-{self.pr_number}",
+            'head_sha': head_sha,
+            'base_sha': base_sha,
+            'commits': int(self.run_git_command(f"git rev-list --count {base_sha}..{head_sha}", cwd=git_dir)),
+            'additions': 0,
+            'deletions': 0,
+            'changed_files': 0,
+            'owner': self.owner,
+            'repo': self.repo_name,
+            'clone_url': self.clone_url,
+            'source': 'local'
+        }
+        self.save_pr_info(pr_info)
+        return pr_info
+    
+    def update_pr_stats(self, pr_info, changed_files):
+        """Fill in diff statistics for PR info derived from local refs."""
+        if pr_info.get('source') != 'local':
+            return
+        pr_info['additions'] = sum(f['additions'] for f in changed_files)
+        pr_info['deletions'] = sum(f['deletions'] for f in changed_files)
+        pr_info['changed_files'] = len(changed_files)
+        self.save_pr_info(pr_info)
+    
     def create_comprehensive_context(self, pr_info, changed_files):
         """Create comprehensive context file for iFlow."""
         print("📝 Creating comprehensive context file...")
@@ -325,7 +858,7 @@ class EnhancedGitHubPRFetcher:
 **Status:** {pr_info['state']}
 **Base Branch:** {pr_info['base_branch']} → **Head Branch:** {pr_info['head_branch']}
 
-**Statistics:**
+{self._sparse_context_note()}**Statistics:**
 - Commits: {pr_info['commits']}
 - Files Changed: {pr_info['changed_files']}
 - Additions: +{pr_info['additions']} lines
@@ -338,11 +871,16 @@ class EnhancedGitHubPRFetcher:
 """
         
         for file_info in changed_files:
-            status_emoji = {'added': '🆕', 'modified': '✏️', 'deleted': '🗑️'}.get(file_info['status'], '📝')
+            status_emoji = {'added': '🆕', 'modified': '✏️', 'deleted': '🗑️', 'removed': '🗑️', 'renamed': '🔀'}.get(file_info['status'], '📝')
             context_content += f"- {status_emoji} **{file_info['filename']}** ({file_info['status']})\n"
             if file_info['additions'] or file_info['deletions']:
                 context_content += f"  - +{file_info['additions']} -{file_info['deletions']} lines\n"
         
+        context_content += self._context_pack_section()
+        context_content += self._touched_functions_section()
+        context_content += self._call_graph_section()
+        context_content += self._changed_symbols_section()
+        
         context_content += f"""
 
 ## Repository Access
@@ -353,7 +891,7 @@ You have full access to the cloned repository at: `{self.repo_name}/`
    - `read_file {self.repo_name}/path/to/file.java` - Read any file in the repository
    - `list_dir {self.repo_name}/src/` - List directory contents
    - `grep -r "pattern" {self.repo_name}/` - Search through all files
-
+{self._code_search_note()}
 2. **Git Operations:**
    - `run_terminal_cmd git log --oneline -10` - View recent commits
    - `run_terminal_cmd git show HEAD` - Show latest commit
@@ -388,6 +926,251 @@ Please acknowledge that you understand this PR context and your full repository
         print(f"✅ Comprehensive context file created: {context_file}")
         return context_file
     
+    def is_sparse_checkout(self):
+        """Check whether the workspace repository has sparse checkout enabled."""
+        result = subprocess.run(
+            ["git", "config", "--bool", "core.sparseCheckout"],
+            cwd=self.repo_dir, capture_output=True, text=True
+        )
+        return result.stdout.strip() == "true"
+    
+    def compute_sparse_paths(self, changed_files, extra_paths=(), parent_levels=0):
+        """Compute the sparse cone: changed directories, their sibling tests and neighbor directories."""
+        changed_dirs = set()
+        stems = set()
+        for file_info in changed_files:
+            filename = file_info['filename']
+            directory = posixpath.dirname(filename)
+            for _ in range(parent_levels):
+                directory = posixpath.dirname(directory)
+            if directory:
+                changed_dirs.add(directory)
+            stem = posixpath.splitext(posixpath.basename(filename))[0]
+            if stem.startswith('test_'):
+                stem = stem[len('test_'):]
+            stems.add(stem)
+        
+        # Sibling tests live anywhere in the tree; the tree listing needs no blobs
+        test_names = set()
+        for stem in stems:
+            test_names.update({f"test_{stem}", f"{stem}_test", f"{stem}_tests", f"{stem}.test", f"{stem}.spec"})
+        all_paths = self.run_git_command("git ls-tree -r --name-only HEAD").splitlines()
+        test_dirs = set()
+        for path in all_paths:
+            name = posixpath.splitext(posixpath.basename(path))[0]
+            if any(name == t or name.startswith(f"{t}_") for t in test_names):
+                directory = posixpath.dirname(path)
+                if directory:
+                    test_dirs.add(directory)
+        
+        return sorted(changed_dirs | test_dirs | {p.strip('/') for p in extra_paths if p.strip('/')})
+    
+    def configure_sparse_checkout(self, changed_files, extra_paths=(), parent_levels=0):
+        """Add the PR's blast radius to the sparse cone (safe to call again to widen it)."""
+        if not self.is_sparse_checkout():
+            print("📂 Full checkout present - skipping sparse cone configuration")
+            return []
+        
+        paths = self.compute_sparse_paths(changed_files, extra_paths, parent_levels)
+        if not paths:
+            print("📂 No directories to add to the sparse cone")
+            return []
+        
+        print(f"📂 Adding {len(paths)} directories to the sparse checkout cone...")
+        for path in paths:
+            print(f"  ➕ {path}/")
+        self.run_git_command(
+            "git -c http.sslVerify=false sparse-checkout add " + " ".join(shlex.quote(p) for p in paths),
+            show_progress=True
+        )
+        print("✅ Sparse checkout ready (widen later with: git sparse-checkout add <dir>)")
+        return paths
+    
+    def start_api_fetches(self):
+        """Issue the PR info (and, without local diffs, diff and files) API calls in the background."""
+        futures = {'pr_info': self.api.submit(self.fetch_pr_info)}
+        if not self.local_diff:
+            futures['diff'] = self.api.submit(self.fetch_pr_diff)
+            futures['changed_files'] = self.api.submit(self.fetch_changed_files_list)
+        return futures
+    
+    def prepare_artifacts(self, pr_info, changed_files=None):
+        """Produce the diff and file list and write the context files for a checked-out PR."""
+        if changed_files is None:
+            changed_files = self.fetch_diff_and_files(pr_info)
+        return self.write_context_artifacts(pr_info, changed_files)
+    
+    def build_code_index(self):
+        """Create or incrementally update the workspace's trigram code-search index."""
+        if not self.code_index or not self.repo_dir.exists():
+            return None
+        print("🔎 Updating code search index...")
+        index = CodeSearchIndex(self.output_dir / CODE_INDEX_DIR_NAME, self.repo_dir).update()
+        index.close()
+        return index
+    
+    def build_related_index(self):
+        """Create or incrementally update the BM25 index used to find files related to the PR."""
+        if not self.code_index or not self.repo_dir.exists():
+            return None
+        print("📚 Updating related-files index...")
+        index = RelatedFilesIndex(self.output_dir / RELATED_INDEX_DIR_NAME, self.repo_dir).update()
+        index.close()
+        return index
+    
+    def build_symbol_index(self, pr_info, changed_files):
+        """Index definitions/imports/calls of the changed files and the files depending on them."""
+        if not self.repo_dir.exists():
+            return None
+        print("🧭 Building symbol index for changed files...")
+        changed_paths = [f['filename'] for f in changed_files if f['status'] != 'removed']
+        try:
+            return build_symbol_index(self.output_dir, self.repo_dir, changed_paths, pr_info.get('head_sha'))
+        except Exception as e:
+            print(f"⚠️  Warning: Symbol index not built: {e}")
+            return None
+    
+    def build_call_graph(self, pr_info, changed_files):
+        """Find the callers and callees of the changed Python functions (call_graph.json/.md)."""
+        if not self.call_graph or not self.repo_dir.exists():
+            return None
+        print("🕸️ Building call graph of changed functions...")
+        # File summaries are cached in the shared mirror so later PRs of the repository reuse them
+        cache_dir = call_graph_cache_dir(self.mirror_dir) if self.mirror_dir and self.mirror_dir.exists() else None
+        try:
+            return build_call_graph(self.output_dir, self.repo_dir, pr_info, changed_files, cache_dir=cache_dir)
+        except Exception as e:
+            print(f"⚠️  Warning: Call graph not built: {e}")
+            return None
+    
+    def build_context_pack(self, pr_info, changed_files):
+        """Extract before/after files, changed functions and related tests into context_pack/."""
+        if not self.repo_dir.exists():
+            return None
+        print("📦 Building context pack...")
+        try:
+            return build_context_pack(self.output_dir, self.repo_dir, pr_info, changed_files)
+        except Exception as e:
+            print(f"⚠️  Warning: Context pack not built: {e}")
+            return None
+    
+    def _context_pack_section(self):
+        """Point iFlow at the context pack before it starts exploring."""
+        if not (self.output_dir / PACK_DIR_NAME / TOC_NAME).exists():
+            return ""
+        return (f"\n## Context Pack\nStart with `{PACK_DIR_NAME}/{TOC_NAME}`: it links the base and head version "
+                f"of every changed file, the functions around each change and the related tests, as small local "
+                f"files. Read those before searching the repository.\n")
+    
+    def _call_graph_section(self, limit=20):
+        """Caller/callee counts of the changed functions, pointing at call_graph.md."""
+        result = load_call_graph(self.output_dir)
+        if not result or not result['functions']:
+            return ""
+        section = (f"\n## Call Graph\n`{GRAPH_MD_NAME}` lists the callers and callees (up to {result['hops']} hops) "
+                   f"of each changed function:\n")
+        for function in result['functions'][:limit]:
+            section += (f"- `{function['qualname']}` ({function['path']}, {function['status']}): "
+                        f"{len(function['callers'])} callers, {len(function['callees'])} callees\n")
+        if len(result['functions']) > limit:
+            section += f"- ... and {len(result['functions']) - limit} more\n"
+        return section
+    
+    def _changed_symbols_section(self, max_symbols=10, max_dependents=20):
+        """Summarize the symbol index (definitions per changed file, dependent files)."""
+        try:
+            index = SymbolIndex.load(self.output_dir)
+        except Exception:
+            return ""
+        section = ""
+        for path, parsed in index.index['files'].items():
+            top_level = [d for d in parsed['definitions'] if '.' not in d['qualname']]
+            if not top_level:
+                continue
+            names = ', '.join(f"`{d['name']}` ({d['kind']}, line {d['line']})" for d in top_level[:max_symbols])
+            more = f", ... {len(top_level) - max_symbols} more" if len(top_level) > max_symbols else ""
+            section += f"- **{path}**: {names}{more}\n"
+        dependents = index.dependents()
+        if dependents:
+            section += f"\n**Files outside the PR using these symbols ({len(dependents)}):**\n"
+            for path, names in sorted(dependents.items(), key=lambda item: -len(item[1]))[:max_dependents]:
+                section += f"- {path} (uses {', '.join(f'`{n}`' for n in names)})\n"
+        if not section:
+            return ""
+        return f"\n## Symbols Defined in Changed Files\n(Full index: `symbol_index.json`)\n{section}"
+    
+    def _code_search_note(self):
+        """Point iFlow at the code search CLI when the index exists."""
+        if not (self.output_dir / CODE_INDEX_DIR_NAME / "index.json").exists():
+            return ""
+        script = Path(__file__).resolve().parent / "code_search.py"
+        return (f"   - `run_terminal_cmd python3 {script} search . \"pattern\" [--regex] [--glob '*.py']` - "
+                f"Indexed search returning file:line hits (much faster than grep -r)\n")
+    
+    def write_context_artifacts(self, pr_info, changed_files):
+        """Write the context file, fix permissions and set up ground truth questions."""
+        self.build_code_index()
+        self.build_related_index()
+        self.build_symbol_index(pr_info, changed_files)
+        self.build_call_graph(pr_info, changed_files)
+        self.build_context_pack(pr_info, changed_files)
+        context_file = self.create_comprehensive_context(pr_info, changed_files)
+        self.fix_file_permissions()
+        self.copy_ground_truth_questions()
+        self.write_workspace_manifest(pr_info)
+        return context_file
+    
+    def manifest_options(self):
+        """Options that change the generated artifacts (a mismatch invalidates the diff stage)."""
+        return {
+            'sparse': self.sparse,
+            'compress_diff': self.compress_diff,
+            'max_diff_bytes': self.max_diff_bytes,
+            'code_index': self.code_index,
+            'call_graph': self.call_graph
+        }
+    
+    def write_workspace_manifest(self, pr_info):
+        """Record the prepared workspace so later runs can skip valid stages."""
+        manifest_path = write_manifest(self.output_dir, pr_info, self.repo_dir, self.manifest_options())
+        print(f"✅ Workspace manifest saved to {manifest_path}")
+        return manifest_path
+    
+    def check_workspace(self):
+        """Validate an earlier run's manifest; returns the readiness status or None."""
+        if not self.reuse_workspace:
+            return None
+        status = check_workspace(self.output_dir, self.manifest_options())
+        if status['manifest'] is None:
+            return None
+        valid = [stage for stage, ok in status['stages'].items() if ok]
+        print(f"🔎 Workspace manifest checked in {status['seconds'] * 1000:.1f} ms "
+              f"(valid stages: {', '.join(valid) or 'none'})")
+        for problem in status['problems']:
+            print(f"  ⚠️  {problem}")
+        return status
+    
+    def load_changed_files(self):
+        """Changed file summaries (without patches) from a previously written files list."""
+        files_jsonl_file = self.output_dir / f"pr_{self.pr_number}_files.jsonl"
+        changed_files = []
+        with open(files_jsonl_file) as f:
+            for line in f:
+                entry = json.loads(line)
+                entry.pop('patch', None)
+                changed_files.append(entry)
+        return changed_files
+    
+    def _sparse_context_note(self):
+        """Describe the sparse cone in the context file when the checkout is partial."""
+        if not self.sparse or not self.repo_dir.exists() or not self.is_sparse_checkout():
+            return ""
+        cone = self.run_git_command("git sparse-checkout list").splitlines()
+        note = "**Sparse Checkout:** only these directories (plus top-level files) are checked out:\n"
+        note += "".join(f"- `{self.repo_name}/{path}/`\n" for path in cone)
+        note += f"Widen with `git -C {self.repo_name} sparse-checkout add <dir>`.\n\n"
+        return note
+    
     def fix_file_permissions(self):
         """Fix file permissions by removing macOS extended attributes."""
         print("🔧 Fixing file permissions...")
@@ -414,6 +1197,74 @@ Please acknowledge that you understand this PR context and your full repository
             placeholder_file = self.output_dir / "ground_truth_questions.md"
             with open(placeholder_file, 'w') as f:
                 f.write("# Ground Truth Questions\n\nAdd your ground truth questions here.\n")
+    
+    def prepare_workspace(self, sparse_include=(), sparse_parent_levels=0):
+        """Run the full single-PR workflow and return the context file path."""
+        # Step 0: Reuse whatever an earlier run left behind that is still valid
+        readiness = self.check_workspace()
+        stages = readiness['stages'] if readiness else {}
+        if readiness and readiness['ready']:
+            print(f"✅ Workspace already prepared at {readiness['manifest']['head_sha'][:10]}, skipping all stages")
+            return self.output_dir / f"pr_{self.pr_number}_context.md"
+        
+        api_futures = {}
+        if stages.get('checkout'):
+            print("♻️  Repository already at the PR head, skipping clone, fetch and checkout")
+            pr_info = self.load_local_pr_info()
+        else:
+            # Step 1: Start API calls in the background and clone while they run
+            api_futures = {} if self.offline else self.start_api_fetches()
+            self.clone_repository()
+            
+            # Step 2: Wait for PR information
+            pr_info = self.load_local_pr_info() if self.offline else api_futures['pr_info'].result()
+            
+            # Step 3: Checkout PR branch
+            checkout_success = self.checkout_pr_branch(pr_info)
+            if not checkout_success:
+                print("⚠️  Warning: Could not checkout PR branch, using default branch")
+        
+        # Step 4: Derive the diff and changed files locally (or wait for the API)
+        if stages.get('diff'):
+            print("♻️  Diff and changed files list still valid, skipping")
+            changed_files = self.load_changed_files()
+        elif 'changed_files' in api_futures:
+            api_futures['diff'].result()
+            changed_files = api_futures['changed_files'].result()
+        else:
+            changed_files = self.fetch_diff_and_files(pr_info)
+        self.update_pr_stats(pr_info, changed_files)
+        
+        # Step 5 (sparse only): Check out just the PR's blast radius
+        if self.sparse:
+            self.configure_sparse_checkout(changed_files, sparse_include, sparse_parent_levels)
+        
+        # Steps 6-8: Create context, fix permissions, set up questions
+        return self.write_context_artifacts(pr_info, changed_files)
+
+
+def prepare_pr_worktrees(repo, pr_numbers, output_dir, mirror_cache=None, api_client=None):
+    """Prepare one workspace per PR, all sharing a single clone through git worktrees."""
+    output_dir = Path(output_dir)
+    api_client = api_client or GitHubAPIClient()
+    
+    # One clone and one fetch negotiation for every PR in the batch
+    shared = EnhancedGitHubPRFetcher(repo, pr_numbers[0], output_dir, mirror_cache=mirror_cache,
+                                     api_client=api_client)
+    shared.clone_repository()
+    shared.fetch_pr_refs(pr_numbers)
+    
+    workspaces = []
+    for pr_number in pr_numbers:
+        print(f"\n--- PR #{pr_number} ---")
+        fetcher = EnhancedGitHubPRFetcher(repo, pr_number, output_dir / f"pr_workspace_{pr_number}",
+                                          mirror_cache=mirror_cache, api_client=api_client)
+        pr_info = fetcher.fetch_pr_info()
+        fetcher.add_pr_worktree(shared.repo_dir, pr_info)
+        fetcher.prepare_artifacts(pr_info)
+        workspaces.append(fetcher.output_dir)
+    
+    return workspaces
 
 
 def main():
@@ -421,40 +1272,86 @@ def main():
     parser = argparse.ArgumentParser(description="Enhanced GitHub PR fetcher with full repository cloning")
     parser.add_argument("--repo", required=True, 
                        help="GitHub repository (owner/repo or full URL)")
-    parser.add_argument("--pr", type=int, required=True,
+    pr_group = parser.add_mutually_exclusive_group(required=True)
+    pr_group.add_argument("--pr", type=int,
                        help="Pull request number")
+    pr_group.add_argument("--prs", type=int, nargs='+',
+                       help="Several pull request numbers of the same repo, prepared as worktrees of one clone")
     parser.add_argument("--output-dir", default="pr_workspace",
                        help="Output directory for PR workspace")
+    parser.add_argument("--mirror-cache",
+                       help="Directory holding shared bare mirrors; workspaces clone from it via alternates")
+    parser.add_argument("--sparse", action="store_true",
+                       help="Blobless partial clone with a sparse checkout of the PR's changed areas")
+    parser.add_argument("--sparse-include", nargs='*', default=[],
+                       help="Extra directories to add to the sparse cone (re-run to widen it)")
+    parser.add_argument("--sparse-parent-levels", type=int, default=0,
+                       help="Widen each changed file's directory by this many parent levels")
+    parser.add_argument("--api-base",
+                       help="GitHub API root (default: https://api.github.com or $GITHUB_API_URL)")
+    parser.add_argument("--api-timeout", type=float, default=60,
+                       help="Per-request read timeout in seconds for GitHub API calls")
+    parser.add_argument("--api-retries", type=int, default=3,
+                       help="Retries for transient GitHub API failures")
+    parser.add_argument("--http-cache", default=str(DEFAULT_HTTP_CACHE_DIR),
+                       help="Directory for the conditional-request (ETag) cache of API responses")
+    parser.add_argument("--no-http-cache", action="store_true",
+                       help="Disable the API response cache")
+    parser.add_argument("--api-diff", action="store_true",
+                       help="Always fetch the diff and files list from the API instead of local git objects")
+    parser.add_argument("--offline", action="store_true",
+                       help="No network access: use the mirror/existing clone and derive everything locally")
+    parser.add_argument("--max-diff-mb", type=float, default=DEFAULT_MAX_DIFF_MB,
+                       help="Replace diffs larger than this by a per-file summary (0 disables the cap)")
+    parser.add_argument("--compress-diff", action="store_true",
+                       help="Save the PR diff gzip-compressed as pr_N.diff.gz")
+    parser.add_argument("--force-refresh", action="store_true",
+                       help="Ignore workspace_manifest.json and re-run every stage")
+    parser.add_argument("--no-code-index", action="store_true",
+                       help="Skip building the code search indexes (code_index/, related_index/)")
+    parser.add_argument("--no-call-graph", action="store_true",
+                       help="Skip building the call graph of the changed functions (call_graph.json/.md)")
+    parser.add_argument("--export-snapshot",
+                       help="After preparing, write the workspace to this zstd snapshot (.snapshot.tar)")
+    parser.add_argument("--import-snapshot",
+                       help="Restore the workspace from a snapshot instead of cloning (no network needed)")
     
     args = parser.parse_args()
     
+    api_client = GitHubAPIClient(api_root=args.api_base, timeout=(10, args.api_timeout),
+                                 retries=args.api_retries,
+                                 cache_dir=None if args.no_http_cache else args.http_cache)
+    
     try:
-        # Create enhanced fetcher
-        fetcher = EnhancedGitHubPRFetcher(args.repo, args.pr, args.output_dir)
+        if args.prs:
+            workspaces = prepare_pr_worktrees(args.repo, args.prs, args.output_dir,
+                                              mirror_cache=args.mirror_cache, api_client=api_client)
+            print(f"\n🎉 {len(workspaces)} PR workspaces ready!")
+            for workspace in workspaces:
+                print(f"📁 {workspace}")
+            print(f"\n🚀 Next step: Run dynamic_prompt_generator.py for each workspace")
+            return 0
         
-        # Step 1: Clone repository
-        fetcher.clone_repository()
+        if args.import_snapshot:
+            metadata = read_snapshot_metadata(args.import_snapshot)
+            repo = args.repo.replace('https://github.com/', '').rstrip('/')
+            if (metadata['repo'], metadata['pr_number']) != (repo, args.pr):
+                raise Exception(f"Snapshot is for {metadata['repo']}#{metadata['pr_number']}, not {repo}#{args.pr}")
+            import_snapshot(args.import_snapshot, args.output_dir)
         
-        # Step 2: Fetch PR information
-        pr_info = fetcher.fetch_pr_info()
-        
-        # Step 3: Checkout PR branch
-        checkout_success = fetcher.checkout_pr_branch(pr_info)
-        if not checkout_success:
-            print("⚠️  Warning: Could not checkout PR branch, using default branch")
-        
-        # Step 4: Fetch additional PR data
-        fetcher.fetch_pr_diff()
-        changed_files = fetcher.fetch_changed_files_list()
-        
-        # Step 5: Create comprehensive context
-        context_file = fetcher.create_comprehensive_context(pr_info, changed_files)
-        
-        # Step 6: Fix file permissions (CRITICAL FIX)
-        fetcher.fix_file_permissions()
+        # Create enhanced fetcher
+        fetcher = EnhancedGitHubPRFetcher(args.repo, args.pr, args.output_dir,
+                                          mirror_cache=args.mirror_cache, sparse=args.sparse,
+                                          api_client=api_client, local_diff=not args.api_diff,
+                                          offline=args.offline, max_diff_mb=args.max_diff_mb,
+                                          compress_diff=args.compress_diff,
+                                          reuse_workspace=not args.force_refresh,
+                                          code_index=not args.no_code_index,
+                                          call_graph=not args.no_call_graph)
+        context_file = fetcher.prepare_workspace(args.sparse_include, args.sparse_parent_levels)
         
-        # Step 7: Set up ground truth questions
-        fetcher.copy_ground_truth_questions()
+        if args.export_snapshot:
+            export_snapshot(fetcher.output_dir, args.export_snapshot)
         
         print(f"\n🎉 Enhanced PR workspace ready!")
         print(f"📁 Workspace directory: {fetcher.output_dir}")
@@ -470,6 +1367,8 @@ def main():
         import traceback
         traceback.print_exc()
         return 1
+    finally:
+        api_client.close()
 
 
 if __name__ == "__main__":
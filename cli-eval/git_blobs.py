@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Git Blobs - Read file contents at a commit straight from a repository's object store.
+
+Indexers use this instead of a working tree:
+1. list_tree_blobs() walks the tree of a commit (path, blob SHA, size) with one `git ls-tree`;
+   list_local_blobs() skips the blobs a partial clone left on the remote, without fetching them
+2. BlobReader keeps one `git cat-file --batch` process open and streams blob contents
+   through it; requests are pipelined, so reading thousands of blobs costs one process
+
+Works on bare mirrors and regular clones alike, and never needs a checkout.
+
+Usage:
+    python3 git_blobs.py ~/.cache/iflow-pr-benchmark/mirrors/apache/airflow.git refs/pull/58365/head
+    python3 git_blobs.py pr_workspace_apache/airflow HEAD airflow/models/dag.py
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+
+
+def resolve_commit(git_dir, rev):
+    """Full SHA of the commit `rev` names in a repository."""
+    result = subprocess.run(["git", "rev-parse", "--verify", "--quiet", f"{rev}^{{commit}}"],
+                            cwd=git_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"{rev} is not a commit in {git_dir}")
+    return result.stdout.strip()
+
+
+def merge_base(git_dir, base, head):
+    """SHA of the merge base of two commits (where a three-dot PR diff starts), or None if unreachable."""
+    result = subprocess.run(["git", "merge-base", base, head], cwd=git_dir, capture_output=True, text=True)
+    return result.stdout.split()[0] if result.returncode == 0 and result.stdout.strip() else None
+
+
+def _ls_tree(git_dir, commit, sizes):
+    """(mode, sha, size or None, path) of the regular files in the tree of `commit`."""
+    output = subprocess.run(["git", "ls-tree", "-r", "-z", "--full-tree"] + (["-l"] if sizes else []) + [commit],
+                            cwd=git_dir, capture_output=True, check=True).stdout
+    for record in output.split(b'\0'):
+        if not record:
+            continue
+        info, path = record.split(b'\t', 1)
+        fields = info.split()
+        # Regular files only: no symlinks (120000) or submodules (160000)
+        if fields[1] == b'blob' and fields[0] in (b'100644', b'100755'):
+            yield fields[2].decode(), int(fields[3]) if sizes else None, path.decode('utf-8', errors='surrogateescape')
+
+
+def list_tree_blobs(git_dir, commit):
+    """{path: (blob sha, size)} of the regular files in the tree of `commit`.
+
+    Sizes need every blob: in a partial (blobless) clone git fetches the missing ones
+    one at a time. Use list_local_blobs() there.
+    """
+    return {path: (sha, size) for sha, size, path in _ls_tree(git_dir, commit, sizes=True)}
+
+
+def is_partial_clone(git_dir):
+    """Whether the repository has a promisor remote, i.e. may lack objects it can fetch lazily."""
+    result = subprocess.run(["git", "config", "--get-regexp", r"^(extensions\.partialclone|remote\..*\.promisor)$"],
+                            cwd=git_dir, capture_output=True, text=True)
+    return bool(result.stdout.strip())
+
+
+def list_local_blobs(git_dir, commit):
+    """{path: blob sha} of the regular files in the tree of `commit` present in the local object store.
+
+    In a partial clone, blobs left on the remote are skipped without fetching them.
+    """
+    blobs = {path: sha for sha, _size, path in _ls_tree(git_dir, commit, sizes=False)}
+    if blobs and is_partial_clone(git_dir):
+        output = subprocess.run(["git", "rev-list", "--objects", "--no-walk", "--missing=print", commit],
+                                cwd=git_dir, env=dict(os.environ, GIT_NO_LAZY_FETCH='1'),
+                                capture_output=True, text=True, check=True).stdout
+        missing = {line[1:] for line in output.splitlines() if line.startswith('?')}
+        blobs = {path: sha for path, sha in blobs.items() if sha not in missing}
+    return blobs
+
+
+class BlobReader:
+    """One persistent `git cat-file --batch` process serving blob reads for a repository.
+
+    Objects can be named by SHA or as `<rev>:<path>`. A reader is not thread-safe;
+    give each thread its own.
+    """
+
+    def __init__(self, git_dir):
+        # Never let a partial clone fetch missing blobs one by one from the remote
+        env = dict(os.environ, GIT_NO_LAZY_FETCH='1')
+        self.process = subprocess.Popen(["git", "cat-file", "--batch"], cwd=git_dir, env=env,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        # Worker processes forked while the reader was open hold copies of the stdin pipe,
+        # so git may never see EOF; it has nothing to flush, so just stop it
+        self.process.kill()
+        self.process.wait()
+        self.process.stdout.close()
+        self.process = None
+
+    def _read_response(self):
+        header = self.process.stdout.readline()
+        if not header:
+            raise Exception("git cat-file exited unexpectedly")
+        if header.endswith(b' missing\n') or header.endswith(b' ambiguous\n'):
+            return None
+        _sha, object_type, size = header.split()
+        data = self.process.stdout.read(int(size))
+        self.process.stdout.read(1)  # trailing newline
+        return data if object_type == b'blob' else None
+
+    def read(self, name):
+        """Contents of one blob, or None if it is missing or not a blob."""
+        self.process.stdin.write(name.encode('utf-8', errors='surrogateescape') + b'\n')
+        self.process.stdin.flush()
+        return self._read_response()
+
+    def iter_blobs(self, names):
+        """Yield (name, contents or None) for many objects, in order.
+
+        Names are written from a helper thread while responses are read, so git never
+        waits on us between objects. Stopping early closes the reader.
+        """
+        names = list(names)
+
+        def write_requests():
+            try:
+                for name in names:
+                    self.process.stdin.write(name.encode('utf-8', errors='surrogateescape') + b'\n')
+                self.process.stdin.flush()
+            except (OSError, ValueError):
+                pass
+
+        writer = threading.Thread(target=write_requests, daemon=True)
+        writer.start()
+        finished = not names
+        try:
+            for index, name in enumerate(names):
+                data = self._read_response()
+                finished = index + 1 == len(names)
+                yield name, data
+        finally:
+            if not finished and self.process is not None:
+                # Unread responses would corrupt later reads
+                self.close()
+            writer.join()
+
+
+def main():
+    """List a commit's tree or print one file from the object store."""
+    parser = argparse.ArgumentParser(description="Read files at a commit without a checkout")
+    parser.add_argument("git_dir", help="Repository or bare mirror")
+    parser.add_argument("rev", help="Commit, branch or ref (e.g. refs/pull/58365/head)")
+    parser.add_argument("path", nargs='?', help="Print this file instead of listing the tree")
+
+    args = parser.parse_args()
+
+    try:
+        commit = resolve_commit(args.git_dir, args.rev)
+        if args.path:
+            with BlobReader(args.git_dir) as reader:
+                data = reader.read(f"{commit}:{args.path}")
+            if data is None:
+                print(f"❌ {args.path} does not exist at {commit[:12]}")
+                return 1
+            sys.stdout.buffer.write(data)
+            return 0
+        blobs = list_tree_blobs(args.git_dir, commit)
+        for path, (sha, size) in sorted(blobs.items()):
+            print(f"{sha} {size:>10} {path}")
+        print(f"📊 {len(blobs)} files, {sum(size for _, size in blobs.values()) / 1024 / 1024:.1f} MB at {commit[:12]}",
+              file=sys.stderr)
+        return 0
+    except Exception as e:
+        print(f"❌ Error reading {args.git_dir}: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
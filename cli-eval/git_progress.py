@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Git Progress - Event-driven reader for git's progress output.
+
+git writes progress updates terminated by carriage returns ("Receiving objects:
+ 45% (123/456), 1.20 MiB | 2.30 MiB/s\r"), so line-based readers see them late or
+in bursts. This module:
+1. Reads process output with selectors (no sleeping while data is pending)
+2. Splits records on both \r and \n
+3. Parses progress records into structured events (phase, percent, bytes, throughput)
+4. Tracks per-phase duration and throughput
+5. Can drive several git processes concurrently from one select loop
+"""
+
+import os
+import re
+import selectors
+import subprocess
+import time
+
+PROGRESS_RE = re.compile(
+    r'^(?:remote: )?(?P<phase>[A-Za-z][A-Za-z ]*?):\s+(?P<percent>\d+)%\s+\((?P<current>\d+)/(?P<total>\d+)\)'
+    r'(?:,\s+(?P<size>[\d.]+)\s+(?P<size_unit>[KMGT]?i?B))?'
+    r'(?:\s+\|\s+(?P<rate>[\d.]+)\s+(?P<rate_unit>[KMGT]?i?B)/s)?'
+    r'(?P<done>,\s+done\.?)?'
+)
+
+UNIT_BYTES = {
+    'B': 1,
+    'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3, 'TiB': 1024 ** 4,
+    'KB': 1000, 'MB': 1000 ** 2, 'GB': 1000 ** 3, 'TB': 1000 ** 4
+}
+
+
+def _to_bytes(value, unit):
+    if value is None:
+        return None
+    return int(float(value) * UNIT_BYTES.get(unit, 1))
+
+
+def format_bytes(num_bytes):
+    """Format a byte count the way git does (KiB/MiB/GiB)."""
+    if num_bytes < 1024:
+        return f"{num_bytes} B"
+    for unit in ['KiB', 'MiB', 'GiB']:
+        num_bytes /= 1024
+        if num_bytes < 1024 or unit == 'GiB':
+            return f"{num_bytes:.2f} {unit}"
+
+
+class GitProgressParser:
+    """Incremental parser turning raw git output into progress and message events."""
+
+    def __init__(self, label=None):
+        self.label = label
+        self._buffer = b''
+        self._phases = {}
+        self.phase_stats = []
+
+    def feed(self, data):
+        """Feed raw bytes; return the events for every complete record."""
+        self._buffer += data
+        events = []
+        # A record ends at \r (progress update) or \n (regular line)
+        records = re.split(rb'[\r\n]', self._buffer)
+        self._buffer = records.pop()
+        for record in records:
+            event = self._parse(record.decode('utf-8', errors='replace').strip())
+            if event:
+                events.append(event)
+        return events
+
+    def close(self):
+        """Flush any trailing partial record."""
+        events = []
+        if self._buffer:
+            event = self._parse(self._buffer.decode('utf-8', errors='replace').strip())
+            self._buffer = b''
+            if event:
+                events.append(event)
+        return events
+
+    def _parse(self, text):
+        if not text:
+            return None
+
+        match = PROGRESS_RE.match(text)
+        if not match:
+            return {'type': 'message', 'label': self.label, 'line': text}
+
+        now = time.monotonic()
+        phase = match.group('phase').strip()
+        event = {
+            'type': 'progress',
+            'label': self.label,
+            'phase': phase,
+            'percent': int(match.group('percent')),
+            'current': int(match.group('current')),
+            'total': int(match.group('total')),
+            'bytes': _to_bytes(match.group('size'), match.group('size_unit')),
+            'throughput': _to_bytes(match.group('rate'), match.group('rate_unit')),
+            'done': bool(match.group('done')),
+            'line': text
+        }
+
+        state = self._phases.setdefault(phase, {'started': now, 'finished': False})
+        if event['done'] and not state['finished']:
+            state['finished'] = True
+            elapsed = max(now - state['started'], 1e-6)
+            summary = {
+                'label': self.label,
+                'phase': phase,
+                'seconds': round(elapsed, 3),
+                'objects': event['total'],
+                'bytes': event['bytes'],
+                'throughput': event['throughput']
+            }
+            # Average over the whole phase rather than git's instantaneous rate, unless the
+            # phase was too short to time meaningfully
+            if event['bytes'] and elapsed >= 0.05:
+                summary['throughput'] = int(event['bytes'] / elapsed)
+            self.phase_stats.append(summary)
+            event['summary'] = summary
+        return event
+
+
+def run_git_processes(commands, on_event=None):
+    """Run several git commands concurrently, dispatching parsed events from one select loop.
+
+    `commands` is a list of dicts with `label`, `cmd` (shell string) and `cwd`.
+    Returns {label: {'returncode', 'phase_stats', 'messages'}}.
+    """
+    selector = selectors.DefaultSelector()
+    running = {}
+
+    for spec in commands:
+        process = subprocess.Popen(
+            spec['cmd'], shell=True, cwd=spec.get('cwd'),
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        )
+        os.set_blocking(process.stdout.fileno(), False)
+        state = {
+            'process': process,
+            'parser': GitProgressParser(spec['label']),
+            'messages': []
+        }
+        running[spec['label']] = state
+        selector.register(process.stdout, selectors.EVENT_READ, state)
+
+    def dispatch(state, events):
+        for event in events:
+            if event['type'] == 'message':
+                state['messages'].append(event['line'])
+            if on_event:
+                on_event(event)
+
+    open_streams = len(running)
+    while open_streams:
+        # Blocks until some process has output; never sleeps while data is pending
+        for key, _ in selector.select():
+            state = key.data
+            try:
+                data = os.read(key.fileobj.fileno(), 65536)
+            except BlockingIOError:
+                continue
+            if data:
+                dispatch(state, state['parser'].feed(data))
+            else:
+                dispatch(state, state['parser'].close())
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+                open_streams -= 1
+    selector.close()
+
+    results = {}
+    for label, state in running.items():
+        results[label] = {
+            'returncode': state['process'].wait(),
+            'phase_stats': state['parser'].phase_stats,
+            'messages': state['messages']
+        }
+    return results
+
+
+def run_git_with_progress(cmd, cwd=None, on_event=None):
+    """Run a single git command with event-driven progress parsing."""
+    return run_git_processes([{'label': cmd, 'cmd': cmd, 'cwd': cwd}], on_event)[cmd]
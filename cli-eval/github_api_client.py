@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+GitHub API Client - Pooled, concurrent HTTP access for the PR fetcher.
+
+This module provides:
+1. A shared requests session with a keep-alive connection pool
+2. Per-request timeouts and automatic retries for transient failures
+3. A thread pool so independent API calls can run concurrently (and overlap git clones)
+4. A configurable API root so the fetcher can be pointed at a local HTTP stand-in
+5. An on-disk conditional-request cache (ETag / Last-Modified) so 304s are served locally
+6. A rate-limit-aware token-bucket scheduler that paces requests from X-RateLimit-* headers
+   once the quota runs low, backs off on 403/429, does not charge 304s and serves cheap
+   metadata calls before large downloads (optionally shared by several processes)
+"""
+
+import fcntl
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+DEFAULT_API_ROOT = "https://api.github.com"
+DEFAULT_HTTP_CACHE_DIR = Path.home() / ".cache" / "iflow-pr-benchmark" / "http"
+
+# Response headers worth replaying when a cached body is served
+CACHED_HEADERS = ['Content-Type', 'ETag', 'Last-Modified', 'Link']
+
+# Scheduler priorities: lower values are served first
+PRIORITY_METADATA = 0
+PRIORITY_BULK = 1
+
+
+class RateLimitScheduler:
+    """Token bucket shared by every request of a client, paced from the X-RateLimit-* headers.
+    
+    Requests run unthrottled while the remaining quota is above a low-water mark; below
+    it the rest is spread evenly until the reset, so a burst never exhausts the quota
+    early but a healthy quota is used at full speed. Exhausted quotas, Retry-After and
+    secondary rate limits pause the bucket. Waiters are served in priority order, so
+    cheap metadata calls overtake queued bulk downloads.
+    
+    With `state_file`, the bucket lives in that file (under an flock) and is shared by
+    every process using the same path, e.g. the workers of a batch.
+    """
+
+    def __init__(self, burst=10, low_water=100, low_water_fraction=0.1, min_backoff=60, max_backoff=900,
+                 state_file=None):
+        self.capacity = burst
+        self.low_water = low_water
+        self.low_water_fraction = low_water_fraction
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.state_file = Path(state_file) if state_file else None
+        self.state = {
+            'tokens': float(burst),
+            'last_refill': time.time(),
+            'rate': None,  # tokens per second; unlimited above the low-water mark
+            'remaining': None,
+            'reset': None,
+            'paused_until': 0.0,
+            'backoff': min_backoff
+        }
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def _shared_state(self):
+        """Hold the bucket state; with a state file, load it and write it back under an exclusive lock."""
+        if not self.state_file:
+            yield self.state
+            return
+        with open(self.state_file, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    self.state.update(json.loads(f.read() or '{}'))
+                except ValueError:
+                    pass
+                yield self.state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(self.state))
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refill(self, state):
+        now = time.time()
+        if state['rate'] is None:
+            state['tokens'] = float(self.capacity)
+        else:
+            state['tokens'] = min(self.capacity, state['tokens'] + (now - state['last_refill']) * state['rate'])
+        state['last_refill'] = now
+
+    def acquire(self, priority=PRIORITY_METADATA):
+        """Block until this request may be sent."""
+        with self._condition:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            while True:
+                timeout = None
+                if self._waiting[0] == ticket:
+                    with self._shared_state() as state:
+                        pause = state['paused_until'] - time.time()
+                        if pause <= 0:
+                            self._refill(state)
+                            if state['tokens'] >= 1:
+                                state['tokens'] -= 1
+                                pause = None
+                            else:
+                                pause = (1 - state['tokens']) / state['rate']
+                    if pause is None:
+                        heapq.heappop(self._waiting)
+                        self._condition.notify_all()
+                        return
+                    timeout = pause
+                self._condition.wait(timeout)
+
+    def refund(self):
+        """Return the token of a request the quota did not charge (a 304 Not Modified)."""
+        with self._condition:
+            with self._shared_state() as state:
+                state['tokens'] = min(self.capacity, state['tokens'] + 1)
+            self._condition.notify_all()
+
+    def observe(self, response):
+        """Update pacing from a response; return True when the request should be retried."""
+        headers = response.headers
+        now = time.time()
+        with self._condition, self._shared_state() as state:
+            if 'X-RateLimit-Remaining' in headers and 'X-RateLimit-Reset' in headers:
+                state['remaining'] = int(headers['X-RateLimit-Remaining'])
+                state['reset'] = int(headers['X-RateLimit-Reset'])
+                limit = int(headers.get('X-RateLimit-Limit') or 0)
+                low_water = max(self.low_water, limit * self.low_water_fraction)
+                if state['remaining'] > low_water:
+                    state['rate'] = None
+                else:
+                    window = max(state['reset'] - now, 1)
+                    if state['rate'] is None:
+                        # Entering the paced zone: start from an empty bucket
+                        state['tokens'] = min(state['tokens'], 1.0)
+                    state['rate'] = max(state['remaining'] / window, 1.0 / window)
+                if state['remaining'] == 0:
+                    state['paused_until'] = max(state['paused_until'], state['reset'] + 1)
+
+            retry = False
+            if response.status_code in (403, 429):
+                retry_after = headers.get('Retry-After')
+                if retry_after and retry_after.isdigit():
+                    state['paused_until'] = max(state['paused_until'], now + int(retry_after))
+                    retry = True
+                elif state['remaining'] == 0:
+                    retry = True
+                elif response.status_code == 429 or 'rate limit' in response.text.lower():
+                    # Secondary rate limit without Retry-After: exponential backoff
+                    state['paused_until'] = max(state['paused_until'], now + state['backoff'])
+                    state['backoff'] = min(state['backoff'] * 2, self.max_backoff)
+                    retry = True
+            else:
+                state['backoff'] = self.min_backoff
+
+            if retry:
+                wait_seconds = max(state['paused_until'] - now, 0)
+                print(f"⏳ GitHub rate limit hit ({response.status_code}), pausing requests for {wait_seconds:.0f}s")
+            self._condition.notify_all()
+            return retry
+
+
+class ResponseCache:
+    """On-disk cache of GET responses keyed by URL, query parameters and Accept header."""
+
+    def __init__(self, cache_dir=DEFAULT_HTTP_CACHE_DIR):
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _key(self, url, params, accept):
+        query = urlencode(sorted((params or {}).items()))
+        return hashlib.sha256(f"{url}?{query}|{accept or ''}".encode()).hexdigest()
+
+    def _paths(self, key):
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.body"
+
+    def load(self, url, params, accept):
+        """Return (metadata, body path) for a cached response, or (None, None)."""
+        meta_path, body_path = self._paths(self._key(url, params, accept))
+        if not meta_path.exists() or not body_path.exists():
+            return None, None
+        try:
+            with open(meta_path) as f:
+                return json.load(f), body_path
+        except (OSError, ValueError):
+            return None, None
+
+    def conditional_headers(self, meta):
+        """Build If-None-Match / If-Modified-Since headers from cached metadata."""
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def is_cacheable(self, response):
+        """Only 200 responses with a validator can be revalidated later."""
+        return response.status_code == 200 and bool(
+            response.headers.get('ETag') or response.headers.get('Last-Modified')
+        )
+
+    def _metadata(self, url, params, accept, response):
+        return {
+            'url': url,
+            'params': params or {},
+            'accept': accept,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'headers': {h: response.headers[h] for h in CACHED_HEADERS if h in response.headers}
+        }
+
+    def store(self, url, params, accept, response):
+        """Persist a 200 response that carries a validator."""
+        if not self.is_cacheable(response):
+            return
+        meta_path, body_path = self._paths(self._key(url, params, accept))
+        # Write body before metadata and replace atomically so concurrent readers never see partial entries
+        self._atomic_write(body_path, response.content)
+        self._atomic_write(meta_path, json.dumps(self._metadata(url, params, accept, response), indent=2).encode())
+
+    def open_stream(self):
+        """Open a temporary body file to be filled while a response is streamed."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        return os.fdopen(fd, 'wb'), tmp_path
+
+    def commit_stream(self, url, params, accept, response, tmp_path):
+        """Move a fully streamed body into place and write its metadata."""
+        meta_path, body_path = self._paths(self._key(url, params, accept))
+        os.replace(tmp_path, body_path)
+        self._atomic_write(meta_path, json.dumps(self._metadata(url, params, accept, response), indent=2).encode())
+
+    def _atomic_write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def build_response(self, meta, body_path):
+        """Rebuild a 200 response from a cache entry after a 304."""
+        response = requests.Response()
+        response.status_code = 200
+        response.url = meta['url']
+        response.headers = CaseInsensitiveDict(meta.get('headers', {}))
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response._content = body_path.read_bytes()
+        response.from_cache = True
+        return response
+
+
+class GitHubAPIClient:
+    """Thread-safe GitHub API client with connection pooling, timeouts and retries."""
+
+    def __init__(self, api_root=None, token=None, max_workers=4, timeout=(10, 60), retries=3,
+                 cache_dir=None, scheduler=None, rate_limit_retries=5):
+        self.api_root = (api_root or os.environ.get("GITHUB_API_URL") or DEFAULT_API_ROOT).rstrip('/')
+        self.timeout = timeout
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        self.cache_hits = 0
+        self.scheduler = scheduler or RateLimitScheduler()
+        self.rate_limit_retries = rate_limit_retries
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=["GET", "HEAD"],
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers['User-Agent'] = "iflow-pr-benchmark"
+
+        token = token or os.environ.get("GITHUB_TOKEN")
+        if token:
+            self.session.headers['Authorization'] = f"Bearer {token}"
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="github-api")
+
+    def repo_url(self, owner, repo):
+        """Build the API URL of a repository."""
+        return f"{self.api_root}/repos/{owner}/{repo}"
+
+    def _send(self, url, headers, params, stream, priority):
+        """Send a GET through the rate-limit scheduler, retrying when rate limited."""
+        for _ in range(self.rate_limit_retries + 1):
+            self.scheduler.acquire(priority)
+            response = self.session.get(url, headers=headers, params=params, stream=stream, timeout=self.timeout)
+            if response.status_code == 304:
+                # Conditional requests answered 304 do not count against the quota
+                self.scheduler.refund()
+            if not self.scheduler.observe(response):
+                return response
+            response.close()
+        return response
+
+    def get(self, url, headers=None, params=None, stream=False, priority=PRIORITY_METADATA):
+        """Issue a GET request through the shared connection pool, revalidating cached responses."""
+        if not self.cache or stream:
+            return self._send(url, headers, params, stream, priority)
+
+        headers = dict(headers or {})
+        accept = headers.get('Accept')
+        meta, body_path = self.cache.load(url, params, accept)
+        if meta:
+            headers.update(self.cache.conditional_headers(meta))
+
+        response = self._send(url, headers, params, False, priority)
+
+        if response.status_code == 304 and meta:
+            # Not modified: serve the stored body (304s do not count against the rate limit)
+            self.cache_hits += 1
+            print(f"♻️  Not modified, served from cache: {url}")
+            cached = self.cache.build_response(meta, body_path)
+            cached.headers.update({k: v for k, v in response.headers.items() if k.lower().startswith('x-ratelimit')})
+            return cached
+
+        self.cache.store(url, params, accept, response)
+        return response
+
+    def iter_download(self, url, headers=None, priority=PRIORITY_BULK, chunk_size=1024 * 1024):
+        """Stream a response body in chunks with flat memory, revalidating and filling the cache."""
+        headers = dict(headers or {})
+        accept = headers.get('Accept')
+        meta = body_path = None
+        if self.cache:
+            meta, body_path = self.cache.load(url, None, accept)
+            if meta:
+                headers.update(self.cache.conditional_headers(meta))
+
+        response = self._send(url, headers, None, True, priority)
+
+        if response.status_code == 304 and meta:
+            response.close()
+            self.cache_hits += 1
+            print(f"♻️  Not modified, streaming from cache: {url}")
+            with open(body_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    yield chunk
+            return
+
+        if response.status_code != 200:
+            response.close()
+            raise Exception(f"Failed to download {url}: {response.status_code}")
+
+        # Tee the body into the cache while the caller consumes it
+        cache_file, tmp_path = (None, None)
+        if self.cache and self.cache.is_cacheable(response):
+            cache_file, tmp_path = self.cache.open_stream()
+        committed = False
+        try:
+            for chunk in response.iter_content(chunk_size):
+                if cache_file:
+                    cache_file.write(chunk)
+                yield chunk
+            if cache_file:
+                cache_file.close()
+                self.cache.commit_stream(url, None, accept, response, tmp_path)
+                committed = True
+        finally:
+            response.close()
+            if cache_file and not committed:
+                cache_file.close()
+                os.remove(tmp_path)
+
+    def get_rate_limit(self):
+        """Return the core rate limit as {'limit', 'remaining', 'reset'}, or None if unavailable."""
+        try:
+            response = self.session.get(f"{self.api_root}/rate_limit", timeout=self.timeout)
+            if response.status_code != 200:
+                return None
+            core = response.json().get('resources', {}).get('core', {})
+            return {
+                'limit': core.get('limit'),
+                'remaining': core.get('remaining'),
+                'reset': core.get('reset')
+            }
+        except (requests.RequestException, ValueError):
+            return None
+
+    def submit(self, fn, *args, **kwargs):
+        """Run a callable on the client's thread pool and return its future."""
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def close(self):
+        """Wait for outstanding calls and release pooled connections."""
+        self.executor.shutdown(wait=True)
+        self.session.close()
@@ -26,6 +26,52 @@ from typing import List, Dict, Tuple, Optional
 import re
 
 
+EXECUTION_INFO_RE = re.compile(r'<Execution Info>(.*?)</Execution Info>', re.DOTALL)
+USAGE_FIELD_RE = re.compile(r'"([A-Za-z_-]+)"\s*:\s*(\d+)')
+# Token counters in iFlow's execution info, by key with case, '_' and '-' removed
+# (iFlow forwards whatever its model provider reports)
+USAGE_KEYS = {
+    'input': {'input', 'inputtokens', 'prompttokens', 'prompttokencount'},
+    'output': {'output', 'outputtokens', 'completiontokens', 'candidatestokencount'},
+    # Cached tokens already counted in 'input' (OpenAI prompt_tokens_details.cached_tokens, DeepSeek, Gemini)
+    'cached': {'cached', 'cachedtokens', 'cachedinputtokens', 'cachehittokens', 'promptcachehittokens',
+               'cachedcontenttokencount'},
+    # Cache reads and writes counted on top of 'input' (Anthropic's cache_read_input_tokens/cache_creation_input_tokens)
+    'cache_read': {'cacheread', 'cachereadtokens', 'cachereadinputtokens'},
+    'cache_write': {'cachewrite', 'cachewritetokens', 'cachecreation', 'cachecreationtokens',
+                    'cachecreationinputtokens'}
+}
+ADDITIVE_USAGE_FIELDS = ('cache_read', 'cache_write')
+
+
+def parse_token_usage(output: str) -> Optional[Dict[str, int]]:
+    """Input (cached included), output and cached token counts from the last <Execution Info> block, or None."""
+    blocks = EXECUTION_INFO_RE.findall(output)
+    if not blocks:
+        return None
+    counters = {}
+    # The first occurrence wins: totals come before per-round breakdowns
+    for key, value in USAGE_FIELD_RE.findall(blocks[-1]):
+        normalized = key.lower().replace('_', '').replace('-', '')
+        for field, names in USAGE_KEYS.items():
+            if normalized in names and field not in counters:
+                counters[field] = int(value)
+    if 'input' not in counters:
+        return None
+    if any(field in counters for field in ADDITIVE_USAGE_FIELDS):
+        # 'input' is only the uncached remainder: the prompt is input + cache reads + cache writes
+        return {'input': counters['input'] + sum(counters.get(field, 0) for field in ADDITIVE_USAGE_FIELDS),
+                'output': counters.get('output', 0), 'cached': counters.get('cache_read', 0)}
+    return {'input': counters['input'], 'output': counters.get('output', 0), 'cached': counters.get('cached', 0)}
+
+
+def format_cache_usage(usage: Optional[Dict[str, int]]) -> str:
+    if not usage:
+        return "not reported"
+    rate = usage['cached'] / usage['input'] * 100 if usage['input'] else 0.0
+    return f"{usage['cached']:,}/{usage['input']:,} input tokens cached ({rate:.1f}%)"
+
+
 class iFlowPRBenchmark:
     """iFlow PR Benchmark - Session Management & Evaluation Only"""
     
@@ -39,6 +85,10 @@ class iFlowPRBenchmark:
         self.iflow_session_id: Optional[str] = None
         self.current_turn = 0
         
+        # Prompt-cache accounting ({turn: token usage}, parsed from <Execution Info>)
+        self.turn_usage: Dict[int, Dict[str, int]] = {}
+        self.last_usage: Optional[Dict[str, int]] = None
+        
         # PR information (loaded from workspace)
         self.repo_name = ""
         self.pr_number = ""
@@ -229,15 +279,24 @@ class iFlowPRBenchmark:
             return session_match.group(0)
         return None
     
+    def _record_usage(self, result: Dict):
+        """Parse the turn's token usage and report its prompt-cache hit rate."""
+        self.last_usage = parse_token_usage(result['output'] + '\n' + result['error'])
+        if self.last_usage:
+            self.turn_usage[self.current_turn] = self.last_usage
+        print(f"💾 Turn {self.current_turn} cache: {format_cache_usage(self.last_usage)}")
+    
     def send_initial_prompt(self, prompt: str) -> Tuple[str, float]:
         """Send initial prompt to create iFlow session."""
         print(f"🚀 Turn {self.current_turn}: Creating new iFlow session with initial context...")
         
+        self.last_usage = None
         cmd = ["iflow", "-p", prompt]
         result = self._execute_iflow_command(cmd, timeout=180)
         
         if not result['success']:
             raise Exception(result['error'])
+        self._record_usage(result)
         
         # Extract session ID from both stdout and stderr
         combined_output = result['output'] + '\n' + result['error']
@@ -257,11 +316,13 @@ class iFlowPRBenchmark:
         if not self.iflow_session_id:
             raise Exception("No active session ID")
         
+        self.last_usage = None
         cmd = ["iflow", "-r", self.iflow_session_id, "-p", question]
         result = self._execute_iflow_command(cmd, timeout=120)
         
         if not result['success']:
             raise Exception(result['error'])
+        self._record_usage(result)
         
         self.current_turn += 1
         return result['output'], result['response_time']
@@ -308,6 +369,7 @@ This file contains the complete benchmark results for iFlow CLI evaluation.
 - **Session ID:** {self.iflow_session_id or 'Not captured'}
 - **Turn:** 0 (Session Creation)
 - **Response Time:** {response_time:.1f}s
+- **Prompt Cache:** {format_cache_usage(self.last_usage)}
 
 ### Initial Prompt Sent to iFlow:
 ```
@@ -338,6 +400,7 @@ This file contains the complete benchmark results for iFlow CLI evaluation.
 **Question:** {question}
 **iFlow Answer:** {answer}
 **Response Time:** {response_time:.1f}s
+**Prompt Cache:** {format_cache_usage(self.last_usage)}
 **Timestamp:** {timestamp}
 
 ---
@@ -347,6 +410,20 @@ This file contains the complete benchmark results for iFlow CLI evaluation.
         with open(self.answers_file, 'a') as f:
             f.write(content)
     
+    def cache_summary(self) -> str:
+        """Cached/total input tokens over all turns that reported usage."""
+        if not self.turn_usage:
+            return "not reported"
+        total = {'input': sum(u['input'] for u in self.turn_usage.values()),
+                 'cached': sum(u['cached'] for u in self.turn_usage.values())}
+        return f"{format_cache_usage(total)} over {len(self.turn_usage)} turns"
+    
+    def cache_rates_by_turn(self) -> str:
+        rates = []
+        for turn, usage in sorted(self.turn_usage.items()):
+            rates.append(f"T{turn} {usage['cached'] / usage['input'] * 100 if usage['input'] else 0.0:.1f}%")
+        return ', '.join(rates)
+    
     def finalize_results(self, total_questions: int, total_time: float, 
                         memory_references: int, detailed_responses: int):
         """Finalize the results file with summary statistics."""
@@ -366,6 +443,8 @@ This file contains the complete benchmark results for iFlow CLI evaluation.
 - **Average Response Time:** {avg_time:.1f}s
 - **Memory References Detected:** {memory_references}
 - **Detailed Responses:** {detailed_responses}
+- **Prompt Cache:** {self.cache_summary()}
+- **Cache Hit Rate by Turn:** {self.cache_rates_by_turn() or 'not reported'}
 
 ---"""
         
@@ -473,6 +552,9 @@ This file contains the complete benchmark results for iFlow CLI evaluation.
             print(f"⏱️  Total time: {total_time:.1f}s")
             print(f"📊 Detailed responses: {detailed_responses}/{len(questions)} ({detailed_responses/len(questions)*100:.1f}%)")
             print(f"🧠 Memory references: {memory_references}")
+            print(f"💾 Prompt cache: {self.cache_summary()}")
+            if self.turn_usage:
+                print(f"💾 Hit rate by turn: {self.cache_rates_by_turn()}")
             print(f"📄 Results: {self.answers_file}")
             
             return True
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+Local GitHub - Offline stand-in for the GitHub API and git hosting, for load tests.
+
+Serves, from a fixtures directory:
+1. GET /repos/{owner}/{repo}/pulls/{n} - PR JSON, or the diff with the diff media type
+2. GET /repos/{owner}/{repo}/pulls/{n}/files - paginated (per_page/page, Link headers)
+3. GET /rate_limit and X-RateLimit-* headers from a simulated core rate limit,
+   with ETags so conditional requests get 304s that do not count against it
+4. git over smart HTTP (/git/{owner}/{repo}.git, via `git http-backend`, --filter allowed) or
+   the file protocol, from local bare repositories
+5. GET /_stats - request counts, status codes and latency percentiles
+
+Latency, jitter and API error injection (5xx, secondary rate limits) are configurable.
+
+Fixtures layout (PR data is derived from the bare repository unless a file overrides it):
+    fixtures/apache/airflow.git/                    bare repo with refs/pull/<n>/head
+    fixtures/apache/airflow/pulls/58365.json        PR fields (merged over the derived ones)
+    fixtures/apache/airflow/pulls/58365.files.json  changed files list
+    fixtures/apache/airflow/pulls/58365.diff        diff media type body
+
+Usage:
+    git clone --mirror https://github.com/apache/airflow.git fixtures/apache/airflow.git
+    python3 local_github_server.py fixtures --port 8765 --latency-ms 40 --error-rate 0.01
+    # then, in the shell printed by the server:
+    python3 batch_pr_fetcher.py --manifest prs.yaml --workers 50 --api-base http://127.0.0.1:8765
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from diff_parser import iter_file_diffs, iter_lines_from_chunks
+
+PULL_RE = re.compile(r'^/repos/([^/]+)/([^/]+)/pulls/(\d+)(/files)?/?$')
+DIFF_MEDIA_TYPES = ('application/vnd.github.v3.diff', 'application/vnd.github.diff')
+DEFAULT_PER_PAGE = 30
+MAX_PER_PAGE = 100
+
+
+class FixtureStore:
+    """PR data for the server: fixture files, else derived once from the bare repository."""
+
+    def __init__(self, root):
+        self.root = Path(root).resolve()
+        self._cache = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def git_dir(self, owner, repo):
+        return self.root / owner / f"{repo}.git"
+
+    def allow_filters(self):
+        """Let file:// clones use --filter: git runs their upload-pack without the client's config."""
+        for git_dir in self.root.glob("*/*.git"):
+            self._git(git_dir, "config", "uploadpack.allowFilter", "true")
+
+    def _git(self, git_dir, *args):
+        return subprocess.run(["git", "--git-dir", str(git_dir)] + list(args), capture_output=True,
+                              check=True).stdout
+
+    def _derive(self, owner, repo, number):
+        """PR fields, changed files and diff computed from refs/pull/<n>/head in the bare repo."""
+        git_dir = self.git_dir(owner, repo)
+        if not git_dir.is_dir():
+            return {}, None, None
+        try:
+            head_sha = self._git(git_dir, "rev-parse", f"refs/pull/{number}/head").decode().strip()
+        except subprocess.CalledProcessError:
+            return {}, None, None
+        base_ref = self._git(git_dir, "symbolic-ref", "--short", "HEAD").decode().strip()
+        base_sha = self._git(git_dir, "rev-parse", f"refs/heads/{base_ref}").decode().strip()
+        merge_base = self._git(git_dir, "merge-base", base_sha, head_sha).decode().strip()
+        diff = self._git(git_dir, "diff", "-M", merge_base, head_sha)
+        files = []
+        for entry in iter_file_diffs(iter_lines_from_chunks([diff])):
+            entry.pop('binary', None)
+            entry['changes'] = entry['additions'] + entry['deletions']
+            files.append(entry)
+        subject, body, author, created, updated = self._git(
+            git_dir, "log", "-1", "--format=%s%x00%b%x00%an%x00%aI%x00%cI", head_sha).decode().rstrip('\n').split('\0')
+        commits = int(self._git(git_dir, "rev-list", "--count", f"{merge_base}..{head_sha}").decode())
+        pull = {
+            'number': number, 'title': subject, 'body': body.strip(), 'state': 'open',
+            'created_at': created, 'updated_at': updated, 'user': {'login': author},
+            'base': {'ref': base_ref, 'sha': base_sha}, 'head': {'ref': f"pr-{number}", 'sha': head_sha},
+            'commits': commits, 'additions': sum(f['additions'] for f in files),
+            'deletions': sum(f['deletions'] for f in files), 'changed_files': len(files)
+        }
+        return pull, files, diff
+
+    def pull_data(self, owner, repo, number):
+        """(pull dict, files list, diff bytes) or None when the PR is unknown. Cached per PR."""
+        key = (owner, repo, number)
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+            lock = self._locks.setdefault(key, threading.Lock())
+        # One thread derives a PR while concurrent requests for it wait
+        with lock:
+            if key in self._cache:
+                return self._cache[key]
+            pull, files, diff = self._derive(owner, repo, number)
+            fixture_dir = self.root / owner / repo / "pulls"
+            pull_file = fixture_dir / f"{number}.json"
+            if pull_file.exists():
+                pull = dict(pull, **json.loads(pull_file.read_text()))
+            files_file = fixture_dir / f"{number}.files.json"
+            if files_file.exists():
+                files = json.loads(files_file.read_text())
+            diff_file = fixture_dir / f"{number}.diff"
+            if diff_file.exists():
+                diff = diff_file.read_bytes()
+            data = (pull, files or [], diff or b'') if pull else None
+            with self._lock:
+                self._cache[key] = data
+            return data
+
+
+class RateLimit:
+    """Simulated core rate limit: `limit` requests per `window` seconds."""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.used = 0
+        self.reset = time.time() + window
+        self._lock = threading.Lock()
+
+    def _roll(self):
+        if time.time() >= self.reset:
+            self.used = 0
+            self.reset = time.time() + self.window
+
+    def take(self):
+        """Count one request; False when the limit is exhausted."""
+        with self._lock:
+            self._roll()
+            if self.used >= self.limit:
+                return False
+            self.used += 1
+            return True
+
+    def headers(self):
+        with self._lock:
+            self._roll()
+            return {
+                'X-RateLimit-Limit': str(self.limit),
+                'X-RateLimit-Remaining': str(max(self.limit - self.used, 0)),
+                'X-RateLimit-Reset': str(int(self.reset)),
+                'X-RateLimit-Used': str(self.used),
+                'X-RateLimit-Resource': 'core'
+            }
+
+
+class ServerStats:
+    """Thread-safe request accounting for /_stats and the shutdown summary."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.by_route = {}
+        self.by_status = {}
+        self.durations = []
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def record(self, route, status, seconds, bytes_sent):
+        with self._lock:
+            self.by_route[route] = self.by_route.get(route, 0) + 1
+            self.by_status[str(status)] = self.by_status.get(str(status), 0) + 1
+            self.durations.append(seconds)
+            self.bytes_sent += bytes_sent
+
+    def summary(self):
+        with self._lock:
+            durations = sorted(self.durations)
+            elapsed = max(time.time() - self.started, 1e-9)
+
+            def percentile(fraction):
+                return round(durations[min(int(len(durations) * fraction), len(durations) - 1)] * 1000, 1) \
+                    if durations else None
+
+            return {
+                'requests': len(durations),
+                'requests_per_second': round(len(durations) / elapsed, 1),
+                'by_route': dict(self.by_route),
+                'by_status': dict(self.by_status),
+                'bytes_sent': self.bytes_sent,
+                'latency_ms': {'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99),
+                               'max': percentile(1.0)}
+            }
+
+
+class LocalGitHubHandler(BaseHTTPRequestHandler):
+    """Routes API, git and stats requests; keep-alive so pooled clients reuse connections."""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "LocalGitHub/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        start_time = time.perf_counter()
+        self._bytes_sent = 0
+        url = urlsplit(self.path)
+        if url.path == '/_stats':
+            route = 'stats'
+            status = self._send_json(200, self.server.stats.summary())
+        else:
+            self.server.inject_latency()
+            if url.path.startswith('/git/'):
+                route = 'git'
+                status = self._serve_git(method, url)
+            else:
+                route, status = self._serve_api(url)
+        self.server.stats.record(route, status, time.perf_counter() - start_time, self._bytes_sent)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD' and body:
+            self.wfile.write(body)
+            self._bytes_sent += len(body)
+        return status
+
+    def _send_json(self, status, data, headers=None):
+        return self._send(status, json.dumps(data).encode(), 'application/json; charset=utf-8', headers)
+
+    # --- API ---
+
+    def _serve_api(self, url):
+        server = self.server
+        injected = server.injected_error()
+        if injected:
+            status, headers, message = injected
+            headers.update(server.rate_limit.headers())
+            return 'api_error', self._send_json(status, {'message': message}, headers)
+
+        match = PULL_RE.match(url.path)
+        if url.path == '/rate_limit':
+            route = 'rate_limit'
+            core = {k: int(v) for k, v in server.rate_limit.headers().items() if k != 'X-RateLimit-Resource'}
+            body = {'resources': {'core': {'limit': core['X-RateLimit-Limit'], 'remaining': core['X-RateLimit-Remaining'],
+                                           'reset': core['X-RateLimit-Reset'], 'used': core['X-RateLimit-Used']}}}
+            return route, self._send_json(200, body, server.rate_limit.headers())
+        if not match:
+            return 'not_found', self._send_json(404, {'message': 'Not Found'})
+
+        owner, repo, number, files = match.group(1), match.group(2), int(match.group(3)), match.group(4)
+        data = server.store.pull_data(owner, repo, number)
+        if data is None:
+            return 'not_found', self._send_json(404, {'message': 'Not Found'})
+        pull, changed_files, diff = data
+
+        headers = {}
+        if files:
+            route = 'pull_files'
+            query = parse_qs(url.query)
+            per_page = min(int(query.get('per_page', [DEFAULT_PER_PAGE])[0]), MAX_PER_PAGE)
+            page = max(int(query.get('page', [1])[0]), 1)
+            last_page = max((len(changed_files) + per_page - 1) // per_page, 1)
+            body = json.dumps(changed_files[(page - 1) * per_page:page * per_page]).encode()
+            content_type = 'application/json; charset=utf-8'
+            headers['Link'] = self._link_header(url.path, per_page, page, last_page)
+        elif any(media in self.headers.get('Accept', '') for media in DIFF_MEDIA_TYPES):
+            route = 'pull_diff'
+            body = diff
+            content_type = 'text/plain; charset=utf-8'
+        else:
+            route = 'pull'
+            body = json.dumps(pull).encode()
+            content_type = 'application/json; charset=utf-8'
+
+        etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+        headers['ETag'] = etag
+        if self.headers.get('If-None-Match') == etag:
+            # Like GitHub, conditional hits do not count against the rate limit
+            headers.update(server.rate_limit.headers())
+            return route, self._send(304, b'', content_type, headers)
+        if not server.rate_limit.take():
+            headers = server.rate_limit.headers()
+            return 'rate_limited', self._send_json(403, {'message': 'API rate limit exceeded (local stand-in)'},
+                                                   headers)
+        headers.update(server.rate_limit.headers())
+        return route, self._send(200, body, content_type, headers)
+
+    def _link_header(self, path, per_page, page, last_page):
+        base = f"http://{self.headers.get('Host', 'localhost')}{path}?per_page={per_page}&page="
+        links = []
+        if page < last_page:
+            links += [f'<{base}{page + 1}>; rel="next"', f'<{base}{last_page}>; rel="last"']
+        if page > 1:
+            links += [f'<{base}1>; rel="first"', f'<{base}{page - 1}>; rel="prev"']
+        return ', '.join(links)
+
+    # --- git smart HTTP ---
+
+    def _read_request_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if size == 0:
+                    # Trailer section ends with an empty line
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass
+                    return b''.join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _serve_git(self, method, url):
+        """Run `git http-backend` as a CGI for /git/<owner>/<repo>.git/... and stream its output."""
+        body = self._read_request_body() if method == 'POST' else b''
+        env = {
+            'PATH': os.environ.get('PATH', '/usr/bin:/bin'),
+            'HOME': os.environ.get('HOME', '/'),
+            'GIT_PROJECT_ROOT': str(self.server.store.root),
+            'GIT_HTTP_EXPORT_ALL': '1',
+            'GATEWAY_INTERFACE': 'CGI/1.1',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REQUEST_METHOD': method,
+            'PATH_INFO': url.path[len('/git'):],
+            'QUERY_STRING': url.query,
+            'CONTENT_TYPE': self.headers.get('Content-Type', ''),
+            'CONTENT_LENGTH': str(len(body)),
+            'REMOTE_ADDR': self.client_address[0],
+            'GIT_PROTOCOL': self.headers.get('Git-Protocol', ''),
+            'HTTP_CONTENT_ENCODING': self.headers.get('Content-Encoding', ''),
+        }
+        # Like GitHub: any reachable commit can be fetched by SHA, and --filter (blobless) clones are honored
+        process = subprocess.Popen(["git", "-c", "uploadpack.allowAnySHA1InWant=true",
+                                    "-c", "uploadpack.allowFilter=true", "http-backend"], env=env,
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        writer = threading.Thread(target=self._feed_stdin, args=(process, body), daemon=True)
+        writer.start()
+
+        status = 200
+        headers = []
+        while True:
+            line = process.stdout.readline().rstrip(b'\r\n')
+            if not line:
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.lower() == 'status':
+                status = int(value.strip().split()[0])
+            else:
+                headers.append((name, value.strip()))
+
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for chunk in iter(lambda: process.stdout.read1(64 * 1024), b''):
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            self._bytes_sent += len(chunk)
+        self.wfile.write(b'0\r\n\r\n')
+        process.stdout.close()
+        process.wait()
+        writer.join()
+        return status
+
+    @staticmethod
+    def _feed_stdin(process, body):
+        try:
+            process.stdin.write(body)
+            process.stdin.close()
+        except OSError:
+            pass
+
+
+class LocalGitHubServer(ThreadingHTTPServer):
+    """Threaded stand-in server; one handler thread per connection."""
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, fixtures_dir, latency_ms=0, jitter_ms=0, error_rate=0.0, error_codes=(502,),
+                 rate_limit=5000, rate_window=3600, seed=None, verbose=False):
+        super().__init__(address, LocalGitHubHandler)
+        self.store = FixtureStore(fixtures_dir)
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.error_codes = list(error_codes)
+        self.rate_limit = RateLimit(rate_limit, rate_window)
+        self.stats = ServerStats()
+        self.verbose = verbose
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def inject_latency(self):
+        if self.latency or self.jitter:
+            with self._random_lock:
+                delay = self.latency + self._random.uniform(0, self.jitter)
+            time.sleep(delay)
+
+    def injected_error(self):
+        """(status, headers, message) for an injected API failure, or None."""
+        with self._random_lock:
+            if not self.error_rate or self._random.random() >= self.error_rate:
+                return None
+            status = self._random.choice(self.error_codes)
+        if status in (403, 429):
+            return status, {'Retry-After': '1'}, "You have exceeded a secondary rate limit (injected)"
+        return status, {}, "Server Error (injected)"
+
+    def client_env(self, git_protocol='http'):
+        """Environment that points the fetcher's API and https://github.com/ clones at this server."""
+        git_root = f"{self.url}/git/" if git_protocol == 'http' else f"file://{self.store.root}/"
+        if git_protocol == 'file':
+            self.store.allow_filters()
+        return {
+            'GITHUB_API_URL': self.url,
+            'GIT_CONFIG_COUNT': '1',
+            'GIT_CONFIG_KEY_0': f"url.{git_root}.insteadOf",
+            'GIT_CONFIG_VALUE_0': 'https://github.com/'
+        }
+
+
+def start_server(fixtures_dir, port=0, host='127.0.0.1', **options):
+    """Start a server on a background thread (port 0 picks a free port). Returns the server."""
+    server = LocalGitHubServer((host, port), fixtures_dir, **options)
+    threading.Thread(target=server.serve_forever, name="local-github", daemon=True).start()
+    return server
+
+
+def main():
+    """Serve PR fixtures as a local GitHub API and git host."""
+    parser = argparse.ArgumentParser(description="Offline GitHub API and git stand-in for fetcher load tests")
+    parser.add_argument("fixtures", help="Fixtures directory (<owner>/<repo>.git bare repos, optional PR overrides)")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    parser.add_argument("--git-protocol", choices=["http", "file"], default="http",
+                        help="How clones reach the bare repos: smart HTTP through this server, or file://")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay added to every request")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Random extra delay up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of API requests that fail")
+    parser.add_argument("--error-codes", default="502",
+                        help="Comma-separated statuses for injected failures (403/429 act as secondary limits)")
+    parser.add_argument("--rate-limit", type=int, default=5000, help="Core requests per window (default: 5000)")
+    parser.add_argument("--rate-window", type=int, default=3600, help="Rate limit window in seconds")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible latency/error injection")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+
+    args = parser.parse_args()
+
+    if not Path(args.fixtures).is_dir():
+        print(f"❌ Fixtures directory not found: {args.fixtures}")
+        return 1
+
+    server = LocalGitHubServer((args.host, args.port), args.fixtures, latency_ms=args.latency_ms,
+                               jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                               error_codes=[int(code) for code in args.error_codes.split(',')],
+                               rate_limit=args.rate_limit, rate_window=args.rate_window, seed=args.seed,
+                               verbose=args.verbose)
+    repos = sorted(p.relative_to(server.store.root).as_posix() for p in server.store.root.glob("*/*.git"))
+    print(f"🛰️  Local GitHub serving {len(repos)} repositories on {server.url}")
+    for repo in repos:
+        print(f"  📦 {repo}")
+    print("\n💡 Point the fetcher at it with:")
+    for name, value in server.client_env(args.git_protocol).items():
+        print(f"export {name}='{value}'")
+    print(f"\n📊 Live stats: {server.url}/_stats (Ctrl-C to stop)")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    print("\n📊 Request summary:")
+    print(json.dumps(server.stats.summary(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
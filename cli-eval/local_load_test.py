@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Local Load Test - Run batch_pr_fetcher against the offline GitHub stand-in.
+
+This script:
+1. Starts local_github_server.py on a free port (in-process, background thread)
+2. Writes a manifest of N workspaces from the fixture repository's refs/pull/<n>/head
+   (or uses the given manifest) and runs batch_pr_fetcher.py with that many workers,
+   cloning every workspace from the stand-in instead of a shared mirror
+3. Checks that sparse workspaces really are partial clones (promisor remote, blobs missing)
+4. Reports batch durations, the server's request/latency stats and writes them as JSON
+
+Usage:
+    git clone --mirror https://github.com/apache/airflow.git fixtures/apache/airflow.git
+    python3 local_load_test.py fixtures --repo apache/airflow --count 50 --workers 50 --sparse --latency-ms 40
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from batch_pr_fetcher import load_manifest
+from local_github_server import start_server
+
+
+def pull_numbers(git_dir):
+    """PR numbers with a refs/pull/<n>/head ref in the fixture repository."""
+    refs = subprocess.run(["git", "--git-dir", str(git_dir), "for-each-ref", "--format=%(refname)", "refs/pull/"],
+                          capture_output=True, text=True, check=True).stdout.split()
+    return sorted(int(ref.split('/')[2]) for ref in refs if ref.endswith('/head'))
+
+
+def write_manifest(path, repo, numbers, count, output_root, sparse):
+    """One manifest line per workspace, cycling through the PRs until `count` workspaces."""
+    with open(path, 'w') as f:
+        for index in range(count):
+            number = numbers[index % len(numbers)]
+            f.write(json.dumps({'repo': repo, 'pr': number, 'sparse': sparse,
+                                'output_dir': str(Path(output_root) / f"ws_{index:03d}_pr{number}")}) + '\n')
+
+
+def inspect_workspace(output_dir):
+    """Partial-clone facts of a prepared workspace: promisor remote and missing objects."""
+    repo_dirs = [p.parent for p in Path(output_dir).glob("*/.git")]
+    if not repo_dirs:
+        return None
+    repo_dir = repo_dirs[0]
+    promisor = subprocess.run(["git", "-C", str(repo_dir), "config", "--bool", "remote.origin.promisor"],
+                              capture_output=True, text=True).stdout.strip() == 'true'
+    objects = subprocess.run(["git", "-C", str(repo_dir), "rev-list", "--objects", "--all", "--missing=print"],
+                             capture_output=True, text=True).stdout.splitlines()
+    return {'promisor': promisor, 'missing_objects': sum(1 for line in objects if line.startswith('?'))}
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    return {name: round(values[min(int(len(values) * fraction), len(values) - 1)], 2)
+            for name, fraction in (('p50', 0.5), ('p95', 0.95), ('max', 1.0))}
+
+
+def main():
+    """Main function to load-test the batch fetcher against the local stand-in."""
+    parser = argparse.ArgumentParser(description="Run batch_pr_fetcher against the offline GitHub stand-in")
+    parser.add_argument("fixtures", help="Fixtures directory for local_github_server.py")
+    parser.add_argument("--repo", help="owner/repo to generate the manifest from (default: the only fixture repo)")
+    parser.add_argument("--manifest", help="Use this manifest instead of generating one")
+    parser.add_argument("--count", type=int, default=50, help="Workspaces in the generated manifest (default: 50)")
+    parser.add_argument("--workers", type=int, default=50, help="Batch workers (default: 50)")
+    parser.add_argument("--sparse", action="store_true", help="Blobless sparse workspaces in the generated manifest")
+    parser.add_argument("--mirror-cache", default="",
+                        help="Shared mirror directory for the batch (default: none, every workspace clones "
+                             "from the stand-in)")
+    parser.add_argument("--output-root", default="load_test", help="Directory for workspaces and reports")
+    parser.add_argument("--force", action="store_true", help="Delete a non-empty output root first")
+    parser.add_argument("--git-protocol", choices=["http", "file"], default="http",
+                        help="How clones reach the bare repos: smart HTTP through the server, or file://")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay added to every request")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Random extra delay up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of API requests that fail")
+    parser.add_argument("--error-codes", default="502", help="Comma-separated statuses for injected failures")
+    parser.add_argument("--rate-limit", type=int, default=5000, help="Core requests per window (default: 5000)")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible latency/error injection")
+
+    args = parser.parse_args()
+
+    output_root = Path(args.output_root).resolve()
+    if output_root.exists() and any(output_root.iterdir()):
+        if not args.force:
+            print(f"❌ Output root {output_root} is not empty (use --force to clear it)")
+            return 1
+        shutil.rmtree(output_root)
+    output_root.mkdir(parents=True, exist_ok=True)
+
+    server = start_server(args.fixtures, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                          error_rate=args.error_rate,
+                          error_codes=[int(code) for code in args.error_codes.split(',')],
+                          rate_limit=args.rate_limit, seed=args.seed)
+    try:
+        if args.manifest:
+            manifest_path = Path(args.manifest)
+        else:
+            repos = sorted(p.relative_to(server.store.root).as_posix()[:-len('.git')]
+                           for p in server.store.root.glob("*/*.git"))
+            repo = args.repo or (repos[0] if len(repos) == 1 else None)
+            if not repo:
+                print(f"❌ Pick one of the fixture repositories with --repo: {', '.join(repos)}")
+                return 1
+            numbers = pull_numbers(server.store.git_dir(*repo.split('/')))
+            if not numbers:
+                print(f"❌ No refs/pull/<n>/head in the fixture repository {repo}")
+                return 1
+            manifest_path = output_root / "manifest.jsonl"
+            write_manifest(manifest_path, repo, numbers, args.count, output_root, args.sparse)
+            print(f"📋 {args.count} workspaces over {len(numbers)} PRs of {repo}")
+
+        print(f"🛰️  Local GitHub on {server.url} ({args.git_protocol} clones)")
+        report_path = output_root / "batch_report.json"
+        env = dict(os.environ, **server.client_env(args.git_protocol))
+        command = [sys.executable, str(Path(__file__).resolve().parent / "batch_pr_fetcher.py"),
+                   "--manifest", str(manifest_path), "--workers", str(args.workers),
+                   "--output-root", str(output_root), "--report", str(report_path),
+                   "--mirror-cache", args.mirror_cache, "--api-base", server.url,
+                   "--http-cache", str(output_root / "http_cache")]
+        start_time = time.time()
+        batch_exit = subprocess.run(command, env=env).returncode
+        wall_time = time.time() - start_time
+        server_stats = server.stats.summary()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    if not report_path.exists():
+        print(f"❌ Batch wrote no report (exit code {batch_exit})")
+        return 1
+    batch = json.loads(report_path.read_text())
+
+    # Sparse items must be real partial clones: a promisor remote and blobs left on the server
+    sparse_dirs = {item['output_dir'] for item in load_manifest(manifest_path, output_root) if item['sparse']}
+    partial = {'checked': 0, 'promisor': 0, 'with_missing_blobs': 0, 'missing_objects': 0}
+    for item in batch['items']:
+        facts = inspect_workspace(item['output_dir']) \
+            if item['status'] == 'ok' and item['output_dir'] in sparse_dirs else None
+        if facts is None:
+            continue
+        partial['checked'] += 1
+        partial['promisor'] += facts['promisor']
+        partial['with_missing_blobs'] += facts['missing_objects'] > 0
+        partial['missing_objects'] += facts['missing_objects']
+
+    summary = {
+        'workers': args.workers,
+        'git_protocol': args.git_protocol,
+        'wall_time': round(wall_time, 2),
+        'succeeded': batch['succeeded'],
+        'failed': batch['failed'],
+        'item_duration': percentiles([item['duration'] for item in batch['items'] if item['status'] == 'ok']),
+        'partial_clones': partial,
+        'server': server_stats
+    }
+    summary_path = output_root / "load_test_report.json"
+    summary_path.write_text(json.dumps(summary, indent=2))
+
+    print(f"\n🎯 LOAD TEST COMPLETED")
+    print("=" * 40)
+    print(f"✅ Succeeded: {batch['succeeded']}/{batch['total']} with {args.workers} workers in {wall_time:.1f}s")
+    if summary['item_duration']:
+        durations = summary['item_duration']
+        print(f"⏱️  Per workspace: p50 {durations['p50']}s, p95 {durations['p95']}s, max {durations['max']}s")
+    latency = server_stats['latency_ms']
+    print(f"🛰️  Server: {server_stats['requests']} requests {server_stats['by_route']}, "
+          f"statuses {server_stats['by_status']}, p50 {latency['p50']}ms, p95 {latency['p95']}ms")
+    if partial['checked']:
+        print(f"🧩 Partial clones: {partial['promisor']}/{partial['checked']} promisor, "
+              f"{partial['with_missing_blobs']}/{partial['checked']} with blobs left on the server "
+              f"({partial['missing_objects']} missing objects)")
+    print(f"📄 Report: {summary_path}")
+
+    not_partial = partial['checked'] - min(partial['promisor'], partial['with_missing_blobs'])
+    if not_partial:
+        print(f"❌ {not_partial} sparse workspaces are not partial clones")
+    return 0 if batch['failed'] == 0 and not not_partial else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
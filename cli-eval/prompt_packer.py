@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Prompt Packer - Fill a token budget with the most useful context units of a PR.
+
+Candidate units come from the prepared workspace:
+1. PR description (pr_N_info.json) and the full changed-files list
+2. Diff hunks (hunk index over the compact or full pr_N.diff, else per-file patches
+   from pr_N_files.json)
+3. Functions enclosing each change and related tests (context_pack/)
+4. Callers and callees of each changed function (call_graph.json)
+
+Units are ranked by value and packed greedily. A unit that does not fit is
+replaced by a one-line summary pointing at where to read it, so the agent
+still knows where to look; the budget used is reported. Token counts are
+estimated at ~4 characters per token (no tokenizer dependency).
+
+Usage:
+    python3 prompt_packer.py pr_workspace_apache --budget 8000
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from call_graph import GRAPH_MD_NAME, load_call_graph, render_function_section
+from context_pack import PACK_DIR_NAME, load_pack_index, test_subject
+from diff_compactor import compact_paths, load_compaction
+from diff_index import DiffIndex
+from diff_parser import is_diff_summary
+from symbol_index import language_for
+
+CHARS_PER_TOKEN = 4
+# Base value of each kind of unit; hunks and functions get a bonus for the size of the change
+KIND_WEIGHTS = {'description': 10.0, 'files': 9.0, 'hunk': 6.0, 'function': 5.0, 'calls': 4.0, 'test': 2.0}
+SECTION_TITLES = [
+    ('description', 'PR Description'),
+    ('files', 'All Changed Files'),
+    ('hunk', 'Diff Hunks'),
+    ('function', 'Functions Around the Changes'),
+    ('calls', 'Callers and Callees'),
+    ('test', 'Related Tests'),
+]
+SUMMARY_FILES_SHOWN = 10
+DESCRIPTION_SUMMARY_CHARS = 400
+NOT_INCLUDED_LINE = "\nNot included above (read on demand):\n"
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _fenced(title, text, fence=''):
+    return f"#### {title}\n```{fence}\n{text.rstrip()}\n```\n"
+
+
+def _change_bonus(changes, is_test):
+    """Bigger changes are worth more; changes to tests less."""
+    return min(changes, 40) / 10 - (2.0 if is_test else 0.0)
+
+
+def _unit(kind, order, text, summary, score):
+    return {'kind': kind, 'order': order, 'text': text, 'summary': summary, 'score': score,
+            'tokens': estimate_tokens(text), 'summary_tokens': estimate_tokens(summary)}
+
+
+def _hunk_units_from_index(diff_file):
+    units = []
+    with DiffIndex.load(diff_file) as index:
+        for file_index, entry in enumerate(index.index['files']):
+            is_test = bool(test_subject(entry['filename']))
+            for hunk_index, hunk in enumerate(entry['hunks']):
+                end = hunk['new_start'] + max(hunk['new_lines'] - 1, 0)
+                where = f" in `{hunk['symbol']}`" if hunk['symbol'] else ""
+                title = f"{entry['filename']} lines {hunk['new_start']}-{end}{where}"
+                units.append(_unit(
+                    'hunk', (file_index, hunk_index),
+                    _fenced(title, index.hunk_text(entry['filename'], hunk_index), 'diff'),
+                    f"- `{entry['filename']}` lines {hunk['new_start']}-{end}{where} "
+                    f"(+{hunk['additions']}/-{hunk['deletions']}, see {Path(diff_file).name})\n",
+                    KIND_WEIGHTS['hunk'] + _change_bonus(hunk['additions'] + hunk['deletions'], is_test)))
+    return units
+
+
+def _hunk_units_from_patches(changed_files, files_list_name):
+    """Per-file patches split at hunk headers (used when the diff is compressed or summarized)."""
+    units = []
+    for file_index, entry in enumerate(changed_files):
+        hunks = []
+        for line in (entry.get('patch') or '').splitlines():
+            if line.startswith('@@') or not hunks:
+                hunks.append([])
+            hunks[-1].append(line)
+        is_test = bool(test_subject(entry['filename']))
+        for hunk_index, lines in enumerate(hunks):
+            changes = sum(1 for line in lines if line[:1] in ('+', '-'))
+            header = lines[0] if lines[0].startswith('@@') else ''
+            units.append(_unit(
+                'hunk', (file_index, hunk_index),
+                _fenced(f"{entry['filename']} {header}", '\n'.join(lines), 'diff'),
+                f"- `{entry['filename']}` {header} (see {files_list_name})\n",
+                KIND_WEIGHTS['hunk'] + _change_bonus(changes, is_test)))
+    return units
+
+
+def _is_summarized(diff_file):
+    with open(diff_file, 'rb') as f:
+        return is_diff_summary(f.readline())
+
+
+def collect_units(workspace_dir, pr_info, changed_files):
+    """Every candidate context unit of a prepared workspace."""
+    workspace_dir = Path(workspace_dir)
+    pr_number = pr_info['pr_number']
+    units = []
+
+    body = (pr_info.get('body') or '').strip()
+    if body:
+        summary = body if len(body) <= DESCRIPTION_SUMMARY_CHARS else body[:DESCRIPTION_SUMMARY_CHARS] + "..."
+        units.append(_unit('description', 0, body + "\n", summary + f"\n(full text in pr_{pr_number}_context.md)\n",
+                           KIND_WEIGHTS['description']))
+
+    if changed_files:
+        lines = [f"- {f['status']} `{f['filename']}` (+{f.get('additions', 0)}/-{f.get('deletions', 0)})"
+                 for f in changed_files]
+        more = len(lines) - SUMMARY_FILES_SHOWN
+        summary = '\n'.join(lines[:SUMMARY_FILES_SHOWN]) + (
+            f"\n- ... {more} more (see pr_{pr_number}_files.json)" if more > 0 else "")
+        units.append(_unit('files', 0, '\n'.join(lines) + "\n", summary + "\n", KIND_WEIGHTS['files']))
+
+    diff_file = workspace_dir / f"pr_{pr_number}.diff"
+    hunk_units = []
+    if diff_file.exists() and not _is_summarized(diff_file):
+        if load_compaction(diff_file) is not None:
+            # Trimmed hunks cost fewer tokens; noise files have no hunks there at all
+            diff_file, _ = compact_paths(diff_file)
+        try:
+            hunk_units = _hunk_units_from_index(diff_file)
+        except Exception:
+            pass
+    if not hunk_units:
+        # No plain diff (compressed, summarized above the size cap or missing): fall back to the API patches
+        hunk_units = _hunk_units_from_patches(changed_files, f"pr_{pr_number}_files.json")
+    units += hunk_units
+
+    pack = load_pack_index(workspace_dir)
+    if pack:
+        pack_dir = workspace_dir / PACK_DIR_NAME
+        for file_index, row in enumerate(pack['files']):
+            if not row.get('sections'):
+                continue
+            head_lines = (pack_dir / row['head']).read_text().splitlines()
+            is_test = bool(test_subject(row['path']))
+            for section_index, (title, first, last) in enumerate(row['sections']):
+                numbered = '\n'.join(f"{n:>5}  {line}" for n, line in enumerate(head_lines[first - 1:last], first))
+                units.append(_unit(
+                    'function', (file_index, section_index),
+                    _fenced(f"{row['path']}: {title}, lines {first}-{last}", numbered, language_for(row['path']) or ''),
+                    f"- `{row['path']}`: {title}, lines {first}-{last} (see {PACK_DIR_NAME}/{row['functions']})\n",
+                    KIND_WEIGHTS['function'] + _change_bonus(row['additions'] + row['deletions'], is_test) / 2))
+        for test_index, test in enumerate(pack['tests']):
+            name_match = 'name match' in test['reason']
+            units.append(_unit(
+                'test', test_index,
+                _fenced(f"{test['path']} ({test['reason']})", (pack_dir / test['file']).read_text(),
+                        language_for(test['path']) or ''),
+                f"- `{test['path']}` - {test['reason']} (see {PACK_DIR_NAME}/{test['file']})\n",
+                KIND_WEIGHTS['test'] + (1.0 if name_match else 0.0)))
+
+    graph = load_call_graph(workspace_dir)
+    if graph:
+        for function_index, function in enumerate(graph['functions']):
+            if function['status'] == 'removed':
+                continue
+            units.append(_unit(
+                'calls', function_index, render_function_section(function).replace("## ", "#### ", 1),
+                f"- `{function['qualname']}`: {len(function['callers'])} callers, "
+                f"{len(function['callees'])} callees (see {GRAPH_MD_NAME})\n",
+                KIND_WEIGHTS['calls'] - (1.0 if test_subject(function['path']) else 0.0)))
+    return units
+
+
+def _section_header(kind):
+    return f"\n### {dict(SECTION_TITLES)[kind]}\n"
+
+
+def pack_units(units, budget):
+    """Greedily choose full text or summary for each unit, best first. Returns (units, report).
+
+    The section header of a kind, and its "not included" line once it has a summary, are
+    charged with the first unit that needs them, so the rendered text stays within budget.
+    """
+    used = 0
+    with_header, with_summary_line = set(), set()
+    for unit in sorted(units, key=lambda u: (-u['score'], u['kind'], u['order'])):
+        kind = unit['kind']
+        header = 0 if kind in with_header else estimate_tokens(_section_header(kind))
+        summary_line = 0 if kind in with_summary_line else estimate_tokens(NOT_INCLUDED_LINE)
+        if used + header + unit['tokens'] <= budget:
+            unit['mode'] = 'full'
+            used += header + unit['tokens']
+        elif used + header + summary_line + unit['summary_tokens'] <= budget:
+            unit['mode'] = 'summary'
+            used += header + summary_line + unit['summary_tokens']
+            with_summary_line.add(kind)
+        else:
+            unit['mode'] = 'dropped'
+            continue
+        with_header.add(kind)
+    report = {
+        'budget': budget,
+        'used': used,
+        'full': sum(1 for u in units if u['mode'] == 'full'),
+        'summarized': sum(1 for u in units if u['mode'] == 'summary'),
+        'dropped': sum(1 for u in units if u['mode'] == 'dropped'),
+        'candidate_tokens': sum(u['tokens'] for u in units)
+    }
+    return units, report
+
+
+def render_units(units):
+    """Markdown for packed units, one section per kind, summaries after full units."""
+    text = ""
+    for kind, _title in SECTION_TITLES:
+        kept = sorted((u for u in units if u['kind'] == kind and u['mode'] != 'dropped'), key=lambda u: u['order'])
+        if not kept:
+            continue
+        text += _section_header(kind)
+        text += ''.join(u['text'] for u in kept if u['mode'] == 'full')
+        summaries = [u['summary'] for u in kept if u['mode'] == 'summary']
+        if summaries:
+            if len(summaries) < len(kept):
+                text += NOT_INCLUDED_LINE
+            text += ''.join(summaries)
+    return text
+
+
+def pack_context(workspace_dir, pr_info, changed_files, budget):
+    """(markdown, report) of the best context that fits `budget` estimated tokens."""
+    units, report = pack_units(collect_units(workspace_dir, pr_info, changed_files), max(budget, 0))
+    text = render_units(units)
+    # What was actually rendered (at most the charged total)
+    report['used'] = estimate_tokens(text)
+    return text, report
+
+
+def main():
+    """Show what fits into a token budget for a prepared workspace."""
+    parser = argparse.ArgumentParser(description="Pack PR context units into a token budget")
+    parser.add_argument("workspace", help="PR workspace directory")
+    parser.add_argument("--budget", type=int, default=8000, help="Token budget (default: 8000)")
+
+    args = parser.parse_args()
+
+    try:
+        workspace_dir = Path(args.workspace)
+        pr_info_files = list(workspace_dir.glob("pr_*_info.json"))
+        if not pr_info_files:
+            raise Exception(f"No PR info file in {workspace_dir}")
+        with open(pr_info_files[0]) as f:
+            pr_info = json.load(f)
+        files_list = workspace_dir / f"pr_{pr_info['pr_number']}_files.json"
+        changed_files = json.loads(files_list.read_text()) if files_list.exists() else []
+        text, report = pack_context(workspace_dir, pr_info, changed_files, args.budget)
+        print(text)
+        print(f"📏 Used ~{report['used']}/{report['budget']} tokens: {report['full']} units in full, "
+              f"{report['summarized']} summarized, {report['dropped']} dropped "
+              f"(~{report['candidate_tokens']} tokens of candidates)", file=sys.stderr)
+        return 0
+    except Exception as e:
+        print(f"❌ Error packing context: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Related Files - BM25 index over a repository for finding files related to a PR.
+
+The index lives in <workspace>/related_index/:
+1. index.json - indexed commit, blob table (one document per git blob, with its
+   length in terms) and path -> document map
+2. seg_NNNN.bin - immutable segments of term postings (sorted terms, document ids, term counts)
+
+Terms are the identifiers in a file plus their camelCase/snake_case parts, so
+`spawn_workers_with_gc_freeze` also matches `gc` and `freeze`. Like the code
+search index, documents are git blobs: checking out another PR only indexes
+new blobs, and the index can be built from a commit's tree without a checkout.
+
+Queries are built from the identifiers on the diff's changed lines and the
+changed file names; files outside the PR (other than vendored or generated
+ones) are ranked by BM25, plus a bonus for query terms in the path, and
+returned with the lines that match best, so the prompt can name callers,
+tests and configuration up front.
+
+Usage:
+    python3 related_files.py build pr_workspace_apache
+    python3 related_files.py build pr_workspace_apache --git-dir airflow.git --commit refs/pull/58365/head
+    python3 related_files.py query pr_workspace_apache --top 10
+    python3 related_files.py query pr_workspace_apache --terms "gc_freeze spawn_worker"
+"""
+
+import argparse
+import gzip
+import itertools
+import json
+import math
+import mmap
+import os
+import re
+import sys
+import time
+from array import array
+from collections import Counter
+from pathlib import Path
+
+from blob_index import MAX_FILE_BYTES, BlobDocumentIndex, add_build_parser, read_file_prefix, run_build
+from diff_compactor import path_reason
+from diff_parser import is_diff_summary
+
+INDEX_DIR_NAME = "related_index"
+INDEX_VERSION = 1
+SEGMENT_MAGIC = b'BM25'
+# BM25 parameters (the usual defaults)
+K1 = 1.2
+B = 0.75
+# Weight of a query term found in a file's path, relative to its BM25 idf
+PATH_BOOST = 2.0
+MAX_QUERY_TERMS = 48
+DEFAULT_TOP_K = 10
+SNIPPETS_PER_FILE = 2
+MAX_SNIPPET_CHARS = 160
+MAX_TERM_LENGTH = 64
+TERM_CACHE_SIZE = 200000
+IDENTIFIER_RE = re.compile(rb'[A-Za-z_][A-Za-z0-9_]+')
+SUBWORD_RE = re.compile(rb'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+')
+# Keywords and names too common in code to say anything about relatedness
+STOP_TERMS = {
+    b'self', b'cls', b'def', b'return', b'import', b'from', b'class', b'if', b'else', b'elif', b'for', b'in',
+    b'not', b'and', b'or', b'is', b'none', b'true', b'false', b'the', b'to', b'of', b'with', b'as', b'try',
+    b'except', b'raise', b'pass', b'this', b'var', b'let', b'const', b'function', b'func', b'new', b'null',
+    b'nil', b'int', b'str', b'bool', b'void', b'public', b'private', b'static', b'err', b'package',
+    b'lambda', b'yield', b'while', b'break', b'continue', b'async', b'await', b'an', b'be', b'it', b'on', b'at'
+}
+
+_term_cache = {}
+
+
+def _identifier_terms(identifier):
+    """Terms for one identifier: itself and its camelCase/snake_case parts (lowercased bytes)."""
+    terms = _term_cache.get(identifier)
+    if terms is not None:
+        return terms
+    whole = identifier.lower()
+    terms = [] if whole in STOP_TERMS or len(whole) > MAX_TERM_LENGTH else [whole]
+    parts = SUBWORD_RE.findall(identifier)
+    if len(parts) > 1:
+        for part in dict.fromkeys(part.lower() for part in parts):
+            if len(part) >= 3 and part != whole and part not in STOP_TERMS:
+                terms.append(part)
+    if len(_term_cache) < TERM_CACHE_SIZE:
+        _term_cache[identifier] = terms
+    return terms
+
+
+def term_counts(data):
+    """{term: count} for a bytes text."""
+    counts = {}
+    for identifier, count in Counter(IDENTIFIER_RE.findall(data)).items():
+        for term in _identifier_terms(identifier):
+            counts[term] = counts.get(term, 0) + count
+    return counts
+
+
+def path_terms(path):
+    return set(term_counts(path.encode('utf-8', errors='surrogateescape').replace(b'/', b' ').replace(b'.', b' ')))
+
+
+def _data_terms(data):
+    """(length, {term: count}) of a file's contents, or None for binary/huge files."""
+    if data is None or len(data) > MAX_FILE_BYTES or b'\0' in data[:8192]:
+        return None
+    counts = term_counts(data)
+    return sum(counts.values()), counts
+
+
+def _read_file_terms(path):
+    """Worker: terms of one checked-out file."""
+    return _data_terms(read_file_prefix(path))
+
+
+def _blob_batch_terms(blobs):
+    """Worker: terms for a batch of blob contents."""
+    return [_data_terms(data) for data in blobs]
+
+
+class Segment:
+    """Memory-mapped immutable segment: sorted terms, posting offsets, document ids and counts."""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = view = memoryview(self._mmap)
+        if bytes(view[:4]) != SEGMENT_MAGIC:
+            raise Exception(f"{path} is not a related-files index segment")
+        term_count, posting_count, text_size = array('I', bytes(view[4:16]))
+        start = 16
+        self.term_offsets = view[start:start + 4 * (term_count + 1)].cast('I')
+        start += 4 * (term_count + 1)
+        self.text = view[start:start + text_size]
+        start += text_size + (-text_size % 4)
+        self.offsets = view[start:start + 4 * (term_count + 1)].cast('I')
+        start += 4 * (term_count + 1)
+        self.docs = view[start:start + 4 * posting_count].cast('I')
+        start += 4 * posting_count
+        self.counts = view[start:start + 4 * posting_count].cast('I')
+        self.term_count = term_count
+
+    def _term(self, index):
+        return bytes(self.text[self.term_offsets[index]:self.term_offsets[index + 1]])
+
+    def _find(self, term):
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < self.term_count and self._term(low) == term else None
+
+    def document_frequency(self, term):
+        index = self._find(term)
+        return 0 if index is None else self.offsets[index + 1] - self.offsets[index]
+
+    def postings(self, term):
+        """(document ids, counts) of a term."""
+        index = self._find(term)
+        if index is None:
+            return (), ()
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.docs[start:end], self.counts[start:end]
+
+    def close(self):
+        for view in (self.term_offsets, self.text, self.offsets, self.docs, self.counts, self._view):
+            view.release()
+        self._mmap.close()
+        self._file.close()
+
+
+def write_segment(path, doc_terms):
+    """Write a segment from {doc_id: {term: count}}."""
+    postings = {}
+    for doc_id in sorted(doc_terms):
+        for term, count in doc_terms[doc_id].items():
+            entry = postings.get(term)
+            if entry is None:
+                entry = postings[term] = (array('I'), array('I'))
+            entry[0].append(doc_id)
+            entry[1].append(count)
+
+    terms = sorted(postings)
+    term_offsets = array('I', [0])
+    for term in terms:
+        term_offsets.append(term_offsets[-1] + len(term))
+    text = b''.join(terms)
+    offsets = array('I', [0])
+    docs = array('I')
+    counts = array('I')
+    for term in terms:
+        doc_ids, doc_counts = postings[term]
+        docs.extend(doc_ids)
+        counts.extend(doc_counts)
+        offsets.append(len(docs))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(SEGMENT_MAGIC)
+        array('I', [len(terms), len(docs), len(text)]).tofile(f)
+        term_offsets.tofile(f)
+        f.write(text + b'\0' * (-len(text) % 4))
+        offsets.tofile(f)
+        docs.tofile(f)
+        counts.tofile(f)
+    os.replace(tmp_path, path)
+
+
+class RelatedFilesIndex(BlobDocumentIndex):
+    """BM25 index over one repository checkout (or one commit's tree), stored under index_dir."""
+
+    DIR_NAME = INDEX_DIR_NAME
+    VERSION = INDEX_VERSION
+    NAME = "related-files index"
+    ICON = "📚"
+    SCRIPT = "related_files.py"
+    segment_class = Segment
+    file_worker = staticmethod(_read_file_terms)
+    batch_worker = staticmethod(_blob_batch_terms)
+
+    def _empty_state(self):
+        return dict(super()._empty_state(), lengths=[])
+
+    def _add_document(self, terms):
+        length, counts = terms
+        self.state['lengths'].append(length)
+        return counts
+
+    def _write_segment(self, path, doc_terms):
+        write_segment(path, doc_terms)
+
+    def _document_lines(self, path):
+        """Lines of an indexed file (bytes), from the checkout or (tree indexes) the object store."""
+        return self._document_data(path).splitlines()
+
+    def idf(self, terms):
+        """{term: BM25 idf} over the documents currently checked out (approximate df: includes stale blobs)."""
+        total = max(len(set(self.state['paths'].values())), 1)
+        result = {}
+        for term in terms:
+            df = sum(segment.document_frequency(term) for segment in self.segments())
+            if df:
+                result[term] = math.log(1 + (total - df + 0.5) / (df + 0.5))
+        return result
+
+    def search(self, query, top_k=DEFAULT_TOP_K, exclude=()):
+        """Best files for a {term: weight} query: [(path, score, {term: contribution})]."""
+        idf = self.idf(query)
+        # Keep the most informative terms; long diffs otherwise make every file match
+        terms = sorted(idf, key=lambda term: -idf[term] * query[term])[:MAX_QUERY_TERMS]
+        paths = self.state['paths']
+        live_docs = set(paths.values())
+        lengths = self.state['lengths']
+        average_length = sum(lengths[doc_id] for doc_id in live_docs) / max(len(live_docs), 1) or 1
+
+        doc_scores = {}
+        for term in terms:
+            weight = idf[term] * query[term]
+            for segment in self.segments():
+                docs, counts = segment.postings(term)
+                for doc_id, count in zip(docs, counts):
+                    if doc_id not in live_docs:
+                        continue
+                    norm = K1 * (1 - B + B * lengths[doc_id] / average_length)
+                    contributions = doc_scores.setdefault(doc_id, {})
+                    contributions[term] = weight * count * (K1 + 1) / (count + norm)
+
+        exclude = set(exclude)
+        results = []
+        for path, doc_id in paths.items():
+            # Vendored copies, generated files and lockfiles are never what a reviewer is after
+            if path in exclude or path_reason(path):
+                continue
+            contributions = dict(doc_scores.get(doc_id, {}))
+            for term in path_terms(path) & set(terms):
+                contributions[term] = contributions.get(term, 0) + PATH_BOOST * idf[term] * query[term]
+            if contributions:
+                results.append((path, sum(contributions.values()), contributions))
+        results.sort(key=lambda result: (-result[1], result[0]))
+        return results[:top_k]
+
+    def snippets(self, path, idf, count=SNIPPETS_PER_FILE):
+        """[(line number, text)] of the lines of `path` richest in query terms."""
+        try:
+            lines = self._document_lines(path)
+        except OSError:
+            return []
+        scored = []
+        for line_number, line in enumerate(lines, 1):
+            score = sum(idf.get(term, 0) for term in term_counts(line))
+            if score:
+                scored.append((score, line_number))
+        best = sorted(sorted(scored, reverse=True)[:count], key=lambda item: item[1])
+        return [(line_number, lines[line_number - 1].decode('utf-8', errors='replace').strip()[:MAX_SNIPPET_CHARS])
+                for _score, line_number in best]
+
+
+def open_index(workspace_dir):
+    """Open the related-files index stored in a PR workspace."""
+    return RelatedFilesIndex.open_workspace(workspace_dir)
+
+
+def _iter_changed_lines(workspace_dir, pr_number):
+    """Added/removed lines and hunk function contexts of a workspace's PR diff (bytes)."""
+    workspace_dir = Path(workspace_dir)
+    for name, opener in ((f"pr_{pr_number}.diff", open), (f"pr_{pr_number}.diff.gz", gzip.open)):
+        diff_file = workspace_dir / name
+        if diff_file.exists():
+            with opener(diff_file, 'rb') as f:
+                first_line = f.readline()
+                if is_diff_summary(first_line):
+                    break
+                for line in itertools.chain([first_line], f):
+                    if line.startswith((b'+++ ', b'--- ')):
+                        continue
+                    if line[:1] in (b'+', b'-'):
+                        yield line[1:]
+                    elif line.startswith(b'@@'):
+                        yield line.rsplit(b'@@', 1)[-1]
+            return
+    # Summarized (above the size cap) or missing diff: fall back to the patches in the files list
+    files_list = workspace_dir / f"pr_{pr_number}_files.json"
+    if files_list.exists():
+        with open(files_list) as f:
+            for entry in json.load(f):
+                for line in (entry.get('patch') or '').splitlines():
+                    if line[:1] in ('+', '-'):
+                        yield line[1:].encode('utf-8', errors='replace')
+
+
+def diff_query(workspace_dir, pr_number, changed_paths):
+    """{term: weight} from the identifiers on the diff's changed lines and the changed file names."""
+    counts = Counter()
+    for line in _iter_changed_lines(workspace_dir, pr_number):
+        counts.update(term_counts(line))
+    for path in changed_paths:
+        counts.update(dict.fromkeys(path_terms(Path(path).stem), 2))
+    # Repeating an identifier in the diff makes it count a little more, not linearly more
+    return {term: 1 + math.log(count) for term, count in counts.items()}
+
+
+def find_related_files(workspace_dir, top_k=DEFAULT_TOP_K, terms=None):
+    """Files outside the PR most related to its diff: [{path, score, terms, snippets}]."""
+    workspace_dir = Path(workspace_dir)
+    pr_info_files = list(workspace_dir.glob("pr_*_info.json"))
+    if not pr_info_files:
+        raise Exception(f"No PR info file in {workspace_dir}")
+    with open(pr_info_files[0]) as f:
+        pr_number = json.load(f)['pr_number']
+    files_list = workspace_dir / f"pr_{pr_number}_files.json"
+    changed_paths = [entry['filename'] for entry in json.loads(files_list.read_text())] if files_list.exists() else []
+
+    if terms:
+        query = {term: 1.0 for term in term_counts(terms.encode('utf-8'))}
+    else:
+        query = diff_query(workspace_dir, pr_number, changed_paths)
+    index = open_index(workspace_dir)
+    try:
+        results = []
+        for path, score, contributions in index.search(query, top_k, exclude=changed_paths):
+            top_terms = sorted(contributions, key=lambda term: -contributions[term])
+            results.append({
+                'path': path,
+                'score': round(score, 2),
+                'terms': [term.decode() for term in top_terms[:5]],
+                'snippets': index.snippets(path, {term: contributions[term] for term in top_terms})
+            })
+        return results
+    finally:
+        index.close()
+
+
+def main():
+    """Build or query the related-files index of a PR workspace."""
+    parser = argparse.ArgumentParser(description="BM25 related-file retrieval over a PR workspace")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_build_parser(subparsers)
+
+    query_parser = subparsers.add_parser("query", help="Rank files related to the PR diff")
+    query_parser.add_argument("workspace", help="PR workspace directory")
+    query_parser.add_argument("--top", type=int, default=DEFAULT_TOP_K, help="Number of files to return")
+    query_parser.add_argument("--terms", help="Query these identifiers instead of the diff's")
+    query_parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "build":
+            run_build(RelatedFilesIndex, parser, args)
+            return 0
+
+        start_time = time.perf_counter()
+        results = find_related_files(args.workspace, args.top, args.terms)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            for result in results:
+                print(f"{result['score']:>8.2f}  {result['path']}  ({', '.join(result['terms'])})")
+                for line_number, text in result['snippets']:
+                    print(f"          {line_number}: {text}")
+        print(f"📚 {len(results)} related files in {(time.perf_counter() - start_time) * 1000:.1f} ms",
+              file=sys.stderr)
+        return 0 if results else 1
+    except Exception as e:
+        print(f"❌ Related-files lookup failed: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Symbol Index - Definitions, imports and call sites of a PR's changed files.
+
+At fetch time this module:
+1. Parses every changed file (Python with `ast`, other languages with regexes)
+2. Records classes, functions, methods, imports and call sites
+3. Finds the other files that import or call the changed files' symbols, using the
+   code search index (or `git grep`) to pick candidates and parsing only those in a
+   worker pool
+4. Writes everything to <workspace>/symbol_index.json
+
+Files are read from the checkout, or with `head_sha` and `from_tree=True` straight
+from the object store through `git cat-file --batch` (no checkout needed).
+
+Prompt construction and answer verification then resolve "where is X defined /
+used" with a dictionary lookup instead of scanning the tree.
+
+Usage:
+    python3 symbol_index.py where pr_workspace_apache DagRun
+    python3 symbol_index.py uses pr_workspace_apache get_task_instance
+"""
+
+import argparse
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from code_search import INDEX_DIR_NAME as CODE_INDEX_DIR_NAME, CodeSearchIndex, string_trigrams
+from git_blobs import BlobReader, list_tree_blobs
+
+INDEX_NAME = "symbol_index.json"
+INDEX_VERSION = 1
+MAX_FILE_BYTES = 1024 * 1024
+MAX_REFERENCES_PER_SYMBOL = 200
+# Candidate files sent to a worker process at a time
+PARSE_BATCH = 64
+# Too generic to be worth chasing across the repository
+IGNORED_SYMBOLS = {'main', 'run', 'get', 'set', 'setup', 'teardown', 'init', 'test', 'name', 'value', 'data'}
+
+LANGUAGES = {
+    '.py': 'python', '.pyi': 'python',
+    '.js': 'javascript', '.jsx': 'javascript', '.mjs': 'javascript', '.ts': 'typescript', '.tsx': 'typescript',
+    '.java': 'java', '.kt': 'kotlin', '.scala': 'scala', '.go': 'go', '.rs': 'rust', '.rb': 'ruby',
+    '.c': 'c', '.h': 'c', '.cc': 'cpp', '.cpp': 'cpp', '.hpp': 'cpp', '.cs': 'csharp', '.php': 'php',
+    '.tf': 'terraform', '.swift': 'swift'
+}
+
+DEFINITION_RE = re.compile(
+    r'^\s*(?:(?:export|default|public|private|protected|internal|static|async|abstract|final|override|pub|'
+    r'unsafe|open|sealed|data)\s+)*'
+    r'(?P<kind>class|interface|struct|enum|trait|func|function|fn|def|type|module)\s+'
+    r'(?:\([^)]*\)\s*)?(?P<name>[A-Za-z_]\w*)'
+)
+# Java/C-style methods: return type, name, parameter list, then a body or throws clause
+METHOD_RE = re.compile(
+    r'^\s*(?:(?:public|private|protected|static|final|abstract|synchronized|virtual|override|inline)\s+)*'
+    r'[\w<>\[\],.?]+\s+(?P<name>[A-Za-z_]\w*)\s*\([^;]*$'
+)
+IMPORT_RE = re.compile(
+    r'^\s*(?:import\s+(?P<java>[\w.*]+)|from\s+[\'"]?(?P<from>[\w./@-]+)[\'"]?\s+import|'
+    r'import\s+.*?from\s+[\'"](?P<es>[^\'"]+)[\'"]|(?:const|let|var)\s+.*?require\([\'"](?P<req>[^\'"]+)[\'"]\)|'
+    r'#include\s+[<"](?P<inc>[^>"]+)[>"]|use\s+(?P<use>[\w:]+))'
+)
+CALL_RE = re.compile(r'\b([A-Za-z_]\w*)\s*\(')
+CALL_KEYWORDS = {'if', 'for', 'while', 'switch', 'return', 'catch', 'sizeof', 'function', 'elif', 'and', 'or', 'not',
+                 'with', 'print', 'super', 'new', 'typeof', 'await', 'yield', 'in', 'lambda'}
+
+
+def language_for(path):
+    return LANGUAGES.get(os.path.splitext(path)[1].lower())
+
+
+class _PythonVisitor(ast.NodeVisitor):
+    """Collect definitions (with qualified names), imports and call sites."""
+
+    def __init__(self):
+        self.definitions = []
+        self.imports = []
+        self.calls = []
+        # (name, kind) of the enclosing definitions
+        self._scope = []
+
+    def _define(self, node, kind):
+        qualname = '.'.join([name for name, _ in self._scope] + [node.name])
+        self.definitions.append({'name': node.name, 'qualname': qualname, 'kind': kind, 'line': node.lineno,
+                                 'end_line': getattr(node, 'end_lineno', node.lineno)})
+        self._scope.append((node.name, kind))
+        self.generic_visit(node)
+        self._scope.pop()
+
+    def visit_ClassDef(self, node):
+        self._define(node, 'class')
+
+    def visit_FunctionDef(self, node):
+        in_class = bool(self._scope) and self._scope[-1][1] == 'class'
+        self._define(node, 'method' if in_class else 'function')
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.imports.append({'module': alias.name, 'names': [alias.name.split('.')[-1]], 'line': node.lineno})
+
+    def visit_ImportFrom(self, node):
+        module = '.' * node.level + (node.module or '')
+        self.imports.append({'module': module, 'names': [alias.name for alias in node.names], 'line': node.lineno})
+
+    def visit_Call(self, node):
+        func = node.func
+        name = func.id if isinstance(func, ast.Name) else func.attr if isinstance(func, ast.Attribute) else None
+        if name:
+            self.calls.append({'name': name, 'line': node.lineno})
+        self.generic_visit(node)
+
+
+def parse_python(source):
+    visitor = _PythonVisitor()
+    visitor.visit(ast.parse(source))
+    return {'definitions': visitor.definitions, 'imports': visitor.imports, 'calls': visitor.calls}
+
+
+def parse_generic(source):
+    """Regex fallback for languages without a parser here."""
+    definitions, imports, calls = [], [], []
+    for line_number, line in enumerate(source.splitlines(), 1):
+        match = DEFINITION_RE.match(line)
+        if match:
+            kind = {'def': 'function', 'func': 'function', 'fn': 'function'}.get(match.group('kind'), match.group('kind'))
+            definitions.append({'name': match.group('name'), 'qualname': match.group('name'), 'kind': kind,
+                                'line': line_number, 'end_line': line_number})
+            continue
+        match = IMPORT_RE.match(line)
+        if match:
+            module = next(value for value in match.groupdict().values() if value)
+            imports.append({'module': module, 'names': [re.split(r'[./:]', module.rstrip('.*'))[-1]],
+                            'line': line_number})
+            continue
+        match = METHOD_RE.match(line)
+        if match and match.group('name') not in CALL_KEYWORDS:
+            definitions.append({'name': match.group('name'), 'qualname': match.group('name'), 'kind': 'method',
+                                'line': line_number, 'end_line': line_number})
+            continue
+        for name in CALL_RE.findall(line):
+            if name not in CALL_KEYWORDS:
+                calls.append({'name': name, 'line': line_number})
+    return {'definitions': definitions, 'imports': imports, 'calls': calls}
+
+
+def parse_source(source, path):
+    """Parse one file's text into definitions/imports/calls."""
+    language = language_for(str(path)) or 'text'
+    result = None
+    if language == 'python':
+        try:
+            result = parse_python(source)
+        except (SyntaxError, ValueError):
+            result = None
+    if result is None:
+        result = parse_generic(source)
+    result['language'] = language
+    return result
+
+
+def parse_file(path):
+    """Parse one file into definitions/imports/calls, or None if unreadable or binary."""
+    source = _read_text(path)
+    return None if source is None else parse_source(source, path)
+
+
+def decode_text(data):
+    if data is None or len(data) > MAX_FILE_BYTES or b'\0' in data[:8192]:
+        return None
+    return data.decode('utf-8', errors='replace')
+
+
+def _read_text(path):
+    try:
+        with open(path, 'rb') as f:
+            return decode_text(f.read(MAX_FILE_BYTES + 1))
+    except OSError:
+        return None
+
+
+def iter_sources(repo_dir, paths, commit=None):
+    """Yield (path, text or None) from the checkout, or from `commit` in the object store."""
+    if commit is None:
+        for path in paths:
+            yield path, _read_text(Path(repo_dir) / path)
+        return
+    # Request blobs by SHA: resolving "<commit>:<path>" per file costs a tree walk each
+    tree = list_tree_blobs(repo_dir, commit)
+    paths = list(paths)
+    with BlobReader(repo_dir) as reader:
+        blobs = reader.iter_blobs(tree[path][0] for path in paths if path in tree)
+        for path in paths:
+            yield path, decode_text(next(blobs)[1]) if path in tree else None
+
+
+def find_references(source, path, names, names_re):
+    """[(name, line, 'import'|'call')] of `names` in one file's text."""
+    if language_for(str(path)) == 'python':
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError):
+            tree = None
+        if tree is not None:
+            references = []
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Import):
+                    references += [(a.name.split('.')[-1], node.lineno, 'import') for a in node.names]
+                elif isinstance(node, ast.ImportFrom):
+                    references += [(a.name, node.lineno, 'import') for a in node.names]
+                elif isinstance(node, ast.Call):
+                    func = node.func
+                    name = func.id if isinstance(func, ast.Name) else getattr(func, 'attr', None)
+                    references.append((name, node.lineno, 'call'))
+            return sorted((r for r in references if r[0] in names), key=lambda r: r[1])
+
+    # Regex fallback, limited to the lines that mention a name
+    lines = [(n, line) for n, line in enumerate(source.splitlines(), 1) if names_re.search(line)]
+    parsed = parse_generic('\n'.join(line for _, line in lines))
+    line_numbers = [n for n, _ in lines]
+    references = [(name, line_numbers[r['line'] - 1], 'import')
+                  for r in parsed['imports'] for name in r['names']]
+    references += [(r['name'], line_numbers[r['line'] - 1], 'call') for r in parsed['calls']]
+    return sorted((r for r in references if r[0] in names), key=lambda r: r[1])
+
+
+def _references_batch(batch, names, names_re):
+    """Worker: find_references() for a batch of (path, text)."""
+    return [(path, find_references(source, path, names, names_re)) for path, source in batch]
+
+
+def _iter_references(sources, names, names_re, workers=None):
+    """Yield (path, references) for files mentioning a name, parsed in a process pool.
+
+    Sources are read (and prefiltered) here while earlier batches are parsed.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        window = []
+        batch = []
+        for path, source in sources:
+            if source is None or not names_re.search(source):
+                continue
+            batch.append((path, source))
+            if len(batch) >= PARSE_BATCH:
+                window.append(pool.submit(_references_batch, batch, names, names_re))
+                batch = []
+                if len(window) >= workers * 2:
+                    yield from window.pop(0).result()
+        if batch:
+            window.append(pool.submit(_references_batch, batch, names, names_re))
+        for future in window:
+            yield from future.result()
+
+
+def _candidate_files(workspace_dir, repo_dir, symbols, commit=None):
+    """Files that may mention any of the symbols: code index candidates, else `git grep`."""
+    index_dir = Path(workspace_dir) / CODE_INDEX_DIR_NAME
+    if (index_dir / "index.json").exists():
+        index = CodeSearchIndex(index_dir, repo_dir)
+        candidates = set()
+        for symbol in symbols:
+            candidates.update(index.candidate_paths(string_trigrams(symbol)))
+        index.close()
+        return candidates
+
+    if not symbols:
+        return set()
+    command = ["git", "grep", "-l", "-I", "-w", "-F"]
+    for symbol in symbols:
+        command += ["-e", symbol]
+    if commit:
+        command.append(commit)
+    result = subprocess.run(command, cwd=repo_dir, capture_output=True, text=True)
+    paths = result.stdout.splitlines()
+    # Grepping a commit prefixes every path with "<commit>:"
+    return {path[len(commit) + 1:] for path in paths} if commit else set(paths)
+
+
+def build_symbol_index(workspace_dir, repo_dir, changed_paths, head_sha=None, from_tree=False, workers=None):
+    """Parse changed files, resolve their dependents and write symbol_index.json.
+
+    With `from_tree`, files are read from `head_sha` in repo_dir's object store
+    (repo_dir may be a bare mirror) instead of the checkout.
+    """
+    start_time = time.time()
+    workspace_dir = Path(workspace_dir)
+    repo_dir = Path(repo_dir)
+    commit = head_sha if from_tree else None
+    if from_tree and not head_sha:
+        raise Exception("Indexing from the object store needs a head SHA")
+
+    files = {}
+    for path, source in iter_sources(repo_dir, changed_paths, commit):
+        if source is not None:
+            files[path] = parse_source(source, path)
+
+    symbols = {}
+    for path, parsed in files.items():
+        for definition in parsed['definitions']:
+            entry = symbols.setdefault(definition['name'], {'definitions': [], 'references': []})
+            entry['definitions'].append([path, definition['line'], definition['kind'], definition['qualname']])
+
+    # Dependents: other files importing or calling the changed files' top-level symbols (method
+    # names like `decode` or `run` match unrelated objects everywhere)
+    chased = {name for name, entry in symbols.items()
+              if any('.' not in d[3] for d in entry['definitions'])
+              and len(name) >= 3 and name.lower() not in IGNORED_SYMBOLS and not name.startswith('__')}
+    candidates = _candidate_files(workspace_dir, repo_dir, chased, commit)
+    dependents = {}
+    found = []
+    for path in sorted(candidates & set(files)):
+        parsed = files[path]
+        references = [(name, r['line'], 'import') for r in parsed['imports'] for name in r['names']]
+        references += [(r['name'], r['line'], 'call') for r in parsed['calls']]
+        found.append((path, references))
+    others = sorted(candidates - set(files))
+    if chased and others:
+        names_re = re.compile(r'\b(?:' + '|'.join(re.escape(name) for name in sorted(chased)) + r')\b')
+        found += _iter_references(iter_sources(repo_dir, others, commit), chased, names_re, workers)
+    found.sort(key=lambda item: item[0])
+
+    for path, references in found:
+        used = set()
+        for name, line, kind in references:
+            if name in chased and len(symbols[name]['references']) < MAX_REFERENCES_PER_SYMBOL:
+                symbols[name]['references'].append([path, line, kind])
+                used.add(name)
+        if used and path not in files:
+            dependents[path] = sorted(used)
+
+    index = {
+        'version': INDEX_VERSION,
+        'head_sha': head_sha,
+        'files': files,
+        'symbols': symbols,
+        'dependents': dependents
+    }
+    index_path = workspace_dir / INDEX_NAME
+    tmp_path = index_path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, separators=(',', ':'))
+    os.replace(tmp_path, index_path)
+
+    print(f"  ✅ Symbol index: {len(symbols)} symbols in {len(files)} changed files, "
+          f"{len(dependents)} dependent files ({time.time() - start_time:.1f}s)")
+    return index
+
+
+class SymbolIndex:
+    """Lookups over a workspace's symbol_index.json."""
+
+    def __init__(self, index):
+        self.index = index
+
+    @classmethod
+    def load(cls, workspace_dir):
+        index_path = Path(workspace_dir) / INDEX_NAME
+        if not index_path.exists():
+            raise Exception(f"No {INDEX_NAME} in {workspace_dir}")
+        with open(index_path) as f:
+            index = json.load(f)
+        if index.get('version') != INDEX_VERSION:
+            raise Exception(f"Unsupported symbol index version in {index_path}")
+        return cls(index)
+
+    def definitions(self, name):
+        """[(path, line, kind, qualname)] where `name` is defined in the changed files."""
+        return [tuple(d) for d in self.index['symbols'].get(name, {}).get('definitions', [])]
+
+    def references(self, name):
+        """[(path, line, 'import'|'call')] of files importing or calling `name`."""
+        return [tuple(r) for r in self.index['symbols'].get(name, {}).get('references', [])]
+
+    def defined_in(self, path):
+        return self.index['files'].get(path, {}).get('definitions', [])
+
+    def dependents(self):
+        """{path: [symbols it uses]} for files outside the PR that depend on changed symbols."""
+        return self.index['dependents']
+
+    def changed_symbols(self):
+        return sorted(self.index['symbols'])
+
+
+def main():
+    """Query the symbol index of a PR workspace."""
+    parser = argparse.ArgumentParser(description="Where are the PR's symbols defined and used")
+    parser.add_argument("command", choices=["where", "uses", "dependents"],
+                        help="where: definitions of a symbol; uses: its references; dependents: files using the PR")
+    parser.add_argument("workspace", help="PR workspace directory")
+    parser.add_argument("symbol", nargs='?', help="Symbol name (for where/uses)")
+
+    args = parser.parse_args()
+
+    try:
+        index = SymbolIndex.load(args.workspace)
+        if args.command == "dependents":
+            for path, names in sorted(index.dependents().items()):
+                print(f"{path}\t{', '.join(names)}")
+            return 0
+        if not args.symbol:
+            parser.error("a symbol name is required")
+        rows = index.definitions(args.symbol) if args.command == "where" else index.references(args.symbol)
+        for row in rows:
+            print(f"{row[0]}:{row[1]}\t{' '.join(str(v) for v in row[2:])}")
+        return 0 if rows else 1
+    except Exception as e:
+        print(f"❌ Symbol lookup failed: {e}")
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
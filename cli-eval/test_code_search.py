@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Regression checks for code_search.py: the query trigrams must be lowercased
+exactly like the index (ASCII only), also for non-ASCII queries, and regex
+prefilter literals must never include text a match does not contain.
+
+Usage:
+    python3 -m pytest -q test_code_search.py
+"""
+
+import subprocess
+
+from code_search import CodeSearchIndex, required_literals, string_trigrams
+
+
+def _indexed_repo(tmp_path, files):
+    repo_dir = tmp_path / "repo"
+    repo_dir.mkdir()
+    for name, text in files.items():
+        (repo_dir / name).write_text(text, encoding='utf-8')
+    subprocess.run(["git", "init", "-q"], cwd=repo_dir, check=True)
+    subprocess.run(["git", "add", "."], cwd=repo_dir, check=True)
+    index = CodeSearchIndex(tmp_path / "code_index", repo_dir)
+    index.update(workers=1)
+    return index
+
+
+def test_query_trigrams_match_index_lowercasing():
+    # bytes.lower() keeps É (0xC3 0x89) as is; str.lower() would turn it into é
+    assert string_trigrams("ÉCOLE") == string_trigrams("École")
+    assert string_trigrams("ÉCOLE") != string_trigrams("école")
+    assert all(max(gram >> 16, (gram >> 8) & 0xff, gram & 0xff) < 0x80
+               for gram in string_trigrams("école", ascii_only=True))
+
+
+def test_non_ascii_search(tmp_path):
+    index = _indexed_repo(tmp_path, {"mode.py": 'x = "ÉCOLE_MODE"\n', "other.py": "y = 1\n"})
+    try:
+        assert index.search("ÉCOLE") == [("mode.py", 1, 'x = "ÉCOLE_MODE"')]
+        assert index.search("école", ignore_case=True) == [("mode.py", 1, 'x = "ÉCOLE_MODE"')]
+        assert index.search("ÉCOLE_\\w+", regex=True) == [("mode.py", 1, 'x = "ÉCOLE_MODE"')]
+        assert index.search("école") == []
+    finally:
+        index.close()
+
+
+def test_quantifier_bodies_are_not_literals():
+    assert required_literals("x{2,3}") == []
+    assert required_literals("a{1,100}b") == []
+    assert required_literals("abcd{3}efg") == ["abc", "efg"]
+
+
+def test_regex_search_with_quantifier(tmp_path):
+    index = _indexed_repo(tmp_path, {"mod.py": "xx = 1\n"})
+    try:
+        assert index.search("xx{0,1} =", regex=True) == [("mod.py", 1, "xx = 1")]
+    finally:
+        index.close()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tree Indexer - Build PR workspace indexes straight from a repository's object store.
+
+For every <workspace>=<rev> job this script:
+1. Resolves the PR head in the repository (typically the shared bare mirror)
+2. Updates <workspace>/code_index from the commit's tree, streaming blobs through one
+   `git cat-file --batch` process into a pool of parsing workers
+3. Updates <workspace>/related_index (BM25 related-file retrieval) the same way
+4. Rebuilds <workspace>/symbol_index.json the same way when the workspace has the
+   PR's changed-files list (pr_N_files.json)
+5. Writes <workspace>/call_graph.json/.md when it also has pr_N_info.json, caching
+   file summaries in the repository so later PRs only parse new blobs
+
+Nothing is checked out. Jobs for several PR heads of one repository run in
+parallel, each with its own cat-file process, sharing the CPU workers.
+
+Usage:
+    python3 tree_indexer.py ~/.cache/iflow-pr-benchmark/mirrors/apache/airflow.git \\
+        pr_workspace_58365=58365 pr_workspace_58400=refs/pull/58400/head
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from call_graph import build_call_graph
+from code_search import INDEX_DIR_NAME as CODE_INDEX_DIR_NAME, CodeSearchIndex
+from git_blobs import resolve_commit
+from related_files import INDEX_DIR_NAME as RELATED_INDEX_DIR_NAME, RelatedFilesIndex
+from symbol_index import build_symbol_index
+
+
+def parse_job(spec):
+    """'<workspace>=<rev>' -> (workspace, rev); a bare PR number means refs/pull/N/head."""
+    if '=' not in spec:
+        raise Exception(f"Expected <workspace>=<rev>, got {spec!r}")
+    workspace, rev = spec.rsplit('=', 1)
+    if rev.isdigit():
+        rev = f"refs/pull/{rev}/head"
+    return Path(workspace), rev
+
+
+def load_changed_paths(workspace_dir):
+    """Changed, non-removed paths from the workspace's pr_N_files.json (None if absent)."""
+    files_lists = sorted(Path(workspace_dir).glob("pr_*_files.json"))
+    if len(files_lists) != 1:
+        return None
+    with open(files_lists[0]) as f:
+        return [entry['filename'] for entry in json.load(f) if entry.get('status') != 'removed']
+
+
+def load_pr_files(workspace_dir):
+    """(pr_info, changed files) from the workspace's pr_N_info.json and pr_N_files.json, or None."""
+    info_files = sorted(Path(workspace_dir).glob("pr_*_info.json"))
+    if len(info_files) != 1:
+        return None
+    with open(info_files[0]) as f:
+        pr_info = json.load(f)
+    files_list = Path(workspace_dir) / f"pr_{pr_info['pr_number']}_files.json"
+    if not files_list.exists():
+        return None
+    with open(files_list) as f:
+        return pr_info, json.load(f)
+
+
+def index_pr_head(git_dir, workspace_dir, rev, workers=None):
+    """Index one PR head into a workspace from the object store. Returns the commit SHA."""
+    start_time = time.time()
+    workspace_dir = Path(workspace_dir)
+    commit = resolve_commit(git_dir, rev)
+    workspace_dir.mkdir(parents=True, exist_ok=True)
+    print(f"🌳 Indexing {rev} ({commit[:12]}) into {workspace_dir}")
+
+    index = CodeSearchIndex(workspace_dir / CODE_INDEX_DIR_NAME, git_dir).update(workers=workers, commit=commit)
+    index.close()
+    index = RelatedFilesIndex(workspace_dir / RELATED_INDEX_DIR_NAME, git_dir).update(workers=workers, commit=commit)
+    index.close()
+
+    changed_paths = load_changed_paths(workspace_dir)
+    if changed_paths is None:
+        print(f"  ⚠️  No changed-files list in {workspace_dir}, skipping the symbol index")
+    else:
+        build_symbol_index(workspace_dir, git_dir, changed_paths, commit, from_tree=True, workers=workers)
+
+    pr_files = load_pr_files(workspace_dir)
+    if pr_files is not None:
+        pr_info, changed_files = pr_files
+        build_call_graph(workspace_dir, git_dir, dict(pr_info, head_sha=commit), changed_files, workers=workers)
+
+    print(f"✅ {workspace_dir} indexed in {time.time() - start_time:.1f}s")
+    return commit
+
+
+def index_pr_heads(git_dir, jobs, workers=None):
+    """Index several (workspace, rev) jobs in parallel. Returns {workspace: commit or exception}."""
+    total_workers = workers or os.cpu_count() or 1
+    # Each job has its own cat-file process; parsing workers are split between jobs
+    per_job = max(1, total_workers // max(len(jobs), 1))
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(len(jobs), total_workers) or 1) as pool:
+        futures = {pool.submit(index_pr_head, git_dir, workspace, rev, per_job): workspace
+                   for workspace, rev in jobs}
+        for future, workspace in futures.items():
+            try:
+                results[workspace] = future.result()
+            except Exception as e:
+                print(f"❌ Indexing {workspace} failed: {e}")
+                results[workspace] = e
+    return results
+
+
+def main():
+    """Index PR heads from a mirror without checking them out."""
+    parser = argparse.ArgumentParser(description="Build workspace indexes from a repository's objects")
+    parser.add_argument("git_dir", help="Repository or bare mirror holding the PR heads")
+    parser.add_argument("jobs", nargs='+', metavar="WORKSPACE=REV",
+                        help="Workspace directory and commit/ref to index (a number means that PR's head)")
+    parser.add_argument("--workers", type=int, help="Parsing processes shared by all jobs (default: CPU count)")
+
+    args = parser.parse_args()
+
+    try:
+        jobs = [parse_job(spec) for spec in args.jobs]
+    except Exception as e:
+        print(f"❌ {e}")
+        return 1
+
+    start_time = time.time()
+    results = index_pr_heads(Path(args.git_dir).resolve(), jobs, workers=args.workers)
+    failed = [workspace for workspace, result in results.items() if isinstance(result, Exception)]
+    print(f"\n📊 Indexed {len(results) - len(failed)}/{len(results)} PR heads in {time.time() - start_time:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
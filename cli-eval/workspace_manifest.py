@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Workspace Manifest - Record what a prepared PR workspace contains.
+
+The fetcher writes workspace_manifest.json as its last step:
+1. PR head/base SHAs and the options that shape the artifacts
+2. Size, mtime and SHA-256 of every generated artifact
+3. Tool versions (Python, git)
+
+Readiness checks compare the manifest against the workspace with stat calls and
+a read of the repository's HEAD, without running git or touching the network,
+and report which stages (checkout, diff, context) are still valid.
+
+Usage:
+    python3 workspace_manifest.py pr_workspace_apache
+    python3 workspace_manifest.py pr_workspace_apache --verify   # also re-hash artifacts
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+MANIFEST_NAME = "workspace_manifest.json"
+MANIFEST_VERSION = 1
+
+# Artifacts each stage produces ({pr} is replaced by the PR number)
+STAGE_ARTIFACTS = {
+    'checkout': ["pr_{pr}_info.json"],
+    'diff': ["pr_{pr}.diff", "pr_{pr}.diff.gz", "pr_{pr}.diff.idx.json", "pr_{pr}_files.json",
+             "pr_{pr}_files.jsonl"],
+    'context': ["code_index/index.json", "related_index/index.json", "symbol_index.json", "call_graph.json",
+                "context_pack/TOC.md", "pr_{pr}_context.md", "ground_truth_questions.md"]
+}
+STAGES = ['checkout', 'diff', 'context']
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def tool_versions():
+    """Versions of the tools that produced the workspace."""
+    try:
+        git_version = subprocess.run(["git", "--version"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        git_version = None
+    return {'python': platform.python_version(), 'git': git_version, 'manifest': MANIFEST_VERSION}
+
+
+def _git_dirs(repo_dir):
+    """(git dir, common dir) of a clone or worktree, read from the filesystem."""
+    dot_git = Path(repo_dir) / ".git"
+    if dot_git.is_file():
+        # Worktrees (and some clones) point at their git dir through a "gitdir:" file
+        git_dir = Path(dot_git.read_text().split(':', 1)[1].strip())
+        if not git_dir.is_absolute():
+            git_dir = (Path(repo_dir) / git_dir).resolve()
+    else:
+        git_dir = dot_git
+    common_dir = git_dir
+    commondir_file = git_dir / "commondir"
+    if commondir_file.exists():
+        common_dir = (git_dir / commondir_file.read_text().strip()).resolve()
+    return git_dir, common_dir
+
+
+def read_head_sha(repo_dir):
+    """Resolve HEAD of a repository by reading git's files directly (None if unresolvable)."""
+    try:
+        git_dir, common_dir = _git_dirs(repo_dir)
+        head = (git_dir / "HEAD").read_text().strip()
+        if not head.startswith('ref: '):
+            return head
+        ref = head[len('ref: '):]
+        for base in (git_dir, common_dir):
+            ref_file = base / ref
+            if ref_file.exists():
+                return ref_file.read_text().strip()
+        packed = common_dir / "packed-refs"
+        if packed.exists():
+            with open(packed) as f:
+                for line in f:
+                    if line.rstrip('\n').endswith(' ' + ref):
+                        return line.split(' ', 1)[0]
+    except OSError:
+        pass
+    return None
+
+
+def write_manifest(output_dir, pr_info, repo_dir, options=None):
+    """Write workspace_manifest.json for a fully prepared workspace."""
+    output_dir = Path(output_dir)
+    pr_number = pr_info['pr_number']
+    artifacts = {}
+    for stage in STAGES:
+        for pattern in STAGE_ARTIFACTS[stage]:
+            name = pattern.format(pr=pr_number)
+            path = output_dir / name
+            if path.exists():
+                stat = path.stat()
+                artifacts[name] = {
+                    'stage': stage,
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'sha256': sha256_file(path)
+                }
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'repo': f"{pr_info.get('owner')}/{pr_info.get('repo')}",
+        'pr_number': pr_number,
+        'head_sha': pr_info['head_sha'],
+        'base_sha': pr_info['base_sha'],
+        'repo_dir': os.path.relpath(repo_dir, output_dir),
+        'options': options or {},
+        'tools': tool_versions(),
+        'artifacts': artifacts
+    }
+
+    manifest_path = output_dir / MANIFEST_NAME
+    tmp_path = manifest_path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return manifest_path
+
+
+def load_manifest(output_dir):
+    try:
+        with open(Path(output_dir) / MANIFEST_NAME) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def check_workspace(output_dir, options=None, verify_hashes=False):
+    """Check a workspace against its manifest.
+
+    Returns {'ready', 'stages': {stage: bool}, 'problems': [...], 'manifest', 'seconds'}.
+    A stage is valid only if every earlier stage is valid too.
+    """
+    start_time = time.perf_counter()
+    output_dir = Path(output_dir)
+    manifest = load_manifest(output_dir)
+    status = {'ready': False, 'stages': {stage: False for stage in STAGES}, 'problems': [], 'manifest': manifest}
+
+    if manifest is None:
+        status['problems'].append("no manifest")
+    else:
+        stage_ok = {stage: True for stage in STAGES}
+
+        head_sha = read_head_sha(output_dir / manifest['repo_dir'])
+        if head_sha != manifest['head_sha']:
+            stage_ok['checkout'] = False
+            status['problems'].append(f"repository HEAD is {head_sha}, expected {manifest['head_sha']}")
+
+        if options is not None and options != manifest.get('options'):
+            stage_ok['diff'] = False
+            status['problems'].append("fetch options changed")
+
+        for name, record in manifest['artifacts'].items():
+            path = output_dir / name
+            try:
+                stat = path.stat()
+            except OSError:
+                stage_ok[record['stage']] = False
+                status['problems'].append(f"{name} is missing")
+                continue
+            if stat.st_size != record['size'] or (
+                    stat.st_mtime_ns != record['mtime_ns'] and not verify_hashes):
+                stage_ok[record['stage']] = False
+                status['problems'].append(f"{name} changed")
+            elif verify_hashes and sha256_file(path) != record['sha256']:
+                stage_ok[record['stage']] = False
+                status['problems'].append(f"{name} content changed")
+
+        valid = True
+        for stage in STAGES:
+            valid = valid and stage_ok[stage]
+            status['stages'][stage] = valid
+        status['ready'] = valid
+
+    status['seconds'] = time.perf_counter() - start_time
+    return status
+
+
+def main():
+    """Check whether a PR workspace is still fully prepared."""
+    parser = argparse.ArgumentParser(description="Check a PR workspace against its manifest")
+    parser.add_argument("workspace", help="PR workspace directory")
+    parser.add_argument("--verify", action="store_true",
+                        help="Re-hash artifacts instead of trusting size and mtime")
+
+    args = parser.parse_args()
+
+    status = check_workspace(args.workspace, verify_hashes=args.verify)
+    for stage in STAGES:
+        print(f"{'✅' if status['stages'][stage] else '❌'} {stage}")
+    for problem in status['problems']:
+        print(f"  ⚠️  {problem}")
+    print(f"⏱️  Checked in {status['seconds'] * 1000:.1f} ms")
+    return 0 if status['ready'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
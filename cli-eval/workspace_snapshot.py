@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Workspace Snapshot - Export a prepared PR workspace and restore it elsewhere.
+
+A snapshot is a plain tar holding:
+1. snapshot.json - PR/SHA metadata, the shallow boundary and the member layout
+2. repo.bundle.NNNN.zst - a git bundle of the PR head (plus base), in fixed-size chunks
+3. artifacts/*.zst - the workspace files (pr_N_* artifacts, manifest, questions, ...)
+
+Every member is an independent zstd frame, so export compresses and import
+decompresses them in parallel (one zstd process per member). Import needs no
+network: the repository is rebuilt from the bundle and artifact mtimes are
+restored, so workspace_manifest.json recognizes the workspace as prepared.
+
+Usage:
+    python3 workspace_snapshot.py export pr_workspace_apache apache_58365.snapshot.tar
+    python3 workspace_snapshot.py import apache_58365.snapshot.tar pr_workspace_apache
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from workspace_manifest import MANIFEST_NAME, load_manifest
+
+SNAPSHOT_VERSION = 1
+BUNDLE_CHUNK_SIZE = 32 * 1024 * 1024
+DEFAULT_LEVEL = 10
+SNAPSHOT_BASE_REF = "refs/snapshot/base"
+# Never shipped: logs and leftovers of interrupted writes
+EXCLUDED_SUFFIXES = ('.part', '.tmp', '.log')
+# Workspace subdirectories holding fetch-time indexes and extracts, shipped alongside the top-level artifacts
+INDEX_DIRS = ('code_index', 'related_index', 'context_pack')
+
+
+def require_zstd():
+    if not shutil.which("zstd"):
+        raise Exception("zstd is required for workspace snapshots (install the zstd package)")
+
+
+def _git(args, cwd):
+    return subprocess.run(["git"] + args, cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def _compress(data, level):
+    result = subprocess.run(["zstd", "-q", "-c", f"-{level}"], input=data, capture_output=True, check=True)
+    return result.stdout
+
+
+def _decompress_to(src_path, dest_path, offset):
+    """Decompress one member into dest_path at `offset` (the file must already exist)."""
+    process = subprocess.Popen(["zstd", "-q", "-d", "-c", str(src_path)], stdout=subprocess.PIPE)
+    fd = os.open(dest_path, os.O_WRONLY)
+    try:
+        position = offset
+        for chunk in iter(lambda: process.stdout.read(1024 * 1024), b''):
+            os.pwrite(fd, chunk, position)
+            position += len(chunk)
+    finally:
+        os.close(fd)
+        process.stdout.close()
+        if process.wait() != 0:
+            raise Exception(f"zstd failed to decompress {src_path}")
+    return position - offset
+
+
+def _workspace_files(workspace_dir):
+    """Top-level files and index directory files, as (relative name, path)."""
+    workspace_dir = Path(workspace_dir)
+    paths = [p for p in workspace_dir.iterdir() if p.is_file()]
+    for index_dir in INDEX_DIRS:
+        if (workspace_dir / index_dir).is_dir():
+            paths.extend(p for p in (workspace_dir / index_dir).rglob('*') if p.is_file())
+    for path in sorted(paths):
+        if not path.name.endswith(EXCLUDED_SUFFIXES):
+            yield path.relative_to(workspace_dir).as_posix(), path
+
+
+def create_bundle(repo_dir, manifest, bundle_path):
+    """Bundle the PR head (and base commit) of a workspace repository."""
+    if is_partial_clone(repo_dir):
+        raise Exception("Cannot snapshot a blobless partial clone (blobs are missing); "
+                        "prepare the workspace without --sparse or with --mirror-cache")
+    if _git(["status", "--porcelain", "--untracked-files=no"], repo_dir):
+        print("⚠️  Repository has uncommitted changes; the snapshot contains the committed PR head only")
+
+    head_ref = f"refs/heads/pr-{manifest['pr_number']}"
+    refs = ["HEAD", SNAPSHOT_BASE_REF]
+    if subprocess.run(["git", "show-ref", "--verify", "--quiet", head_ref], cwd=repo_dir).returncode == 0:
+        refs.append(head_ref)
+
+    # Bundles need refs; pin the base commit so the merge base travels with the head
+    _git(["update-ref", SNAPSHOT_BASE_REF, manifest['base_sha']], repo_dir)
+    try:
+        _git(["bundle", "create", str(bundle_path)] + refs, repo_dir)
+    finally:
+        _git(["update-ref", "-d", SNAPSHOT_BASE_REF], repo_dir)
+
+    # A bundle of a shallow clone is only usable with the same shallow boundary
+    git_dir = Path(_git(["rev-parse", "--absolute-git-dir"], repo_dir))
+    shallow_file = git_dir / "shallow"
+    return shallow_file.read_text().split() if shallow_file.exists() else []
+
+
+def is_partial_clone(repo_dir):
+    return subprocess.run(["git", "config", "--get", "extensions.partialClone"], cwd=repo_dir,
+                          capture_output=True).returncode == 0
+
+
+def export_snapshot(workspace_dir, snapshot_path, level=DEFAULT_LEVEL, workers=None):
+    """Write a prepared workspace to a snapshot tar. Returns the snapshot path."""
+    require_zstd()
+    start_time = time.time()
+    workspace_dir = Path(workspace_dir)
+    snapshot_path = Path(snapshot_path).resolve()
+    manifest = load_manifest(workspace_dir)
+    if manifest is None:
+        raise Exception(f"{workspace_dir} has no {MANIFEST_NAME}; prepare the workspace first")
+    repo_dir = workspace_dir / manifest['repo_dir']
+    workers = workers or os.cpu_count() or 4
+
+    print(f"📦 Exporting snapshot of {manifest['repo']} PR #{manifest['pr_number']} "
+          f"({manifest['head_sha'][:10]})...")
+
+    with tempfile.TemporaryDirectory(dir=snapshot_path.parent) as staging:
+        bundle_path = Path(staging) / "repo.bundle"
+        print("  🔧 Bundling repository at the PR head...")
+        shallow = create_bundle(repo_dir, manifest, bundle_path)
+
+        # (member name, reader of the uncompressed bytes)
+        jobs = []
+        bundle_size = bundle_path.stat().st_size
+        for index, offset in enumerate(range(0, max(bundle_size, 1), BUNDLE_CHUNK_SIZE)):
+            def read_slice(offset=offset):
+                with open(bundle_path, 'rb') as f:
+                    f.seek(offset)
+                    return f.read(BUNDLE_CHUNK_SIZE)
+            jobs.append((f"repo.bundle.{index:04d}.zst", read_slice))
+
+        artifacts = []
+        for name, path in _workspace_files(workspace_dir):
+            stat = path.stat()
+            artifacts.append({'name': name, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+            jobs.append((f"artifacts/{name}.zst", path.read_bytes))
+
+        metadata = {
+            'version': SNAPSHOT_VERSION,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'repo': manifest['repo'],
+            'pr_number': manifest['pr_number'],
+            'head_sha': manifest['head_sha'],
+            'base_sha': manifest['base_sha'],
+            'repo_dir': manifest['repo_dir'],
+            'shallow': shallow,
+            'bundle': {'size': bundle_size, 'chunk_size': BUNDLE_CHUNK_SIZE,
+                       'chunks': [name for name, _ in jobs if name.startswith('repo.bundle.')]},
+            'artifacts': artifacts
+        }
+
+        print(f"  🗜️  Compressing {len(jobs)} members with {workers} workers (zstd -{level})...")
+        tmp_path = snapshot_path.with_name(snapshot_path.name + '.tmp')
+        with ThreadPoolExecutor(max_workers=workers) as pool, tarfile.open(tmp_path, 'w') as tar:
+            _add_bytes(tar, "snapshot.json", json.dumps(metadata, indent=2).encode())
+            # Members are appended in order; at most 2x workers compressed chunks wait in memory
+            window = []
+            for name, read in jobs:
+                window.append((name, pool.submit(lambda read=read: _compress(read(), level))))
+                if len(window) >= workers * 2:
+                    done_name, future = window.pop(0)
+                    _add_bytes(tar, done_name, future.result())
+            for done_name, future in window:
+                _add_bytes(tar, done_name, future.result())
+        os.replace(tmp_path, snapshot_path)
+
+    size = snapshot_path.stat().st_size
+    print(f"✅ Snapshot saved to {snapshot_path} ({size / 1024 / 1024:.1f} MB, "
+          f"{time.time() - start_time:.1f}s)")
+    return snapshot_path
+
+
+def _add_bytes(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+
+
+def read_snapshot_metadata(snapshot_path):
+    with tarfile.open(snapshot_path, 'r') as tar:
+        member = tar.extractfile("snapshot.json")
+        metadata = json.load(member)
+    if metadata.get('version') != SNAPSHOT_VERSION:
+        raise Exception(f"Unsupported snapshot version {metadata.get('version')} in {snapshot_path}")
+    return metadata
+
+
+def import_snapshot(snapshot_path, workspace_dir, workers=None):
+    """Restore a workspace from a snapshot without network access. Returns the snapshot metadata."""
+    require_zstd()
+    start_time = time.time()
+    workspace_dir = Path(workspace_dir).resolve()
+    workspace_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 4
+
+    metadata = read_snapshot_metadata(snapshot_path)
+    with tarfile.open(snapshot_path, 'r') as tar:
+        repo_dir = workspace_dir / metadata['repo_dir']
+        if repo_dir.exists():
+            raise Exception(f"{repo_dir} already exists; import into an empty workspace directory")
+
+        print(f"📦 Importing snapshot of {metadata['repo']} PR #{metadata['pr_number']} "
+              f"({metadata['head_sha'][:10]}) into {workspace_dir}...")
+
+        with tempfile.TemporaryDirectory(dir=workspace_dir) as staging:
+            staging = Path(staging)
+            # The outer tar is uncompressed: extraction is a sequential copy
+            members = [m for m in tar.getmembers() if m.isfile() and m.name != "snapshot.json"]
+            for member in members:
+                if member.name.startswith('/') or '..' in Path(member.name).parts:
+                    raise Exception(f"Unsafe path in snapshot: {member.name}")
+            tar.extractall(staging, members=members)
+
+            bundle_path = staging / "repo.bundle"
+            bundle_path.write_bytes(b'')
+            os.truncate(bundle_path, metadata['bundle']['size'])
+            artifacts_dir = staging / "restored"
+            artifacts_dir.mkdir()
+
+            jobs = []
+            chunk_size = metadata['bundle']['chunk_size']
+            for index, name in enumerate(metadata['bundle']['chunks']):
+                jobs.append((staging / name, bundle_path, index * chunk_size))
+            for artifact in metadata['artifacts']:
+                dest = artifacts_dir / artifact['name']
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                dest.write_bytes(b'')
+                jobs.append((staging / "artifacts" / f"{artifact['name']}.zst", dest, 0))
+
+            print(f"  🗜️  Decompressing {len(jobs)} members with {workers} workers...")
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for _ in pool.map(lambda job: _decompress_to(*job), jobs):
+                    pass
+
+            print("  🔧 Restoring repository from bundle...")
+            try:
+                restore_repository(repo_dir, bundle_path, metadata)
+            except Exception:
+                shutil.rmtree(repo_dir, ignore_errors=True)
+                raise
+
+            for artifact in metadata['artifacts']:
+                dest = workspace_dir / artifact['name']
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(artifacts_dir / artifact['name'], dest)
+                # Original mtimes keep the workspace manifest's stat checks valid
+                os.utime(dest, ns=(artifact['mtime_ns'], artifact['mtime_ns']))
+
+    print(f"✅ Workspace restored in {time.time() - start_time:.1f}s")
+    return metadata
+
+
+def restore_repository(repo_dir, bundle_path, metadata):
+    """Create the workspace repository from a snapshot bundle and check out the PR head."""
+    repo_dir.mkdir(parents=True)
+    _git(["init", "-q"], repo_dir)
+    if metadata['shallow']:
+        # Declare the shallow boundary first so the bundle's history passes connectivity checks
+        git_dir = Path(_git(["rev-parse", "--absolute-git-dir"], repo_dir))
+        (git_dir / "shallow").write_text('\n'.join(metadata['shallow']) + '\n')
+    # The base ref stays so the merge base is never garbage-collected
+    _git(["fetch", "-q", str(bundle_path), "refs/heads/*:refs/heads/*", f"{SNAPSHOT_BASE_REF}:{SNAPSHOT_BASE_REF}"],
+         repo_dir)
+
+    branch = f"pr-{metadata['pr_number']}"
+    if subprocess.run(["git", "show-ref", "--verify", "--quiet", f"refs/heads/{branch}"],
+                      cwd=repo_dir).returncode != 0:
+        _git(["branch", branch, metadata['head_sha']], repo_dir)
+    _git(["checkout", "-q", branch], repo_dir)
+
+    # Same remote layout as a regular clone, for later online runs
+    _git(["remote", "add", "origin", f"https://github.com/{metadata['repo']}.git"], repo_dir)
+
+
+def main():
+    """Export or import PR workspace snapshots."""
+    parser = argparse.ArgumentParser(description="Export/import compressed PR workspace snapshots")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Write a prepared workspace to a snapshot")
+    export_parser.add_argument("workspace", help="Prepared PR workspace directory")
+    export_parser.add_argument("snapshot", help="Snapshot file to write (.snapshot.tar)")
+    export_parser.add_argument("--level", type=int, default=DEFAULT_LEVEL, help="zstd compression level")
+    export_parser.add_argument("--workers", type=int, help="Parallel zstd processes (default: CPU count)")
+
+    import_parser = subparsers.add_parser("import", help="Restore a workspace from a snapshot")
+    import_parser.add_argument("snapshot", help="Snapshot file to read")
+    import_parser.add_argument("workspace", help="Workspace directory to restore into")
+    import_parser.add_argument("--workers", type=int, help="Parallel zstd processes (default: CPU count)")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            export_snapshot(args.workspace, args.snapshot, level=args.level, workers=args.workers)
+        else:
+            metadata = import_snapshot(args.snapshot, args.workspace, workers=args.workers)
+            print(f"🚀 Next step: python3 enhanced_pr_fetcher.py --repo {metadata['repo']} --pr {metadata['pr_number']} "
+                  f"--output-dir {args.workspace} --offline  (recognized as prepared, nothing is fetched)")
+        return 0
+    except Exception as e:
+        print(f"❌ Snapshot {args.command} failed: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())